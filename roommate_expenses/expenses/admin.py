@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Group, UserProfile, Expense, ExpenseShare
+from .models import Group, UserProfile, Expense, ExpenseShare, MemberBalance
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -21,3 +21,10 @@ class ExpenseShareAdmin(admin.ModelAdmin):
     list_display = ['expense', 'user', 'amount', 'is_paid', 'paid_at']
     list_filter = ['is_paid', 'expense__group']
     search_fields = ['expense__title', 'user__username']
+
+@admin.register(MemberBalance)
+class MemberBalanceAdmin(admin.ModelAdmin):
+    list_display = ['group', 'user', 'balance', 'updated_at']
+    list_filter = ['group']
+    search_fields = ['user__username']
+    readonly_fields = ['group', 'user', 'balance', 'updated_at']
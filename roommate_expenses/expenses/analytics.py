@@ -0,0 +1,108 @@
+# expenses/analytics.py
+"""
+Spending trends of a group for the analytics page and its JSON endpoint.
+
+Everything comes from one query on the weekly or monthly rollups (see
+rollups.py), which the expense write paths keep up to date, so the cost of
+a page doesn't grow with the number of expenses. Series are chart-ready:
+one value per period, oldest first, with empty periods as zeros.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+
+from . import rollups
+from .ledger import to_cents
+from .models import MonthlyRollup, WeeklyRollup
+
+INTERVALS = {'week': (WeeklyRollup, 'week'), 'month': (MonthlyRollup, 'month')}
+MAX_PERIODS = 104
+
+
+def parse_params(params):
+    """
+    (interval, number of periods) from ``interval=week|month`` and
+    ``periods=N`` parameters; raises ValueError for bad values
+    """
+    interval = params.get('interval') or 'month'
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown interval '{interval}'")
+    count = int(params.get('periods') or settings.ANALYTICS_PERIODS)
+    if not 1 <= count <= MAX_PERIODS:
+        raise ValueError(f'periods must be between 1 and {MAX_PERIODS}')
+    return interval, count
+
+
+def period_starts(interval, count, today=None):
+    """First days of the last ``count`` weeks or months, up to the current one"""
+    today = today or date.today()
+    if interval == 'week':
+        current = rollups.week_start(today)
+        return [current - timedelta(weeks=i) for i in range(count - 1, -1, -1)]
+    months = [rollups.month_start(today)]
+    while len(months) < count:
+        first = months[0]
+        months.insert(0, date(first.year - (first.month == 1), (first.month - 2) % 12 + 1, 1))
+    return months
+
+
+def _average(total, count):
+    return to_cents(total / count) if count else Decimal('0.00')
+
+
+def spending(group, interval='month', count=12, today=None):
+    """
+    Totals paid, expense counts and average expense per period for the group
+    and per member, and the members ranked by what they paid over the whole range
+    """
+    model, period_field = INTERVALS[interval]
+    periods = period_starts(interval, count, today)
+    index = {period: i for i, period in enumerate(periods)}
+
+    def series(zero):
+        return [zero] * len(periods)
+
+    total_paid, expense_count = series(Decimal('0.00')), series(0)
+    members = {}
+    rows = model.objects.filter(
+        group=group, **{f'{period_field}__gte': periods[0], f'{period_field}__lte': periods[-1]}
+    ).values_list(period_field, 'user__username', 'total_paid', 'total_share', 'expense_count')
+    for period, username, paid, share, paid_count in rows:
+        i = index[period]
+        member = members.setdefault(username, {
+            'username': username,
+            'total_paid': series(Decimal('0.00')),
+            'total_share': series(Decimal('0.00')),
+            'expense_count': series(0),
+        })
+        member['total_paid'][i] = paid
+        member['total_share'][i] = share
+        member['expense_count'][i] = paid_count
+        total_paid[i] += paid
+        expense_count[i] += paid_count
+
+    top_payers = []
+    for member in members.values():
+        paid, paid_count = sum(member['total_paid']), sum(member['expense_count'])
+        top_payers.append({
+            'username': member['username'],
+            'total_paid': paid,
+            'total_share': sum(member['total_share']),
+            'expense_count': paid_count,
+            'average_expense': _average(paid, paid_count),
+        })
+    top_payers.sort(key=lambda payer: (-payer['total_paid'], payer['username']))
+
+    return {
+        'interval': interval,
+        'periods': periods,
+        'total_paid': total_paid,
+        'expense_count': expense_count,
+        'average_expense': [_average(paid, paid_count) for paid, paid_count in zip(total_paid, expense_count)],
+        'members': sorted(members.values(), key=lambda member: member['username']),
+        'top_payers': top_payers,
+        'total': sum(total_paid),
+        'count': sum(expense_count),
+        'average': _average(sum(total_paid), sum(expense_count)),
+    }
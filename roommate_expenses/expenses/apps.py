@@ -6,4 +6,6 @@ class ExpensesConfig(AppConfig):
     name = 'expenses'
     
     def ready(self):
-        import expenses.signals
\ No newline at end of file
+        import expenses.signals
+        # Records queries for QueryTimingMiddleware on every connection opened from now on
+        import expenses.middleware
@@ -0,0 +1,177 @@
+# expenses/async_views.py
+"""
+Async variants of the busiest views, routed instead of the sync ones when
+ASYNC_VIEWS is enabled and the site is served through ASGI.
+
+Independent queries are awaited together with asyncio.gather so the event
+loop can serve other requests while a view waits on the database.
+"""
+import asyncio
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.utils import timezone
+
+from . import events
+from .dashboard import aget_dashboard_data
+from .membership import ais_member
+from .selection import remember_selected_group, selected_group_id
+from .models import UserProfile, Expense, ExpenseShare
+
+
+def async_login_required(view):
+    """login_required for async views (Django 4.2's decorator is sync only)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Resolving the lazy request.user reads the session and user tables
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+@async_login_required
+async def dashboard(request):
+    user_groups, (user_profile, created) = await asyncio.gather(
+        _alist(request.user.joined_groups.annotate(member_count=Count('members')).order_by('id')),
+        UserProfile.objects.aget_or_create(user=request.user),
+    )
+
+    # Get selected group from query parameter or session (loading the session queries the database)
+    group_id = await sync_to_async(selected_group_id)(request)
+    selected_group = None
+
+    if group_id:
+        selected_group = next((g for g in user_groups if str(g.id) == str(group_id)), None)
+
+    # If no group selected, use first group or show empty state
+    if not selected_group and user_groups:
+        selected_group = user_groups[0]
+
+    if selected_group:
+        # Only saves the session when the selection changed
+        remember_selected_group(request, selected_group.id)
+
+    context = {
+        'user_profile': user_profile,
+        'all_groups': user_groups,
+        'selected_group': selected_group,
+        'expenses': [],
+        'next_cursor': None,
+        'member_balances': {},
+        'debts': [],
+    }
+
+    if selected_group:
+        context.update(await aget_dashboard_data(selected_group))
+
+    return await sync_to_async(render)(request, 'expenses/dashboard.html', context)
+
+
+@async_login_required
+async def expense_detail(request, pk):
+    try:
+        expense = await Expense.objects.select_related('paid_by', 'group').aget(pk=pk)
+    except Expense.DoesNotExist:
+        raise Http404('No Expense matches the given query.')
+
+    # Membership and shares don't depend on each other
+    is_member, expense_shares = await asyncio.gather(
+        ais_member(request, expense.group),
+        _alist(expense.shares.select_related('user')),
+    )
+    if not is_member:
+        messages.error(request, "You don't have permission to view this expense.")
+        return redirect('dashboard')
+
+    context = {
+        'expense': expense,
+        'expense_shares': expense_shares,
+        'is_creator': expense.paid_by == request.user
+    }
+    return await sync_to_async(render)(request, 'expenses/expense_detail.html', context)
+
+
+@async_login_required
+async def toggle_payment_status(request, share_id):
+    """Toggle payment status for an expense share"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        share = await ExpenseShare.objects.select_related('expense__group', 'user').aget(pk=share_id)
+    except ExpenseShare.DoesNotExist:
+        raise Http404('No ExpenseShare matches the given query.')
+
+    try:
+        # Ensure the user is a member of the expense's group
+        if not await ais_member(request, share.expense.group):
+            return JsonResponse({'error': 'Permission denied'}, status=403)
+
+        # Toggle the payment status; the ledger and version signals run with the save
+        share.is_paid = not share.is_paid
+        share.paid_at = timezone.now() if share.is_paid else None
+        await share.asave()
+
+        return JsonResponse({
+            'success': True,
+            'is_paid': share.is_paid,
+            'username': share.user.username
+        })
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@async_login_required
+async def group_events(request, group_id):
+    """
+    Server-Sent Events stream of a group's live updates (see events.py).
+    The stream ends after EVENT_STREAM_MAX_AGE seconds and the browser
+    reconnects with Last-Event-ID, so no event is missed in between.
+    """
+    if not await ais_member(request, group_id):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for the whole stream; 204 tells
+        # EventSource not to reconnect
+        return HttpResponse(status=204)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    async def stream():
+        subscription = await events.subscribe(group_id, last_event_id)
+        try:
+            yield f'retry: {settings.EVENT_RETRY_MS}\n\n'
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.EVENT_STREAM_MAX_AGE
+            while (remaining := deadline - loop.time()) > 0:
+                event = await subscription.next(min(settings.EVENT_KEEPALIVE, remaining))
+                # A comment line keeps proxies from closing an idle stream
+                yield _format_event(event) if event else ': keepalive\n\n'
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,26 +1,33 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
 from django.db.models import Q
+from django.db.models.functions import Lower
 
 
 class EmailOrUsernameModelBackend(ModelBackend):
     """
-    Custom authentication backend that allows login with email or username
+    Custom authentication backend that allows login with email or username.
+    Emails match case-insensitively; the lookup is a single query using the
+    username index and the LOWER(email) index from migration 0008.
     """
     def authenticate(self, request, username=None, password=None, **kwargs):
-        try:
-            # Try to find user by email or username
-            user = User.objects.get(Q(username=username) | Q(email=username))
-            
-            # Check password
-            if user.check_password(password):
-                return user
-        except User.DoesNotExist:
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
             return None
-        except User.MultipleObjectsReturned:
-            # If multiple users with same email (shouldn't happen), return first
-            user = User.objects.filter(Q(username=username) | Q(email=username)).first()
-            if user and user.check_password(password):
-                return user
-        
+
+        candidates = list(
+            User.objects.alias(email_lower=Lower('email')).filter(
+                Q(username=username) | Q(email_lower=username.lower())
+            ).order_by('pk')[:2]
+        )
+        if not candidates:
+            # Hash anyway so a missing account takes as long as a wrong password
+            User().set_password(password)
+            return None
+
+        # An exact username match wins over another account's email
+        user = next((c for c in candidates if c.username == username), candidates[0])
+        if user.check_password(password):
+            return user
         return None
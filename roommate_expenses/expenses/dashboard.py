@@ -0,0 +1,244 @@
+# expenses/dashboard.py
+"""
+Per-group dashboard data, cached by content version.
+
+The expenses, member balances and simplified debts shown on the dashboard
+only change when the group's version is bumped (expense, share or member
+writes), so the computed payload is stored under group:<id>:v<version> in
+the 'dashboard' cache. A write simply makes the next lookup miss; stale
+versions are never read again and are evicted least-recently-used first.
+
+Only the newest DASHBOARD_PAGE_SIZE expenses are part of it. Older ones are
+fetched page by page with a keyset cursor on (created_at, id), so a page
+costs the same however long the group's history is; those pages are cached
+per version too.
+"""
+import asyncio
+import base64
+import binascii
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Expense, ExpenseShare, MemberBalance
+from .settlement import group_settlements
+
+CACHE_ALIAS = 'dashboard'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def cache_key(group):
+    return f'group:{group.pk}:v{group.version}'
+
+
+def cache_stats():
+    """Hit/miss counters of this process since start (or the last reset)"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def _share_count(**filters):
+    # A correlated count only touches the shares of the rows actually returned,
+    # unlike a join + GROUP BY over the whole group
+    shares = ExpenseShare.objects.filter(expense=OuterRef('pk'), **filters).order_by().values('expense')
+    return Coalesce(Subquery(shares.annotate(count=Count('pk')).values('count')), 0)
+
+
+def expenses_with_stats(group):
+    """The group's expenses with payment statistics annotated"""
+    return Expense.objects.filter(group=group).select_related('paid_by').annotate(
+        total_count=_share_count(),
+        paid_count=_share_count(is_paid=True),
+    )
+
+
+def encode_cursor(expense):
+    """Opaque cursor pointing just past ``expense`` in newest-first order"""
+    raw = f'{expense.created_at.isoformat()}|{expense.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of an encode_cursor() value; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+
+def _page_queryset(group, after, size):
+    expenses = expenses_with_stats(group).order_by('-created_at', '-pk')
+    if after:
+        created_at, pk = decode_cursor(after)
+        expenses = expenses.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    # One extra row tells whether there is a next page
+    return expenses[:size + 1]
+
+
+def _split_page(rows, size):
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def expense_page(group, after=None, size=None):
+    """
+    Up to ``size`` (default DASHBOARD_PAGE_SIZE) expenses, newest first,
+    following cursor ``after``, and the cursor of the next page (None on the
+    last page)
+    """
+    size = size or settings.DASHBOARD_PAGE_SIZE
+    return _split_page(list(_page_queryset(group, after, size)), size)
+
+
+async def aexpense_page(group, after=None, size=None):
+    size = size or settings.DASHBOARD_PAGE_SIZE
+    return _split_page([expense async for expense in _page_queryset(group, after, size)], size)
+
+
+def members_with_balances(group):
+    """Group members annotated with their ledger balance in a single query"""
+    ledger_balance = MemberBalance.objects.filter(
+        group=group,
+        user=OuterRef('pk')
+    ).values('balance')[:1]
+    return group.members.annotate(
+        balance=Coalesce(Subquery(ledger_balance), Value(Decimal('0.00')), output_field=models.DecimalField())
+    )
+
+
+def compute_dashboard_data(group):
+    """
+    First page of expenses with payment statistics, the next page's cursor,
+    member balances and debts for a group
+    """
+    expenses, next_cursor = expense_page(group)
+    return {
+        'expenses': expenses,
+        'next_cursor': next_cursor,
+        'member_balances': {member.username: member.balance for member in members_with_balances(group)},
+        # Net all unpaid shares into the minimal set of transfers
+        'debts': group_settlements(group),
+    }
+
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def acompute_dashboard_data(group):
+    """compute_dashboard_data() with the three independent queries awaited together"""
+    (expenses, next_cursor), members, debts = await asyncio.gather(
+        aexpense_page(group),
+        _alist(members_with_balances(group)),
+        sync_to_async(group_settlements)(group),
+    )
+    return {
+        'expenses': expenses,
+        'next_cursor': next_cursor,
+        'member_balances': {member.username: member.balance for member in members},
+        'debts': debts,
+    }
+
+
+def get_dashboard_data(group):
+    """
+    Cached compute_dashboard_data(). ``group.version`` must be current, e.g.
+    the group was loaded in this request.
+    """
+    cache = caches[CACHE_ALIAS]
+    key = cache_key(group)
+    data = cache.get(key)
+    if data is not None:
+        _count('hits')
+        return data
+
+    _count('misses')
+    data = compute_dashboard_data(group)
+    cache.set(key, data)
+    return data
+
+
+async def aget_dashboard_data(group):
+    """Async get_dashboard_data()"""
+    cache = caches[CACHE_ALIAS]
+    key = cache_key(group)
+    data = await cache.aget(key)
+    if data is not None:
+        _count('hits')
+        return data
+
+    _count('misses')
+    data = await acompute_dashboard_data(group)
+    await cache.aset(key, data)
+    return data
+
+
+def get_expense_page(group, after):
+    """Cached expense_page() for the group's current version"""
+    cache = caches[CACHE_ALIAS]
+    key = f'{cache_key(group)}:after:{after}'
+    page = cache.get(key)
+    if page is not None:
+        _count('hits')
+        return page
+
+    _count('misses')
+    page = expense_page(group, after)
+    cache.set(key, page)
+    return page
+
+
+def serialize_expense(expense):
+    """JSON-ready expense row; expects the payment statistics from expenses_with_stats()"""
+    return {
+        'id': expense.pk,
+        'title': expense.title,
+        'amount': f'{expense.amount:.2f}',
+        'paid_by': expense.paid_by.username,
+        'date': expense.date.isoformat(),
+        'split_method': expense.split_method,
+        'shares_paid': expense.paid_count,
+        'shares_total': expense.total_count,
+    }
+
+
+def serialize_balances(member_balances, debts):
+    return {
+        'balances': {username: f'{balance:.2f}' for username, balance in member_balances.items()},
+        'debts': [
+            {'from_user': debt['from_user'], 'to_user': debt['to_user'], 'amount': f"{debt['amount']:.2f}"}
+            for debt in debts
+        ],
+    }
+
+
+def serialize_dashboard(group, data):
+    """JSON-ready form of the dashboard data for API clients"""
+    return {
+        'group': {'id': group.pk, 'name': group.name, 'version': group.version},
+        'expenses': [serialize_expense(expense) for expense in data['expenses']],
+        'next_cursor': data['next_cursor'],
+        **serialize_balances(data['member_balances'], data['debts']),
+    }
@@ -0,0 +1,227 @@
+# expenses/events.py
+"""
+Live group updates for open dashboards, delivered as Server-Sent Events.
+
+Writes to a group queue a small event once their transaction commits:
+
+    share            a share was marked paid/unpaid
+    expense          an expense was added or edited
+    expense_deleted  an expense was deleted
+    settled          many shares were marked paid at once (settle up)
+
+Each event carries the changed row plus the group's balances and debts, so
+a dashboard can patch itself without reloading. Events go through a broker
+chosen by EVENT_BROKER:
+
+    local     in-process queues; enough for a single ASGI worker process
+    database  GroupEvent rows polled by every stream; works across processes
+"""
+import asyncio
+import itertools
+import threading
+from collections import defaultdict, deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .dashboard import expenses_with_stats, members_with_balances, serialize_balances, serialize_expense
+from .models import Group, GroupEvent
+from .settlement import group_settlements
+
+
+class LocalSubscription:
+    def __init__(self, broker, group_id, backlog):
+        self.broker = broker
+        self.group_id = group_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        for event in backlog:
+            self.queue.put_nowait(event)
+
+    async def next(self, timeout):
+        """The next event, or None if none arrived within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def deliver(self, event):
+        # publish() may run in any thread; the queue belongs to the stream's loop
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # The stream's event loop is gone
+            self.close()
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class LocalBroker:
+    """Fan events out to the streams open in this process"""
+
+    def __init__(self, history=100):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._subscriptions = defaultdict(set)
+        # Recent events per group, replayed to clients reconnecting with Last-Event-ID
+        self._history = defaultdict(lambda: deque(maxlen=history))
+
+    def wants(self, group_id):
+        return bool(self._subscriptions.get(group_id))
+
+    def publish(self, group_id, kind, data):
+        with self._lock:
+            event = {'id': next(self._ids), 'type': kind, 'data': data}
+            self._history[group_id].append(event)
+            subscriptions = list(self._subscriptions.get(group_id, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+        return event
+
+    async def subscribe(self, group_id, last_event_id=None):
+        with self._lock:
+            backlog = [] if last_event_id is None else [
+                event for event in self._history.get(group_id, ()) if event['id'] > last_event_id
+            ]
+            subscription = LocalSubscription(self, group_id, backlog)
+            self._subscriptions[group_id].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.group_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.group_id]
+
+
+class DatabaseSubscription:
+    def __init__(self, group_id, last_event_id, poll_interval):
+        self.group_id = group_id
+        self.last_event_id = last_event_id
+        self.poll_interval = poll_interval
+        self.pending = deque()
+
+    async def next(self, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.pending:
+            events = GroupEvent.objects.filter(group_id=self.group_id, pk__gt=self.last_event_id).order_by('pk')
+            self.pending.extend([event async for event in events[:100]])
+            if self.pending:
+                break
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_interval, remaining))
+        event = self.pending.popleft()
+        self.last_event_id = event.pk
+        return {'id': event.pk, 'type': event.kind, 'data': event.data}
+
+    def close(self):
+        pass
+
+
+class DatabaseBroker:
+    """Store events in GroupEvent; every stream polls for rows newer than it has seen"""
+
+    def __init__(self, poll_interval=1.0, retention=3600):
+        self.poll_interval = poll_interval
+        self.retention = timedelta(seconds=retention)
+
+    def wants(self, group_id):
+        # Streams in other processes can't be seen from here
+        return True
+
+    def publish(self, group_id, kind, data):
+        event = GroupEvent.objects.create(group_id=group_id, kind=kind, data=data)
+        GroupEvent.objects.filter(group_id=group_id, created_at__lt=timezone.now() - self.retention).delete()
+        return {'id': event.pk, 'type': kind, 'data': data}
+
+    async def subscribe(self, group_id, last_event_id=None):
+        if last_event_id is None:
+            # Only events from now on
+            last_event_id = await GroupEvent.objects.filter(group_id=group_id).order_by('-pk').values_list(
+                'pk', flat=True
+            ).afirst() or 0
+        return DatabaseSubscription(group_id, last_event_id, self.poll_interval)
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    name = settings.EVENT_BROKER
+    with _brokers_lock:
+        if name not in _brokers:
+            if name == 'local':
+                _brokers[name] = LocalBroker()
+            elif name == 'database':
+                _brokers[name] = DatabaseBroker(
+                    poll_interval=settings.EVENT_POLL_INTERVAL,
+                    retention=settings.EVENT_RETENTION,
+                )
+            else:
+                raise ValueError(f"Unknown EVENT_BROKER '{name}'")
+        return _brokers[name]
+
+
+def _group_balances(group_id):
+    group = Group.objects.get(pk=group_id)
+    member_balances = {member.username: member.balance for member in members_with_balances(group)}
+    return serialize_balances(member_balances, group_settlements(group))
+
+
+def _publish(group_id, kind, build):
+    broker = get_broker()
+    if not broker.wants(group_id):
+        return
+    try:
+        data = build()
+        data.update(_group_balances(group_id))
+    except Group.DoesNotExist:
+        # The whole group was deleted
+        return
+    broker.publish(group_id, kind, data)
+
+
+def notify(group_id, kind, build):
+    """Publish ``build()`` plus the group's balances once the current transaction commits"""
+    transaction.on_commit(lambda: _publish(group_id, kind, build))
+
+
+def notify_share_changed(share, group_id):
+    def build():
+        expense = expenses_with_stats(group_id).filter(pk=share.expense_id).first()
+        return {
+            'share': {'id': share.pk, 'user_id': share.user_id, 'is_paid': share.is_paid},
+            'expense': serialize_expense(expense) if expense else {'id': share.expense_id},
+        }
+    notify(group_id, 'share', build)
+
+
+def notify_expense_changed(expense_id, group_id):
+    def build():
+        expense = expenses_with_stats(group_id).filter(pk=expense_id).first()
+        return {'expense': serialize_expense(expense) if expense else {'id': expense_id}}
+    notify(group_id, 'expense', build)
+
+
+def notify_shares_settled(group_id, expense_ids):
+    def build():
+        return {'expenses': [serialize_expense(expense) for expense in expenses_with_stats(group_id).filter(pk__in=expense_ids)]}
+    notify(group_id, 'settled', build)
+
+
+def notify_expense_deleted(expense_id, group_id):
+    notify(group_id, 'expense_deleted', lambda: {'expense': {'id': expense_id}})
+
+
+async def subscribe(group_id, last_event_id=None):
+    return await get_broker().subscribe(group_id, last_event_id)
+
@@ -0,0 +1,166 @@
+# expenses/exporter.py
+"""
+Streaming export of a group's expenses or shares as CSV or JSON-lines.
+
+Rows are read with QuerySet.iterator() in chunks of EXPORT_CHUNK_SIZE (for
+expenses, the shares of each chunk are fetched in one more query) and
+encoded into pieces of about EXPORT_BUFFER_SIZE bytes as they are read, so
+memory stays flat however big the group is and the first bytes go out
+before the last rows are read. Rows are in expense date order, and the
+optional start and end dates filter on that date too.
+
+'expenses': one row per expense, in the importer's columns so an export can
+be imported into another group:
+    id, date, title, amount, paid_by, split_method, shared_among, shares
+    shared_among  usernames separated by ";"
+    shares        custom split as "alice:10.00;bob:5.50", empty for equal splits
+
+'shares': one row per member's share of an expense:
+    expense_id, date, title, paid_by, user, amount, is_paid, paid_at
+
+JSON-lines rows have the same keys; shared_among is a list and shares an
+object of {username: amount}.
+"""
+import csv
+import io
+from collections import defaultdict
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.text import get_valid_filename
+
+from .models import ExpenseShare
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/jsonl'}
+
+EXPENSE_COLUMNS = ['id', 'date', 'title', 'amount', 'paid_by', 'split_method', 'shared_among', 'shares']
+SHARE_COLUMNS = ['expense_id', 'date', 'title', 'paid_by', 'user', 'amount', 'is_paid', 'paid_at']
+
+
+def _in_date_range(queryset, prefix='', start=None, end=None):
+    """
+    Filter on the expense date between start and end (inclusive), the same
+    dates the exported date column and the period reports use
+    """
+    if start:
+        queryset = queryset.filter(**{f'{prefix}date__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{prefix}date__lte': end})
+    return queryset
+
+
+def expense_rows(group, start=None, end=None):
+    expenses = _in_date_range(group.expenses.all(), start=start, end=end).order_by('date', 'id').values_list(
+        'id', 'date', 'title', 'amount', 'paid_by__username', 'split_method',
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+    # Plain tuples rather than prefetched model instances: no per-row objects
+    # or reference cycles, so each chunk is freed as soon as it's written
+    while chunk := list(islice(expenses, settings.EXPORT_CHUNK_SIZE)):
+        shares = defaultdict(list)
+        for expense_id, username, amount in ExpenseShare.objects.filter(
+            expense_id__in=[row[0] for row in chunk]
+        ).values_list('expense_id', 'user__username', 'amount'):
+            shares[expense_id].append((username, amount))
+
+        for expense_id, day, title, amount, paid_by, split_method in chunk:
+            # Every user the expense is shared among has a share
+            expense_shares = shares[expense_id]
+            yield {
+                'id': expense_id,
+                'date': day,
+                'title': title,
+                'amount': amount,
+                'paid_by': paid_by,
+                'split_method': split_method,
+                'shared_among': [username for username, _ in expense_shares],
+                'shares': dict(expense_shares) if split_method == 'custom' else None,
+            }
+
+
+def share_rows(group, start=None, end=None):
+    shares = _in_date_range(
+        ExpenseShare.objects.filter(expense__group=group), prefix='expense__', start=start, end=end,
+    ).order_by('expense__date', 'expense_id', 'user__username').values_list(
+        'expense_id', 'expense__date', 'expense__title', 'expense__paid_by__username',
+        'user__username', 'amount', 'is_paid', 'paid_at',
+    )
+    for values in shares.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield dict(zip(SHARE_COLUMNS, values))
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return ';'.join(value)
+    if isinstance(value, dict):
+        return ';'.join(f'{name}:{amount}' for name, amount in value.items())
+    if value is None:
+        return ''
+    return value
+
+
+def encode(rows, fmt, columns):
+    """Yield the rows encoded as ``fmt``, in UTF-8 pieces of about EXPORT_BUFFER_SIZE bytes"""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+
+        def write(row):
+            writer.writerow([_csv_value(row[column]) for column in columns])
+    elif fmt == 'jsonl':
+        encoder = DjangoJSONEncoder()
+
+        def write(row):
+            buffer.write(encoder.encode(row))
+            buffer.write('\n')
+    else:
+        raise ValueError(f"Unknown export format '{fmt}'")
+
+    def flush():
+        piece = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return piece
+
+    if buffer.tell():
+        # The CSV header goes out before the first chunk of rows is read
+        yield flush()
+    for row in rows:
+        write(row)
+        if buffer.tell() >= settings.EXPORT_BUFFER_SIZE:
+            yield flush()
+    if buffer.tell():
+        yield flush()
+
+
+def export(group, kind, fmt, start=None, end=None):
+    """Encoded pieces of the group's 'expenses' or 'shares' export"""
+    if kind == 'expenses':
+        return encode(expense_rows(group, start, end), fmt, EXPENSE_COLUMNS)
+    if kind == 'shares':
+        return encode(share_rows(group, start, end), fmt, SHARE_COLUMNS)
+    raise ValueError(f"Unknown export '{kind}'")
+
+
+def export_filename(group, kind, fmt, start=None, end=None):
+    name = f'{group.name}_{kind}'
+    if start:
+        name += f'_from_{start:%Y%m%d}'
+    if end:
+        name += f'_to_{end:%Y%m%d}'
+    return get_valid_filename(f'{name}.{fmt}')
+
+
+async def aiterate(iterator):
+    """
+    Serve a sync iterator to an async consumer one piece at a time.
+    StreamingHttpResponse would otherwise read all of it into a list under
+    ASGI. Each step runs on the request's sync thread, where the iterator's
+    database cursor lives.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    while (piece := await step(iterator, None)) is not None:
+        yield piece
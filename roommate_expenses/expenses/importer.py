@@ -0,0 +1,255 @@
+# expenses/importer.py
+"""
+Streaming bulk import of expenses from CSV or JSON-lines.
+
+Rows are validated and inserted in chunks: each chunk is one transaction
+with a bulk INSERT for expenses, one for shared_among rows and one for
+ExpenseShare rows, followed by a single balance ledger update. Per-row
+signals are bypassed, but shares get the same amounts the signals and
+add_expense would have produced.
+
+CSV columns: title, amount, paid_by, shared_among[, split_method][, shares]
+    shared_among  usernames separated by ";"
+    shares        custom split as "alice:10.00;bob:5.50"
+
+JSON-lines: one object per line with the same keys; shared_among may be a
+list and shares an object of {username: amount}.
+
+Bad rows are skipped and reported. A file that can't be read at all from
+some line on (not UTF-8, malformed CSV) raises ImportFileError; run
+check_file() over a seekable file first so that nothing is committed.
+"""
+import csv
+import json
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import ledger, rollups
+from .models import Group, Expense, ExpenseShare
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+class ImportFileError(ValueError):
+    """The file can't be read from ``line_number`` on"""
+
+    def __init__(self, line_number, message):
+        super().__init__(message)
+        self.line_number = line_number
+
+
+def detect_format(filename, default='csv'):
+    """Pick 'csv' or 'jsonl' from a file name"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def decode_lines(binary):
+    """
+    UTF-8 text lines of a binary file, decoded one at a time so that a bad
+    byte is reported on its own line rather than somewhere in a buffer
+    """
+    for line_number, line in enumerate(binary, start=1):
+        yield line.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+
+
+def iter_rows(lines, fmt):
+    """
+    Yield (line_number, row_dict) from an iterable of text lines. Raises
+    ImportFileError where the file stops being decodable or parseable.
+    """
+    line_number = 0
+    try:
+        for line_number, row in _iter_rows(lines, fmt):
+            yield line_number, row
+    except UnicodeDecodeError:
+        raise ImportFileError(line_number + 1, 'File must be UTF-8 encoded')
+    except csv.Error as e:
+        raise ImportFileError(line_number + 1, f'Malformed CSV: {e}')
+
+
+def check_file(lines, fmt):
+    """Read the whole file without importing it; raises ImportFileError like iter_rows()"""
+    for _ in iter_rows(lines, fmt):
+        pass
+
+
+def _iter_rows(lines, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ImportRowError(f"Invalid JSON: {e}")
+                continue
+            yield line_number, row
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'")
+
+
+def _parse_amount(raw, what):
+    try:
+        value = Decimal(str(raw).strip())
+    except (InvalidOperation, TypeError):
+        raise ImportRowError(f"Invalid {what} '{raw}'")
+    if not value.is_finite() or value < 0:
+        raise ImportRowError(f"Invalid {what} '{raw}'")
+    return value
+
+
+def _parse_usernames(raw):
+    if not isinstance(raw, (list, tuple)):
+        raw = str(raw or '').split(';')
+    names = [str(name).strip() for name in raw]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def _parse_custom_shares(raw):
+    if isinstance(raw, dict):
+        return {str(name).strip(): value for name, value in raw.items()}
+    shares = {}
+    for part in str(raw or '').split(';'):
+        if not part.strip():
+            continue
+        name, sep, value = part.partition(':')
+        if not sep:
+            raise ImportRowError(f"Invalid share '{part.strip()}', expected username:amount")
+        shares[name.strip()] = value
+    return shares
+
+
+def parse_row(row, members_by_username):
+    """
+    Validate one input row against the group's members.
+    Returns (Expense, {user_id: share amount}).
+    """
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ImportRowError("Row must be an object")
+
+    title = str(row.get('title') or '').strip()
+    if not title:
+        raise ImportRowError("Missing title")
+    if len(title) > 200:
+        raise ImportRowError("Title is longer than 200 characters")
+
+    amount = _parse_amount(row.get('amount'), 'amount')
+    if amount.as_tuple().exponent < -2 or amount >= Decimal('1e8'):
+        raise ImportRowError(f"Amount '{row.get('amount')}' does not fit 8 digits and 2 decimal places")
+
+    payer = members_by_username.get(str(row.get('paid_by') or '').strip())
+    if payer is None:
+        raise ImportRowError(f"Payer '{row.get('paid_by')}' is not a member of the group")
+
+    split_method = str(row.get('split_method') or 'equal').strip().lower()
+    if split_method not in ('equal', 'custom'):
+        raise ImportRowError(f"Unknown split method '{split_method}'")
+
+    if split_method == 'custom':
+        raw_shares = _parse_custom_shares(row.get('shares'))
+        usernames = _parse_usernames(row.get('shared_among')) or list(raw_shares)
+        if set(usernames) != set(raw_shares):
+            raise ImportRowError("Custom shares must list an amount for every user in shared_among")
+    else:
+        usernames = _parse_usernames(row.get('shared_among'))
+    if not usernames:
+        raise ImportRowError("shared_among is empty")
+
+    amounts = {}
+    for username in usernames:
+        user = members_by_username.get(username)
+        if user is None:
+            raise ImportRowError(f"User '{username}' is not a member of the group")
+        if split_method == 'custom':
+            amounts[user.pk] = _parse_amount(raw_shares[username], f"share for {username}")
+        else:
+            # Same per-person amount the shared_among signal computes
+            amounts[user.pk] = amount / len(usernames)
+
+    if split_method == 'custom' and sum(amounts.values()) != amount:
+        raise ImportRowError("Sum of custom amounts must equal total expense amount")
+
+    expense = Expense(title=title, amount=amount, paid_by=payer, split_method=split_method)
+    return expense, amounts
+
+
+def import_expenses(group, rows, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Import (line_number, row) pairs into ``group``.
+
+    Returns {'created': int, 'errors': [(line_number, message), ...]}, and
+    'failed': (line_number, message) if the file broke off there with
+    ImportFileError; the rows before it are imported.
+    ``progress`` is called with (rows_seen, created) after each chunk.
+    """
+    members_by_username = {member.username: member for member in group.members.all()}
+    result = {'created': 0, 'errors': []}
+    chunk = []
+    seen = 0
+
+    try:
+        for line_number, row in rows:
+            seen += 1
+            try:
+                chunk.append(parse_row(row, members_by_username))
+            except ImportRowError as e:
+                result['errors'].append((line_number, str(e)))
+            if len(chunk) >= chunk_size:
+                result['created'] += _insert_chunk(group, chunk)
+                chunk = []
+                if progress:
+                    progress(seen, result['created'])
+    except ImportFileError as e:
+        result['failed'] = (e.line_number, str(e))
+
+    if chunk:
+        result['created'] += _insert_chunk(group, chunk)
+    if progress:
+        progress(seen, result['created'])
+    return result
+
+
+def _insert_chunk(group, chunk):
+    """Insert validated rows with one bulk INSERT per table and one ledger update"""
+    SharedAmong = Expense.shared_among.through
+
+    with transaction.atomic():
+        expenses = [expense for expense, _ in chunk]
+        for expense in expenses:
+            expense.group = group
+        Expense.objects.bulk_create(expenses)
+
+        through_rows = []
+        shares = []
+        deltas = defaultdict(Decimal)
+        for expense, amounts in chunk:
+            for user_id, amount in amounts.items():
+                through_rows.append(SharedAmong(expense_id=expense.pk, user_id=user_id))
+                share = ExpenseShare(expense=expense, user_id=user_id, amount=amount, is_paid=(user_id == expense.paid_by_id))
+                shares.append(share)
+                ledger.merge_deltas(deltas, ledger.share_deltas(expense.paid_by_id, ledger.share_state(share)))
+
+        SharedAmong.objects.bulk_create(through_rows)
+        ExpenseShare.objects.bulk_create(shares)
+        ledger.apply_deltas(group.pk, deltas)
+        rollups.add(group.pk, [expense.pk for expense in expenses])
+        Group.bump_version(group.pk)
+
+    return len(expenses)
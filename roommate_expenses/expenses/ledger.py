@@ -0,0 +1,212 @@
+# expenses/ledger.py
+"""
+Incrementally maintained (group, user) -> net balance ledger.
+
+A share contributes to the ledger only while it is unpaid and owed by someone
+other than the payer: the payer is owed ``amount`` and the debtor owes it.
+Every write path applies the difference between a share's old and new
+contribution, so reading balances never has to scan ExpenseShare.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+
+from .models import ExpenseShare, MemberBalance
+
+CENT = Decimal('0.01')
+
+# Expenses whose shares are being written in bulk or cascade-deleted; the
+# caller accounts for their contribution in one go, so per-share signals skip them.
+_suspended = threading.local()
+
+
+def to_cents(value):
+    """Round a share amount the same way the database column stores it"""
+    return Decimal(value).quantize(CENT)
+
+
+def share_state(share):
+    """Snapshot of the fields that determine a share's ledger contribution"""
+    return (share.user_id, to_cents(share.amount), share.is_paid)
+
+
+def share_deltas(payer_id, state):
+    """Ledger deltas contributed by one share, as {user_id: Decimal}"""
+    if state is None:
+        return {}
+    user_id, amount, is_paid = state
+    if is_paid or user_id == payer_id or not amount:
+        return {}
+    return {payer_id: amount, user_id: -amount}
+
+
+def merge_deltas(total, deltas, sign=1):
+    for user_id, amount in deltas.items():
+        total[user_id] += sign * amount
+    return total
+
+
+def apply_deltas(group_id, deltas, create=True):
+    """
+    Add the given per-user deltas to the group's ledger rows. Rows are never
+    deleted, so reversing an earlier contribution (create=False) only needs
+    UPDATEs, which keeps it safe inside cascade deletes of the group.
+    """
+    deltas = {user_id: amount for user_id, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    with transaction.atomic():
+        if create:
+            MemberBalance.objects.bulk_create(
+                [MemberBalance(group_id=group_id, user_id=user_id) for user_id in deltas],
+                ignore_conflicts=True,
+            )
+        MemberBalance.objects.filter(group_id=group_id, user_id__in=deltas).update(
+            balance=F('balance') + Case(
+                *[When(user_id=user_id, then=Value(amount)) for user_id, amount in deltas.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
+        )
+
+
+def record_share_change(share, old_state):
+    """Apply the difference between a share's previous and current contribution"""
+    expense = share.expense
+    deltas = defaultdict(Decimal)
+    merge_deltas(deltas, share_deltas(expense.paid_by_id, old_state), sign=-1)
+    merge_deltas(deltas, share_deltas(expense.paid_by_id, share_state(share)))
+    apply_deltas(expense.group_id, deltas)
+
+
+def _suspended_ids():
+    if not hasattr(_suspended, 'expense_ids'):
+        _suspended.expense_ids = set()
+    return _suspended.expense_ids
+
+
+def is_suspended(expense_id):
+    """Whether per-share signals should leave this expense to its caller"""
+    return expense_id in _suspended_ids()
+
+
+@contextmanager
+def suspended(expense_id):
+    """Skip per-share ledger signals while the caller maintains an expense's shares in bulk"""
+    already = is_suspended(expense_id)
+    _suspended_ids().add(expense_id)
+    try:
+        yield
+    finally:
+        if not already:
+            _suspended_ids().discard(expense_id)
+
+
+def record_share_delete(share):
+    """Reverse the contribution of a deleted share"""
+    if share.is_paid:
+        return
+    expense = share.expense
+    apply_deltas(
+        expense.group_id,
+        merge_deltas(defaultdict(Decimal), share_deltas(expense.paid_by_id, share_state(share)), sign=-1),
+        create=False,
+    )
+
+
+def _unpaid_share_states(expense):
+    return [
+        (user_id, to_cents(amount), False)
+        for user_id, amount in expense.shares.filter(is_paid=False).values_list('user_id', 'amount')
+    ]
+
+
+def reassign_payer(expense, old_payer_id):
+    """Move the expense's outstanding shares from the old payer to the new one"""
+    deltas = defaultdict(Decimal)
+    for state in _unpaid_share_states(expense):
+        merge_deltas(deltas, share_deltas(old_payer_id, state), sign=-1)
+        merge_deltas(deltas, share_deltas(expense.paid_by_id, state))
+    apply_deltas(expense.group_id, deltas)
+
+
+def detach_expense(expense):
+    """Reverse an expense's whole contribution before its shares are cascade-deleted"""
+    deltas = defaultdict(Decimal)
+    for state in _unpaid_share_states(expense):
+        merge_deltas(deltas, share_deltas(expense.paid_by_id, state), sign=-1)
+    apply_deltas(expense.group_id, deltas, create=False)
+    _suspended_ids().add(expense.pk)
+
+
+def release_expense(expense_id):
+    _suspended_ids().discard(expense_id)
+
+
+def compute_balances(group_ids=None):
+    """
+    Recompute balances from ExpenseShare with two aggregate scans.
+    Returns {group_id: {user_id: Decimal}}.
+    """
+    unpaid = ExpenseShare.objects.filter(is_paid=False).exclude(user=F('expense__paid_by'))
+    if group_ids is not None:
+        unpaid = unpaid.filter(expense__group_id__in=group_ids)
+
+    balances = defaultdict(lambda: defaultdict(Decimal))
+    credits = unpaid.values('expense__group_id', 'expense__paid_by_id').annotate(total=Sum('amount'))
+    for row in credits.order_by():
+        balances[row['expense__group_id']][row['expense__paid_by_id']] += row['total']
+    debits = unpaid.values('expense__group_id', 'user_id').annotate(total=Sum('amount'))
+    for row in debits.order_by():
+        balances[row['expense__group_id']][row['user_id']] -= row['total']
+    return balances
+
+
+def stored_balances(group_ids=None):
+    """Current ledger contents as {group_id: {user_id: Decimal}}"""
+    rows = MemberBalance.objects.all()
+    if group_ids is not None:
+        rows = rows.filter(group_id__in=group_ids)
+    balances = defaultdict(dict)
+    for group_id, user_id, balance in rows.values_list('group_id', 'user_id', 'balance'):
+        balances[group_id][user_id] = balance
+    return balances
+
+
+def find_mismatches(group_ids=None):
+    """List of (group_id, user_id, stored, expected) rows that disagree"""
+    expected = compute_balances(group_ids)
+    stored = stored_balances(group_ids)
+    mismatches = []
+    for group_id in set(expected) | set(stored):
+        expected_group = expected.get(group_id, {})
+        stored_group = stored.get(group_id, {})
+        for user_id in set(expected_group) | set(stored_group):
+            want = to_cents(expected_group.get(user_id, 0))
+            have = to_cents(stored_group.get(user_id, 0))
+            if want != have:
+                mismatches.append((group_id, user_id, have, want))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild(group_ids=None):
+    """Replace ledger rows with freshly computed balances. Returns rows written."""
+    rows = MemberBalance.objects.all()
+    if group_ids is not None:
+        rows = rows.filter(group_id__in=group_ids)
+    rows.delete()
+
+    balances = compute_balances(group_ids)
+    new_rows = [
+        MemberBalance(group_id=group_id, user_id=user_id, balance=to_cents(balance))
+        for group_id, members in balances.items()
+        for user_id, balance in members.items()
+    ]
+    MemberBalance.objects.bulk_create(new_rows, batch_size=1000)
+    return len(new_rows)
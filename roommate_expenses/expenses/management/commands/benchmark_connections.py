@@ -0,0 +1,105 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.utils import load_backend
+
+POSTGRES_ENGINES = ('django.db.backends.postgresql', 'roommate_expenses.postgresql_pool')
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request database latency with and without connection reuse'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Simulated requests per thread')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent worker threads')
+        parser.add_argument(
+            '--query',
+            default='SELECT 1',
+            help='SQL each simulated request runs (default: SELECT 1)',
+        )
+        parser.add_argument(
+            '--modes',
+            default='none,persistent,pool',
+            help='Comma separated connection modes to compare',
+        )
+
+    def handle(self, *args, **options):
+        base = dict(connections['default'].settings_dict)
+        is_postgres = base['ENGINE'] in POSTGRES_ENGINES
+
+        self.stdout.write(
+            f"{options['threads']} thread(s) x {options['requests']} requests, query: {options['query']}"
+        )
+        for mode in options['modes'].split(','):
+            mode = mode.strip()
+            if mode == 'pool' and not is_postgres:
+                self.stdout.write(f'  {mode:<11} skipped (pooling needs PostgreSQL)')
+                continue
+            settings_dict = self.settings_for(base, mode, options['threads'])
+            latencies, opened = self.run(mode, settings_dict, options)
+            latencies.sort()
+            self.stdout.write(
+                f'  {mode:<11} mean {statistics.mean(latencies):7.2f} ms  '
+                f'p50 {self.percentile(latencies, 50):7.2f} ms  '
+                f'p95 {self.percentile(latencies, 95):7.2f} ms  '
+                f'connections opened {opened}'
+            )
+
+    def settings_for(self, base, mode, threads):
+        settings_dict = dict(base)
+        settings_dict['CONN_MAX_AGE'] = 600 if mode == 'persistent' else 0
+        if mode == 'pool':
+            settings_dict['ENGINE'] = 'roommate_expenses.postgresql_pool'
+            settings_dict['POOL'] = dict(base.get('POOL', {}), MAX_SIZE=max(threads, base.get('POOL', {}).get('MAX_SIZE', 1)))
+        elif base['ENGINE'] == 'roommate_expenses.postgresql_pool':
+            settings_dict['ENGINE'] = 'django.db.backends.postgresql'
+        return settings_dict
+
+    def run(self, mode, settings_dict, options):
+        backend = load_backend(settings_dict['ENGINE'])
+        alias = f'benchmark_{mode}'
+        latencies = []
+        opened = []
+        lock = threading.Lock()
+
+        def worker():
+            wrapper = backend.DatabaseWrapper(settings_dict, alias)
+            connects = 0
+            local = []
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                # What Django does around a request: connect lazily, run the
+                # view's queries, then close if CONN_MAX_AGE has expired
+                if wrapper.connection is None:
+                    connects += 1
+                with wrapper.cursor() as cursor:
+                    cursor.execute(options['query'])
+                    cursor.fetchall()
+                wrapper.close_if_unusable_or_obsolete()
+                local.append((time.perf_counter() - start) * 1000)
+            wrapper.close()
+            with lock:
+                latencies.extend(local)
+                opened.append(connects)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if mode == 'pool':
+            pool = backend.get_pool(alias, settings_dict)
+            connections_opened = pool.stats['created']
+            pool.close_all()
+        else:
+            connections_opened = sum(opened)
+        return latencies, connections_opened
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
@@ -0,0 +1,85 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Load test a running server (WSGI or ASGI) with concurrent authenticated requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server')
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help='Path to request, repeatable (default: /expenses/); requests cycle through them',
+        )
+        parser.add_argument('--username', required=True, help='User the requests are authenticated as')
+        parser.add_argument('--requests', type=int, default=500, help='Total requests to send')
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.create_session(user)}'
+        base_url = options['url'].rstrip('/')
+        paths = options['paths'] or ['/expenses/']
+        urls = [base_url + paths[i % len(paths)] for i in range(options['requests'])]
+
+        def fetch(url):
+            request = urllib.request.Request(url, headers={'Cookie': cookie})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except (urllib.error.URLError, OSError):
+                status = None
+            return status, (time.perf_counter() - start) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for status, latency in results if status == 200)
+        failures = len(results) - len(latencies)
+        if not latencies:
+            raise CommandError(f'All {failures} requests failed; is the server running at {base_url}?')
+
+        self.stdout.write(f"{len(results)} requests to {base_url}, concurrency {options['concurrency']}")
+        self.stdout.write(f'  throughput  {len(latencies) / elapsed:8.1f} req/s')
+        self.stdout.write(f'  mean        {statistics.mean(latencies):8.1f} ms')
+        for pct in (50, 95, 99):
+            self.stdout.write(f'  p{pct:<10} {self.percentile(latencies, pct):8.1f} ms')
+        self.stdout.write(f'  max         {latencies[-1]:8.1f} ms')
+        if failures:
+            self.stdout.write(self.style.WARNING(f'  {failures} requests did not return 200'))
+
+    def create_session(self, user):
+        """Session key for ``user``, stored where the server will find it"""
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
@@ -0,0 +1,104 @@
+import contextlib
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, update_last_login
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from expenses.models import UserProfile
+
+PREFIX = 'bench_login_'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent logins by username and email: latency and queries per attempt'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Temporary users to create')
+        parser.add_argument('--attempts', type=int, default=500, help='Login attempts to make')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent attempts')
+        parser.add_argument(
+            '--real-hasher',
+            action='store_true',
+            help='Use the configured password hasher; by default a fast one isolates the database cost',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError(f"Users named '{PREFIX}*' exist from an interrupted run; delete them first")
+
+        hashers = None if options['real_hasher'] else ['django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(PASSWORD_HASHERS=hashers) if hashers else contextlib.nullcontext():
+            # Committed, so every thread's connection sees them; removed again at the end
+            users = self.create_users(options['users'])
+            try:
+                self.run(users, options)
+            finally:
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+    def create_users(self, count):
+        password = make_password('password')
+        users = User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@Example.com', password=password)
+            for i in range(count)
+        ])
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        return users
+
+    def run(self, users, options):
+        rng = random.Random(options['seed'])
+        # Username, email typed in another case, and wrong password logins
+        attempts = []
+        for _ in range(options['attempts']):
+            user = rng.choice(users)
+            kind = rng.choice(['username', 'email', 'wrong password'])
+            login = user.email.upper() if kind == 'email' else user.username
+            attempts.append((kind, login, 'wrong' if kind == 'wrong password' else 'password'))
+
+        def attempt(args):
+            kind, login, password = args
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    user = authenticate(username=login, password=password)
+                    if user is not None:
+                        # What django.contrib.auth.login() writes after a successful login
+                        update_last_login(None, user)
+                    elapsed = (time.perf_counter() - start) * 1000
+                return kind, (user is not None) == (kind != 'wrong password'), elapsed, len(queries)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(attempt, attempts))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{len(results)} logins over {len(users)} users, {options['threads']} threads: "
+            f'{len(results) / elapsed:.1f} logins/s'
+        )
+        for kind in ('username', 'email', 'wrong password'):
+            rows = [r for r in results if r[0] == kind]
+            if not rows:
+                continue
+            latencies = sorted(r[2] for r in rows)
+            self.stdout.write(
+                f'  {kind:<15} {len(rows):>5} attempts  '
+                f'p50 {statistics.median(latencies):7.1f} ms  '
+                f'p95 {latencies[int(0.95 * (len(latencies) - 1))]:7.1f} ms  '
+                f'{statistics.mean(r[3] for r in rows):4.1f} queries'
+            )
+
+        wrong = [r for r in results if not r[1]]
+        if wrong:
+            raise CommandError(f'{len(wrong)} attempts got the wrong result')
+        self.stdout.write(self.style.SUCCESS('All attempts authenticated as expected'))
+
@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from expenses import reports
+from expenses.models import Group
+
+
+class Command(BaseCommand):
+    help = 'Benchmark PDF report rendering for several groups, one after another and in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=8, help='Render the reports of this many of the largest groups')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Pool size (default: CPU count)',
+        )
+
+    def handle(self, *args, **options):
+        groups = list(Group.objects.annotate(expense_count=Count('expenses')).order_by('-expense_count')[:options['groups']])
+        if not groups:
+            raise CommandError('No groups found; create some with generate_fake_data')
+        processes = options['processes']
+
+        # Loading is the same database work either way; time only the rendering
+        start = time.perf_counter()
+        contexts = [reports.report_context(group) for group in groups]
+        load_time = time.perf_counter() - start
+        self.stdout.write(
+            f'{len(groups)} groups, {sum(group.expense_count for group in groups)} expenses, '
+            f'data loaded in {load_time:.2f}s; {os.cpu_count()} CPUs'
+        )
+
+        start = time.perf_counter()
+        sizes = [len(reports.render_pdf(context)) for context in contexts]
+        serial = time.perf_counter() - start
+        self.stdout.write(f'  {"serial":<20}{serial:7.2f}s  {sum(sizes) / 1024:.0f} KB of PDF')
+
+        with reports.make_process_pool(processes) as pool:
+            # Start the workers and import ReportLab in each before timing
+            list(pool.map(reports.render_pdf, contexts[-1:] * processes))
+            start = time.perf_counter()
+            list(pool.map(reports.render_pdf, contexts))
+            parallel = time.perf_counter() - start
+        self.stdout.write(f'  {f"{processes} processes":<20}{parallel:7.2f}s  {serial / parallel:.1f}x faster')
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
@@ -0,0 +1,94 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from expenses import ledger
+from expenses.models import Group, Expense, ExpenseShare
+from expenses.settlement import group_settlements
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the dashboard debt list: one row per unpaid share vs simplified settlements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=10, help='Members in the benchmark group')
+        parser.add_argument('--shares', type=int, default=10000, help='Approximate number of shares to create')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant; the best time is reported')
+
+    def handle(self, *args, **options):
+        members_count = options['members']
+        expense_count = max(1, options['shares'] // members_count)
+
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            group, members = self.create_data(members_count, expense_count)
+            request = RequestFactory().get('/')
+            request.user = members[0]
+
+            def per_share_debts():
+                unpaid_shares = ExpenseShare.objects.filter(
+                    expense__group=group,
+                    is_paid=False
+                ).exclude(user=F('expense__paid_by')).values(
+                    'amount', 'user__username', 'expense__paid_by__username'
+                )
+                return [
+                    {
+                        'from_user': share['user__username'],
+                        'to_user': share['expense__paid_by__username'],
+                        'amount': share['amount']
+                    }
+                    for share in unpaid_shares
+                ]
+
+            self.stdout.write(
+                f'Group with {members_count} members, {expense_count} expenses, '
+                f'{expense_count * members_count} shares'
+            )
+            for label, build_debts in [('per-share rows', per_share_debts), ('settlements', lambda: group_settlements(group))]:
+                best, rows, size = self.measure(build_debts, group, request, options['repeat'])
+                self.stdout.write(f'  {label:<15} {rows:>7} rows  {best * 1000:>9.1f} ms  {size / 1024:>9.1f} KB')
+
+            transaction.set_rollback(True)
+
+    def create_data(self, members_count, expense_count):
+        members = User.objects.bulk_create([
+            User(username=f'bench_{i}', email=f'bench_{i}@example.com') for i in range(members_count)
+        ])
+        group = Group.objects.create(name='Benchmark', created_by=members[0])
+        group.members.add(*members)
+
+        amount = Decimal('10.00') * members_count
+        expenses = Expense.objects.bulk_create([
+            Expense(title=f'Expense {i}', amount=amount, paid_by=members[(i * i) % members_count], group=group)
+            for i in range(expense_count)
+        ])
+        ExpenseShare.objects.bulk_create([
+            ExpenseShare(expense=expense, user=member, amount=Decimal('10.00'), is_paid=(member == expense.paid_by))
+            for expense in expenses
+            for member in members
+        ], batch_size=1000)
+        ledger.rebuild([group.id])
+        return group, members
+
+    def measure(self, build_debts, group, request, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            debts = build_debts()
+            html = render_to_string('expenses/dashboard.html', {
+                'selected_group': group,
+                'all_groups': [group],
+                'expenses': [],
+                'member_balances': {},
+                'debts': debts,
+            }, request=request)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(debts), len(html.encode())
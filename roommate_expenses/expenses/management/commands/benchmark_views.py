@@ -0,0 +1,155 @@
+import io
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from expenses import dashboard, reports
+from expenses.models import Group, ExpenseShare
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+SCENARIOS = ['dashboard', 'dashboard_cached', 'api', 'expense_detail', 'toggle_payment', 'report']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main views in-process: latency percentiles, queries, writes and peak memory per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, help='Group to benchmark (default: the one with the most expenses)')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per view')
+        parser.add_argument(
+            '--view',
+            action='append',
+            dest='views',
+            choices=SCENARIOS,
+            help='View to benchmark, repeatable (default: all)',
+        )
+        parser.add_argument(
+            '--memory-requests',
+            type=int,
+            default=3,
+            help='Requests per view traced for peak memory; tracing is slow so it runs separately',
+        )
+
+    def handle(self, *args, **options):
+        groups = Group.objects.annotate(expense_count=Count('expenses')).order_by('-expense_count')
+        if options['group']:
+            groups = groups.filter(pk=options['group'])
+        group = groups.first()
+        if group is None or group.expense_count == 0:
+            raise CommandError('No group with expenses found; create some with generate_fake_data')
+        user = group.members.order_by('id').first()
+        if user is None:
+            raise CommandError(f'Group {group.pk} has no members')
+
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+
+        self.stdout.write(
+            f'Group {group.pk} "{group.name}": {group.expense_count} expenses, '
+            f"as {user.username}, {options['requests']} requests per view"
+        )
+        self.stdout.write(
+            f"  {'view':<17}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'writes':>8}{'peak KB':>10}"
+        )
+
+        for name in options['views'] or SCENARIOS:
+            # Writes are rolled back so the benchmark leaves the data as it found it
+            with transaction.atomic():
+                run = getattr(self, f'scenario_{name}')(client, group, user)
+                latencies, queries, writes = self.measure(run, options['requests'])
+                peak = self.peak_memory(run, options['memory_requests'])
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                f'  {name:<17}'
+                + ''.join(f'{self.percentile(latencies, pct):9.1f}' for pct in (50, 95, 99))
+                + f'{self.percentile(queries, 50):9d}{self.percentile(writes, 50):8d}{peak / 1024:10.0f}'
+            )
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def measure(self, run, count):
+        latencies = []
+        queries = []
+        writes = []
+        for i in range(count):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                run(i)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+            writes.append(sum(
+                query['sql'].lstrip().upper().startswith(WRITE_PREFIXES) for query in context.captured_queries
+            ))
+        return sorted(latencies), sorted(queries), sorted(writes)
+
+    def peak_memory(self, run, count):
+        """Largest Python allocation peak of a single request"""
+        peak = 0
+        for i in range(count):
+            tracemalloc.start()
+            try:
+                run(i)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        return peak
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def get(self, client, url):
+        response = client.get(url, secure=True)
+        if response.status_code != 200:
+            raise CommandError(f'GET {url} returned {response.status_code}')
+        # Streamed responses only do their work when read
+        response.getvalue() if response.streaming else response.content
+        return response
+
+    def scenario_dashboard(self, client, group, user):
+        """Dashboard with the data cache cleared before every request"""
+        url = f"{reverse('dashboard')}?group={group.pk}"
+
+        def run(i):
+            caches[dashboard.CACHE_ALIAS].clear()
+            self.get(client, url)
+        return run
+
+    def scenario_dashboard_cached(self, client, group, user):
+        url = f"{reverse('dashboard')}?group={group.pk}"
+        self.get(client, url)
+        return lambda i: self.get(client, url)
+
+    def scenario_api(self, client, group, user):
+        url = reverse('group_dashboard_api', args=[group.pk])
+        self.get(client, url)
+        return lambda i: self.get(client, url)
+
+    def scenario_expense_detail(self, client, group, user):
+        expense_ids = list(group.expenses.order_by('-created_at').values_list('pk', flat=True)[:20])
+        return lambda i: self.get(client, reverse('expense_detail', args=[expense_ids[i % len(expense_ids)]]))
+
+    def scenario_toggle_payment(self, client, group, user):
+        share = ExpenseShare.objects.filter(expense__group=group).order_by('-expense__created_at').first()
+        url = reverse('toggle_payment_status', args=[share.pk])
+
+        def run(i):
+            response = client.post(url, secure=True)
+            if response.status_code != 200:
+                raise CommandError(f'POST {url} returned {response.status_code}')
+        return run
+
+    def scenario_report(self, client, group, user):
+        """PDF rendering as the background report worker does it"""
+        return lambda i: reports.build_report(group, io.BytesIO())
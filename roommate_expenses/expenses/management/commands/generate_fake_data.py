@@ -0,0 +1,159 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from expenses import ledger, rollups
+from expenses.models import Group, UserProfile, Expense, ExpenseShare
+
+TITLES = [
+    'Groceries', 'Rent', 'Electricity', 'Internet', 'Water bill', 'Pizza night', 'Cleaning supplies',
+    'Gas bill', 'Takeaway', 'Streaming subscription', 'Furniture', 'Toilet paper', 'Coffee beans',
+]
+
+
+class Command(BaseCommand):
+    help = 'Generate reproducible fake groups, members, expenses and shares with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=10, help='Groups to create')
+        parser.add_argument('--members', type=int, default=5, help='Members per group')
+        parser.add_argument('--expenses', type=int, default=1000, help='Expenses per group')
+        parser.add_argument(
+            '--custom-ratio',
+            type=float,
+            default=0.2,
+            help='Fraction of expenses with a custom split (default 0.2)',
+        )
+        parser.add_argument(
+            '--paid-ratio',
+            type=float,
+            default=0.5,
+            help="Fraction of non-payers' shares already marked paid (default 0.5)",
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk INSERT')
+        parser.add_argument(
+            '--prefix',
+            default='fake',
+            help='Prefix for generated usernames and group names (default: fake)',
+        )
+
+    def handle(self, *args, **options):
+        if options['members'] < 1 or options['groups'] < 1 or options['expenses'] < 0:
+            raise CommandError('--groups and --members must be at least 1 and --expenses not negative')
+        for name in ('custom_ratio', 'paid_ratio'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be between 0 and 1")
+
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Users named '{prefix}_*' already exist; pick another --prefix")
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        started = time.monotonic()
+
+        with transaction.atomic():
+            groups = self.create_groups(prefix, options['groups'], options['members'], batch_size)
+            expense_count = 0
+            for group, members in groups:
+                expense_count += self.create_expenses(group, members, options, rng)
+            group_ids = [group.pk for group, _ in groups]
+            ledger.rebuild(group_ids)
+            rollups.rebuild(group_ids)
+            Group.objects.filter(pk__in=group_ids).update(version=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(groups)} groups, {len(groups) * options["members"]} users and '
+            f'{expense_count} expenses in {time.monotonic() - started:.1f}s '
+            f'(users log in with password "password")'
+        ))
+
+    def create_groups(self, prefix, group_count, members_per_group, batch_size):
+        # Hash once; every fake user gets the same password
+        password = make_password('password')
+        users = User.objects.bulk_create([
+            User(username=f'{prefix}_{g}_{m}', email=f'{prefix}_{g}_{m}@example.com', password=password)
+            for g in range(group_count)
+            for m in range(members_per_group)
+        ], batch_size=batch_size)
+        # bulk_create skips the post_save signal that creates profiles
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users], batch_size=batch_size)
+
+        groups = Group.objects.bulk_create([
+            Group(
+                name=f'{prefix.title()} group {g}',
+                code=f'{prefix[:8].upper()}{g}'[:20],
+                created_by=users[g * members_per_group],
+            )
+            for g in range(group_count)
+        ], batch_size=batch_size)
+
+        Membership = Group.members.through
+        result = []
+        memberships = []
+        for g, group in enumerate(groups):
+            members = users[g * members_per_group:(g + 1) * members_per_group]
+            memberships.extend(Membership(group_id=group.pk, user_id=user.pk) for user in members)
+            result.append((group, members))
+        Membership.objects.bulk_create(memberships, batch_size=batch_size)
+        return result
+
+    def create_expenses(self, group, members, options, rng):
+        SharedAmong = Expense.shared_among.through
+        batch_size = options['batch_size']
+        remaining = options['expenses']
+
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            remaining -= count
+
+            expenses = []
+            splits = []
+            for _ in range(count):
+                amount_cents = rng.randint(100, 50000)
+                payer = rng.choice(members)
+                sharers = rng.sample(members, rng.randint(1, len(members)))
+                if payer not in sharers and rng.random() < 0.8:
+                    sharers.append(payer)
+                custom = rng.random() < options['custom_ratio']
+                expenses.append(Expense(
+                    title=rng.choice(TITLES),
+                    amount=Decimal(amount_cents) / 100,
+                    paid_by=payer,
+                    group=group,
+                    split_method='custom' if custom else 'equal',
+                ))
+                splits.append(self.split(amount_cents, sharers, custom, rng))
+            Expense.objects.bulk_create(expenses, batch_size=batch_size)
+
+            through_rows = []
+            shares = []
+            for expense, amounts in zip(expenses, splits):
+                for user, amount in amounts.items():
+                    through_rows.append(SharedAmong(expense_id=expense.pk, user_id=user.pk))
+                    is_paid = user == expense.paid_by or rng.random() < options['paid_ratio']
+                    shares.append(ExpenseShare(expense=expense, user=user, amount=amount, is_paid=is_paid))
+            SharedAmong.objects.bulk_create(through_rows, batch_size=batch_size)
+            ExpenseShare.objects.bulk_create(shares, batch_size=batch_size)
+
+        return options['expenses']
+
+    @staticmethod
+    def split(amount_cents, sharers, custom, rng):
+        """{user: Decimal} shares; custom splits are random but add up to the amount exactly"""
+        if not custom:
+            # Same per-person amount the shared_among signal stores
+            amount = Decimal(amount_cents) / 100 / len(sharers)
+            return dict.fromkeys(sharers, amount)
+        cuts = sorted(rng.randint(0, amount_cents) for _ in range(len(sharers) - 1))
+        bounds = [0] + cuts + [amount_cents]
+        return {
+            user: Decimal(bounds[i + 1] - bounds[i]) / 100
+            for i, user in enumerate(sharers)
+        }
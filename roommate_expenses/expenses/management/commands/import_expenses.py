@@ -0,0 +1,76 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from expenses.importer import (
+    DEFAULT_CHUNK_SIZE, ImportFileError, check_file, decode_lines, detect_format, import_expenses, iter_rows,
+)
+from expenses.models import Group
+
+
+class Command(BaseCommand):
+    help = 'Bulk import expenses into a group from a CSV or JSON-lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin')
+        parser.add_argument('--group', required=True, help='Group id or group code')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='Input format (default: detected from the file extension, csv for stdin)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Rows validated and inserted per transaction',
+        )
+
+    def handle(self, *args, **options):
+        group_ref = options['group']
+        try:
+            if group_ref.isdigit():
+                group = Group.objects.get(pk=group_ref)
+            else:
+                group = Group.objects.get(code=group_ref)
+        except Group.DoesNotExist:
+            raise CommandError(f"Group '{group_ref}' not found")
+
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        started = time.monotonic()
+
+        def progress(seen, created):
+            elapsed = time.monotonic() - started
+            rate = created / elapsed * 60 if elapsed else 0
+            self.stdout.write(f'  {seen} rows read, {created} expenses created ({rate:,.0f}/min)')
+
+        self.stdout.write(f'Importing {fmt} into group "{group.name}"...')
+        if path == '-':
+            # stdin can't be read twice; a broken file stops the import where it breaks
+            lines = decode_lines(sys.stdin.buffer)
+            result = import_expenses(group, iter_rows(lines, fmt), options['chunk_size'], progress)
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    check_file(decode_lines(stream), fmt)
+                    stream.seek(0)
+                    result = import_expenses(group, iter_rows(decode_lines(stream), fmt), options['chunk_size'], progress)
+            except OSError as e:
+                raise CommandError(f'Cannot read {path}: {e}')
+            except ImportFileError as e:
+                raise CommandError(f'Line {e.line_number}: {e}; nothing was imported')
+
+        for line_number, message in result['errors']:
+            self.stderr.write(f'Line {line_number}: {message}')
+        if 'failed' in result:
+            line_number, message = result['failed']
+            raise CommandError(
+                f"Line {line_number}: {message}; the {result['created']} expenses before it were imported"
+            )
+
+        summary = f"Imported {result['created']} expenses in {time.monotonic() - started:.1f}s"
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(f"{summary}; {len(result['errors'])} row(s) rejected"))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -1,43 +1,210 @@
-from django.core.management.base import BaseCommand
-from expenses.models import Expense, ExpenseShare
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+
+from expenses import ledger, rollups
+from expenses.models import Group, Expense, ExpenseShare
+
+
+def backfill_chunk(after_id, last_id, chunk_size, dry_run):
+    """
+    Create missing shares for the next ``chunk_size`` expenses with
+    after_id < pk <= last_id. Returns (last processed pk or None, shares created).
+    """
+    with transaction.atomic():
+        expenses = Expense.objects.filter(pk__gt=after_id, pk__lte=last_id).order_by('pk')
+        if not dry_run:
+            # Lock the chunk's expenses (as sync_expense_shares does) so no share is
+            # added behind our back between reading the existing ones and the insert
+            expenses = expenses.select_for_update()
+        expenses = list(
+            expenses.values_list('pk', 'amount', 'paid_by_id', 'group_id', 'split_method', 'date')[:chunk_size]
+        )
+        if not expenses:
+            return None, 0
+        expense_ids = [row[0] for row in expenses]
+
+        shared_users = defaultdict(list)
+        through = Expense.shared_among.through.objects.filter(expense_id__in=expense_ids)
+        for expense_id, user_id in through.values_list('expense_id', 'user_id'):
+            shared_users[expense_id].append(user_id)
+        existing = set(
+            ExpenseShare.objects.filter(expense_id__in=expense_ids).values_list('expense_id', 'user_id')
+        )
+
+        new_shares = []
+        deltas = defaultdict(lambda: defaultdict(Decimal))
+        days = defaultdict(set)
+        for expense_id, amount, paid_by_id, group_id, split_method, day in expenses:
+            user_ids = shared_users.get(expense_id)
+            # Custom split amounts can't be derived from the expense; leave those alone
+            if not user_ids or split_method != 'equal':
+                continue
+            amount_per_person = amount / len(user_ids)
+            for user_id in user_ids:
+                if (expense_id, user_id) in existing:
+                    continue
+                share = ExpenseShare(
+                    expense_id=expense_id,
+                    user_id=user_id,
+                    amount=amount_per_person,
+                    is_paid=(user_id == paid_by_id)
+                )
+                new_shares.append(share)
+                ledger.merge_deltas(deltas[group_id], ledger.share_deltas(paid_by_id, ledger.share_state(share)))
+                days[group_id].add(day)
+
+        if new_shares and not dry_run:
+            # No ignore_conflicts: a share that exists after all is a bug, not something to skip
+            # while its ledger delta is still applied
+            ExpenseShare.objects.bulk_create(new_shares, batch_size=1000)
+            for group_id, group_deltas in deltas.items():
+                ledger.apply_deltas(group_id, group_deltas)
+                rollups.refresh(group_id, days[group_id])
+                Group.bump_version(group_id)
+
+    return expense_ids[-1], len(new_shares)
+
+
+def _init_worker():
+    django.setup()
+    # Never share the parent's database connections across processes
+    connections.close_all()
 
 
 class Command(BaseCommand):
     help = 'Populate ExpenseShare records for existing expenses'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Expenses processed per chunk (one transaction each)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help=(
+                'Process pool size; the expense id range is split into this many partitions. '
+                'More than one worker needs PostgreSQL: SQLite allows only one writer at a time'
+            ),
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording progress; an existing checkpoint is resumed',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many shares would be created',
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write('Populating expense shares...')
-        
-        expenses = Expense.objects.all()
+        chunk_size = options['chunk_size']
+        workers = max(1, options['workers'])
+        if workers > 1 and connection.vendor == 'sqlite':
+            # Each worker holds a write transaction per chunk; SQLite would fail the others with
+            # "database is locked"
+            raise CommandError('--workers > 1 needs PostgreSQL; SQLite allows only one writer at a time')
+        dry_run = options['dry_run']
+        checkpoint = None if dry_run else options.get('checkpoint')
+
+        ranges = self.load_checkpoint(checkpoint) if checkpoint else None
+        if ranges is None:
+            ranges = self.partition(workers)
+        if not ranges:
+            self.stdout.write('No expenses to process')
+            return
+
+        pending = [r for r in ranges if r['after'] < r['last']]
+        self.stdout.write(
+            f"{'Counting' if dry_run else 'Populating'} expense shares "
+            f"({len(pending)} of {len(ranges)} partition(s) left, {workers} worker(s))..."
+        )
+
         created_count = 0
-        
-        for expense in expenses:
-            shared_users = expense.shared_among.all()
-            num_people = shared_users.count()
-            
-            if num_people > 0:
-                amount_per_person = expense.amount / num_people
-                
-                for user in shared_users:
-                    # Check if share already exists
-                    share, created = ExpenseShare.objects.get_or_create(
-                        expense=expense,
-                        user=user,
-                        defaults={
-                            'amount': amount_per_person,
-                            'is_paid': (user == expense.paid_by)
-                        }
-                    )
-                    if created:
-                        created_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'Created share for {user.username} on expense "{expense.title}"'
-                            )
-                        )
-        
+        started = last_report = time.monotonic()
+
+        def record(partition, processed_id, created):
+            nonlocal created_count, last_report
+            created_count += created
+            partition['after'] = partition['last'] if processed_id is None else processed_id
+            if checkpoint:
+                self.save_checkpoint(checkpoint, ranges)
+            if time.monotonic() - last_report >= 5:
+                last_report = time.monotonic()
+                self.stdout.write(f'  {created_count} shares so far ({last_report - started:.0f}s)')
+
+        if workers == 1:
+            for partition in pending:
+                while partition['after'] < partition['last']:
+                    processed_id, created = backfill_chunk(partition['after'], partition['last'], chunk_size, dry_run)
+                    record(partition, processed_id, created)
+        else:
+            # Each partition is walked chunk by chunk; the parent keeps one chunk in
+            # flight per partition and owns the checkpoint file.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                def submit(partition):
+                    return pool.submit(backfill_chunk, partition['after'], partition['last'], chunk_size, dry_run)
+
+                in_flight = {submit(partition): partition for partition in pending}
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        partition = in_flight.pop(future)
+                        processed_id, created = future.result()
+                        record(partition, processed_id, created)
+                        if partition['after'] < partition['last']:
+                            in_flight[submit(partition)] = partition
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {created_count} expense share records would be created'))
+            return
+
+        if checkpoint:
+            self.stdout.write(f'Checkpoint {checkpoint} marks all partitions complete')
         self.stdout.write(
             self.style.SUCCESS(
                 f'Successfully created {created_count} expense share records'
             )
         )
+
+    def partition(self, workers):
+        """Split the expense id space into ``workers`` contiguous ranges"""
+        bounds = Expense.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return []
+        low, high = bounds['low'] - 1, bounds['high']
+        step = -(-(high - low) // workers)  # ceiling division
+        return [
+            {'after': start, 'last': min(start + step, high)}
+            for start in range(low, high, step)
+        ]
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                ranges = json.load(f)['ranges']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Unreadable checkpoint {path}: {e}')
+        self.stdout.write(f'Resuming from checkpoint {path}')
+        return ranges
+
+    def save_checkpoint(self, path, ranges):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'ranges': ranges}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from expenses import ledger, rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the per-member balance ledger and the monthly and weekly rollups from Expense and ExpenseShare records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare the ledger and rollups with recomputed totals; exit non-zero on mismatch',
+        )
+        parser.add_argument(
+            '--group',
+            type=int,
+            action='append',
+            dest='groups',
+            help='Limit to this group id (can be given several times)',
+        )
+
+    def handle(self, *args, **options):
+        group_ids = options.get('groups')
+
+        if options.get('verify'):
+            self.stdout.write('Verifying balance ledger...')
+            mismatches = ledger.find_mismatches(group_ids)
+            for group_id, user_id, stored, expected in mismatches:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Group {group_id} user {user_id}: ledger has ${stored}, expected ${expected}'
+                    )
+                )
+            rollup_mismatches = rollups.find_mismatches(group_ids)
+            for (group_id, period_field, period, user_id), stored, expected in rollup_mismatches:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Group {group_id} user {user_id} {period_field} of {period}: rollup has {stored}, expected {expected}'
+                    )
+                )
+            if mismatches or rollup_mismatches:
+                raise CommandError(
+                    f'{len(mismatches)} ledger balance(s) and {len(rollup_mismatches)} rollup(s) '
+                    'out of sync; run rebuild_balances'
+                )
+            self.stdout.write(self.style.SUCCESS('Balance ledger and rollups are consistent'))
+            return
+
+        self.stdout.write('Rebuilding balance ledger...')
+        written = ledger.rebuild(group_ids)
+        rollups_written = rollups.rebuild(group_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully wrote {written} balance records and {rollups_written} monthly and weekly rollups'
+        ))
@@ -0,0 +1,124 @@
+# expenses/membership.py
+"""
+Group membership checks for views.
+
+A check is one indexed EXISTS on the group/member table (or part of the
+query loading the group), never a load of every member. Answers are
+remembered on the request, and when the group's version is known they are
+also cached for MEMBERSHIP_CACHE_TIMEOUT seconds under
+membership:<group>:v<version>:<user>. Joining or leaving bumps the group's
+version, so a cached answer can't outlive a membership change.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect
+
+from .models import Group
+
+Membership = Group.members.through
+
+
+def _memo(request):
+    if not hasattr(request, '_group_memberships'):
+        request._group_memberships = {}
+    return request._group_memberships
+
+
+def _cache_key(group, user):
+    return f'membership:{group.pk}:v{group.version}:{user.pk}'
+
+
+def _split(group):
+    """(group id, Group or None) for a Group or a group id"""
+    if isinstance(group, Group):
+        return group.pk, group
+    return int(group), None
+
+
+def is_member(request, group):
+    """Whether request.user belongs to ``group`` (a Group or a group id)"""
+    group_id, instance = _split(group)
+    memo = _memo(request)
+    if group_id in memo:
+        return memo[group_id]
+
+    timeout = settings.MEMBERSHIP_CACHE_TIMEOUT
+    result = None
+    if instance is not None and timeout:
+        result = cache.get(_cache_key(instance, request.user))
+    if result is None:
+        result = Membership.objects.filter(group_id=group_id, user_id=request.user.pk).exists()
+        if instance is not None and timeout:
+            cache.set(_cache_key(instance, request.user), result, timeout)
+
+    memo[group_id] = result
+    return result
+
+
+async def ais_member(request, group):
+    """Async is_member()"""
+    group_id, instance = _split(group)
+    memo = _memo(request)
+    if group_id in memo:
+        return memo[group_id]
+
+    timeout = settings.MEMBERSHIP_CACHE_TIMEOUT
+    result = None
+    if instance is not None and timeout:
+        result = await cache.aget(_cache_key(instance, request.user))
+    if result is None:
+        result = await Membership.objects.filter(group_id=group_id, user_id=request.user.pk).aexists()
+        if instance is not None and timeout:
+            await cache.aset(_cache_key(instance, request.user), result, timeout)
+
+    memo[group_id] = result
+    return result
+
+
+def get_group_for_member(request, group_id):
+    """
+    The group with ``is_member`` annotated, loaded in one query; raises
+    Http404 if it doesn't exist
+    """
+    try:
+        group = Group.objects.annotate(
+            is_member=Exists(Membership.objects.filter(group_id=OuterRef('pk'), user_id=request.user.pk))
+        ).get(pk=group_id)
+    except Group.DoesNotExist:
+        raise Http404('No Group matches the given query.')
+    _memo(request)[group.pk] = group.is_member
+    return group
+
+
+def membership_required(message=None):
+    """
+    Decorator for views taking a ``group_id`` URL argument: loads the group,
+    turns non-members away and calls the view with ``group`` instead.
+
+    Non-members get a JSON 403, or with ``message`` a redirect to the
+    dashboard showing it (and "Group not found." for a missing group).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, group_id, *args, **kwargs):
+            try:
+                group = get_group_for_member(request, group_id)
+            except Http404:
+                if message is None:
+                    raise
+                messages.error(request, "Group not found.")
+                return redirect('dashboard')
+
+            if not group.is_member:
+                if message is None:
+                    return JsonResponse({'error': 'Permission denied'}, status=403)
+                messages.error(request, message)
+                return redirect('dashboard')
+            return view(request, group, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+# expenses/middleware.py
+"""
+Per-request query and timing instrumentation.
+
+QueryTimingMiddleware counts the database queries of every request, times
+them and the whole request, and spots repeated statements (the same SQL run
+more than once is usually an N+1 loop). The numbers go out as a
+Server-Timing header, which browser dev tools show under the request's
+Timing tab, and as one JSON log line on the 'expenses.requests' logger.
+
+QUERY_BUDGETS maps URL names to the most queries a request may run, or to
+{HTTP method: budget} where reads and writes differ (methods left out are
+not checked); a request over budget is logged as a warning, or raises
+QueryBudgetExceeded when QUERY_BUDGET_STRICT is set (the test suite does
+this).
+"""
+import contextvars
+import json
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('expenses.requests')
+
+_current = contextvars.ContextVar('request_query_stats', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.statements = Counter()
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        """{sql: times run} for statements run more than once"""
+        return {sql: count for sql, count in self.statements.items() if count > 1}
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - start
+        # Parameters are placeholders in sql, so the same query with other values counts as a repeat
+        stats.statements[sql] += 1
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def install_on_new_connection(sender, connection, **kwargs):
+    install(connection)
+
+
+def current_stats():
+    """Stats of the request being served, or None outside the middleware"""
+    return _current.get()
+
+
+class QueryTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        total_ms = stats.total_ms()
+        db_ms = stats.db_time * 1000
+        duplicates = stats.duplicates
+        repeated = sum(duplicates.values()) - len(duplicates)
+        response.headers['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{stats.query_count} queries, {repeated} repeated", '
+            f'total;dur={total_ms:.1f}'
+        )
+
+        url_name = request.resolver_match.view_name if request.resolver_match else None
+        budget = settings.QUERY_BUDGETS.get(url_name)
+        if isinstance(budget, dict):
+            budget = budget.get(request.method)
+        over_budget = budget is not None and stats.query_count > budget
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': url_name,
+            'status': response.status_code,
+            'queries': stats.query_count,
+            'repeated_queries': repeated,
+            'db_ms': round(db_ms, 1),
+            'total_ms': round(total_ms, 1),
+        }
+        if duplicates:
+            # The worst offenders, truncated; enough to find the loop
+            record['top_repeated'] = [
+                {'sql': sql[:200], 'count': count}
+                for sql, count in Counter(duplicates).most_common(3)
+            ]
+        if over_budget:
+            record['query_budget'] = budget
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(record))
+
+        if over_budget and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(
+                f'{request.method} {url_name} ran {stats.query_count} queries, budget is {budget}: {record.get("top_repeated", [])}'
+            )
+        return response
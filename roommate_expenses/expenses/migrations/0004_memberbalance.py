@@ -0,0 +1,53 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+
+
+def build_balances(apps, schema_editor):
+    """Populate the ledger from existing unpaid shares"""
+    ExpenseShare = apps.get_model('expenses', 'ExpenseShare')
+    MemberBalance = apps.get_model('expenses', 'MemberBalance')
+
+    unpaid = ExpenseShare.objects.filter(is_paid=False).exclude(user=models.F('expense__paid_by'))
+    balances = defaultdict(Decimal)
+    credits = unpaid.values('expense__group_id', 'expense__paid_by_id').annotate(total=models.Sum('amount'))
+    for row in credits.order_by():
+        balances[(row['expense__group_id'], row['expense__paid_by_id'])] += row['total']
+    debits = unpaid.values('expense__group_id', 'user_id').annotate(total=models.Sum('amount'))
+    for row in debits.order_by():
+        balances[(row['expense__group_id'], row['user_id'])] -= row['total']
+
+    MemberBalance.objects.bulk_create(
+        [MemberBalance(group_id=group_id, user_id=user_id, balance=balance)
+         for (group_id, user_id), balance in balances.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('expenses', '0003_expense_split_method'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='expenses.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+        migrations.RunPython(build_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-18 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0005_group_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', '-created_at'], name='expense_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'paid_by'], name='expense_group_payer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseshare',
+            index=models.Index(fields=['user', 'is_paid'], name='share_user_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseshare',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['expense'], name='share_unpaid_expense_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseshare',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['user'], name='share_unpaid_user_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.26 on 2026-10-18 02:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_expense_share_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='expenses.group')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group', 'created_at'], name='groupevent_group_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index LOWER(email) on auth_user for the case-insensitive email login lookup"""
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('expenses', '0007_groupevent'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email));',
+            reverse_sql='DROP INDEX auth_user_email_lower_idx;',
+        ),
+    ]
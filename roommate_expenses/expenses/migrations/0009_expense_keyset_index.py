@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0008_auth_user_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_group_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', '-created_at', '-id'], name='expense_group_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.26 on 2026-10-18 02:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+from collections import defaultdict
+from decimal import Decimal
+
+
+def build_rollups(apps, schema_editor):
+    """Populate monthly rollups from existing expenses and shares"""
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseShare = apps.get_model('expenses', 'ExpenseShare')
+    MonthlyRollup = apps.get_model('expenses', 'MonthlyRollup')
+
+    totals = defaultdict(lambda: {'total_paid': Decimal('0'), 'total_share': Decimal('0'), 'unpaid_owed': Decimal('0')})
+    paid = Expense.objects.values('group_id', 'paid_by_id', month=TruncMonth('date')).annotate(total=models.Sum('amount'))
+    for row in paid.order_by():
+        totals[(row['group_id'], row['month'], row['paid_by_id'])]['total_paid'] += row['total']
+    owed = ExpenseShare.objects.values('expense__group_id', 'user_id', month=TruncMonth('expense__date')).annotate(
+        share=models.Sum('amount'),
+        unpaid=models.Sum('amount', filter=models.Q(is_paid=False) & ~models.Q(user=models.F('expense__paid_by'))),
+    )
+    for row in owed.order_by():
+        key = (row['expense__group_id'], row['month'], row['user_id'])
+        totals[key]['total_share'] += row['share']
+        totals[key]['unpaid_owed'] += row['unpaid'] or 0
+
+    MonthlyRollup.objects.bulk_create(
+        [MonthlyRollup(group_id=group_id, month=month, user_id=user_id, **values)
+         for (group_id, month, user_id), values in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('expenses', '0009_expense_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_share', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('unpaid_owed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'date'], name='expense_group_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='monthlyrollup',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='expenses.group'),
+        ),
+        migrations.AddField(
+            model_name='monthlyrollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlyrollup',
+            unique_together={('group', 'month', 'user')},
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
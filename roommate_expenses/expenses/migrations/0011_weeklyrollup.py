@@ -0,0 +1,76 @@
+# Generated by Django 4.2.26 on 2026-10-18 03:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import TruncMonth
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+
+def build_rollups(apps, schema_editor):
+    """Count expenses into the monthly rollups and populate the weekly ones"""
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseShare = apps.get_model('expenses', 'ExpenseShare')
+    MonthlyRollup = apps.get_model('expenses', 'MonthlyRollup')
+    WeeklyRollup = apps.get_model('expenses', 'WeeklyRollup')
+
+    counts = Expense.objects.values('group_id', 'paid_by_id', month=TruncMonth('date')).annotate(count=models.Count('id'))
+    for row in counts.order_by():
+        MonthlyRollup.objects.filter(
+            group_id=row['group_id'], user_id=row['paid_by_id'], month=row['month'],
+        ).update(expense_count=row['count'])
+
+    def week(day):
+        return day - timedelta(days=day.weekday())
+
+    totals = defaultdict(lambda: {'total_paid': Decimal('0'), 'total_share': Decimal('0'), 'expense_count': 0})
+    paid = Expense.objects.values('group_id', 'paid_by_id', 'date').annotate(
+        total=models.Sum('amount'), count=models.Count('id'),
+    )
+    for row in paid.order_by():
+        values = totals[(row['group_id'], week(row['date']), row['paid_by_id'])]
+        values['total_paid'] += row['total']
+        values['expense_count'] += row['count']
+    owed = ExpenseShare.objects.values('expense__group_id', 'user_id', 'expense__date').annotate(share=models.Sum('amount'))
+    for row in owed.order_by():
+        totals[(row['expense__group_id'], week(row['expense__date']), row['user_id'])]['total_share'] += row['share']
+
+    WeeklyRollup.objects.bulk_create(
+        [WeeklyRollup(group_id=group_id, week=week_start, user_id=user_id, **values)
+         for (group_id, week_start, user_id), values in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('expenses', '0010_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlyrollup',
+            name='expense_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WeeklyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('total_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total_share', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('expense_count', models.PositiveIntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_rollups', to='expenses.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'week', 'user')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,5 @@
 # expenses/models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 import uuid
 
@@ -9,10 +9,17 @@ class Group(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_groups')
     members = models.ManyToManyField(User, related_name='joined_groups', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on every write to the group's expenses, shares or members
+    version = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def bump_version(cls, group_id):
+        """Mark the group's content as changed"""
+        cls.objects.filter(pk=group_id).update(version=models.F('version') + 1)
+    
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = str(uuid.uuid4())[:8].upper()
@@ -28,29 +35,16 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s Profile"
     
     def get_balance(self, group):
-        """Calculate user's net balance within a specific group based on actual payment status"""
+        """Return user's net balance within a specific group from the balance ledger"""
         if not group:
             return 0
         
-        # What others owe this user (unpaid shares for expenses paid by this user)
-        others_owe = ExpenseShare.objects.filter(
-            expense__paid_by=self.user,
-            expense__group=group,
-            is_paid=False
-        ).exclude(user=self.user).aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
-        
-        # What this user owes to others (unpaid shares where this user is the debtor)
-        user_owes = ExpenseShare.objects.filter(
-            user=self.user,
-            expense__group=group,
-            is_paid=False
-        ).exclude(expense__paid_by=self.user).aggregate(
-            total=models.Sum('amount')
-        )['total'] or 0
+        balance = MemberBalance.objects.filter(
+            group=group,
+            user=self.user
+        ).values_list('balance', flat=True).first()
         
-        return others_owe - user_owes
+        return balance or 0
     
     def get_all_groups(self):
         """Get all groups the user is a member of"""
@@ -75,6 +69,21 @@ class Expense(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Group expense lists, newest first; id breaks ties for keyset pagination
+            models.Index(fields=['group', '-created_at', '-id'], name='expense_group_created_id_idx'),
+            # Balances and settlements grouped by payer within a group
+            models.Index(fields=['group', 'paid_by'], name='expense_group_payer_idx'),
+            # Month and date-range reports
+            models.Index(fields=['group', 'date'], name='expense_group_date_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded payer so the balance ledger can follow payer changes
+        instance._loaded_paid_by_id = instance.__dict__.get('paid_by_id')
+        return instance
     
     def get_split_amount(self):
         """Calculate amount per person"""
@@ -97,7 +106,87 @@ class ExpenseShare(models.Model):
     class Meta:
         unique_together = ('expense', 'user')
         ordering = ['user__username']
+        indexes = [
+            models.Index(fields=['user', 'is_paid'], name='share_user_paid_idx'),
+            # Only unpaid shares count towards balances; keep those lookups small
+            models.Index(fields=['expense'], condition=models.Q(is_paid=False), name='share_unpaid_expense_idx'),
+            models.Index(fields=['user'], condition=models.Q(is_paid=False), name='share_unpaid_user_idx'),
+        ]
     
     def __str__(self):
         status = "Paid" if self.is_paid else "Unpaid"
-        return f"{self.user.username} - ${self.amount} ({status})"
\ No newline at end of file
+        return f"{self.user.username} - ${self.amount} ({status})"
+    
+    def save(self, *args, **kwargs):
+        # Keep the share row and its balance ledger update in one transaction; the
+        # pre_save receiver locks the stored row in it to work out the ledger delta
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+class MemberBalance(models.Model):
+    """Persisted net balance of a user within a group, maintained from ExpenseShare writes"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='balances')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='group_balances')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('group', 'user')
+    
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}: ${self.balance}"
+
+class MonthlyRollup(models.Model):
+    """A member's totals for one month of a group's expenses, maintained from expense and share writes"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='monthly_rollups')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_rollups')
+    # First day of the month
+    month = models.DateField()
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_share = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Unpaid shares of expenses someone else paid
+    unpaid_owed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Expenses the member paid
+    expense_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('group', 'month', 'user')
+    
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}, {self.month:%B %Y}"
+
+class WeeklyRollup(models.Model):
+    """A member's totals for one week of a group's expenses, for the analytics trends"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='weekly_rollups')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='weekly_rollups')
+    # Monday of the week
+    week = models.DateField()
+    total_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total_share = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Expenses the member paid
+    expense_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('group', 'week', 'user')
+    
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}, week of {self.week:%Y-%m-%d}"
+
+class GroupEvent(models.Model):
+    """Live update queued for a group's open dashboards (EVENT_BROKER = 'database')"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=30)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'created_at'], name='groupevent_group_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} in {self.group_id} (#{self.pk})"
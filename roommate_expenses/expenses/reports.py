@@ -0,0 +1,588 @@
+# expenses/reports.py
+"""
+Background generation of group PDF reports.
+
+Rendering runs on a small thread pool outside the request/response cycle and
+writes to REPORT_ROOT/group_<id>/v<version>[_<period>].pdf, where version is
+the group's content version and period the months a report is limited to. A report is reused until an expense, share or membership
+change bumps the version. Reading a cached report marks it as used (its
+access time); when the cache grows past REPORT_CACHE_MAX_BYTES the least
+recently used reports are deleted.
+
+A report covers the group's whole history or a period of whole months. Its
+summary comes from the monthly rollups (see rollups.py); only the detailed
+expense lists read the expenses of the period.
+
+ReportLab holds the GIL while it lays out a document, so threads render one
+report at a time. With REPORT_PROCESSES set, the threads only load the data
+(as plain picklable values) and the layout runs in a process pool, one
+report per process; zip_reports() uses the same pool to build the archive
+of several groups' reports in parallel.
+"""
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Prefetch
+from django.utils.text import get_valid_filename
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+
+from . import rollups
+from .models import Group, Expense, ExpenseShare
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_jobs = {}
+_errors = {}
+_lock = threading.Lock()
+
+
+def parse_period(params):
+    """
+    The (first, last) month a report covers, from ``month=YYYY-MM`` or
+    ``from=YYYY-MM`` and/or ``to=YYYY-MM`` parameters, as first-of-month
+    dates with an open end as None; None for the whole history. Raises
+    ValueError for malformed months.
+    """
+    def month(name):
+        value = params.get(name)
+        return datetime.strptime(value, '%Y-%m').date() if value else None
+
+    if params.get('month'):
+        first = last = month('month')
+    else:
+        first, last = month('from'), month('to')
+    if first is None and last is None:
+        return None
+    if first and last and first > last:
+        raise ValueError("The period's first month is after its last")
+    return first, last
+
+
+def _period_suffix(period):
+    if period is None:
+        return ''
+    first, last = period
+    return f"_{f'{first:%Y%m}' if first else 'start'}-{f'{last:%Y%m}' if last else 'end'}"
+
+
+def _period_label(period):
+    first, last = period
+    if first == last:
+        return f'{first:%B %Y}'
+    return f"{f'{first:%B %Y}' if first else 'Start'} to {f'{last:%B %Y}' if last else 'now'}"
+
+
+def report_path(group, period=None):
+    """Location of the cached report for the group's current content version"""
+    return Path(settings.REPORT_ROOT) / f'group_{group.pk}' / f'v{group.version}{_period_suffix(period)}.pdf'
+
+
+def report_etag(group, period=None):
+    # Weak: a report re-rendered for the same version differs in its creation date
+    return f'W/"report-{group.pk}-v{group.version}{_period_suffix(period)}"'
+
+
+def report_filename(group, period=None):
+    # Group names may contain path separators and other characters unfit for file names
+    return get_valid_filename(
+        f'{group.name}_expense_report{_period_suffix(period)}_{datetime.now().strftime("%Y%m%d")}.pdf'
+    )
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.REPORT_WORKERS,
+                thread_name_prefix='group-report',
+            )
+        return _executor
+
+
+def make_process_pool(processes):
+    # Spawned rather than forked: forking a process that runs threads can deadlock the child
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def get_process_pool():
+    """Process pool rendering the PDFs, or None to render in the calling thread"""
+    global _process_pool
+    if not settings.REPORT_PROCESSES:
+        return None
+    with _lock:
+        if _process_pool is None:
+            _process_pool = make_process_pool(settings.REPORT_PROCESSES)
+        return _process_pool
+
+
+def request_report(group, period=None):
+    """
+    Return the path of the group's cached report, or None after making sure
+    a background job is rendering it.
+    """
+    path = report_path(group, period)
+    if mark_used(path):
+        return path
+
+    executor = get_executor()
+    with _lock:
+        if path not in _jobs:
+            _jobs[path] = executor.submit(_run_job, group.pk, group.version, path, period)
+    return None
+
+
+def pop_error(group, period=None):
+    """Error message of the last failed job for the group's current version, if any"""
+    with _lock:
+        return _errors.pop(report_path(group, period), None)
+
+
+def _run_job(group_id, version, path, period):
+    close_old_connections()
+    try:
+        group = Group.objects.get(pk=group_id)
+        group.version = version
+        write_report(group, path, period)
+    except Exception as e:
+        logger.exception('Error generating report for group %s', group_id)
+        with _lock:
+            _errors[path] = str(e)
+    finally:
+        with _lock:
+            _jobs.pop(path, None)
+        close_old_connections()
+
+
+def write_report(group, path, period=None):
+    """Render the report into ``path`` atomically and drop older versions"""
+    context = report_context(group, period)
+    pool = get_process_pool()
+    data = render_pdf(context) if pool is None else pool.submit(render_pdf, context).result()
+    return _store(path, data)
+
+
+def _version(path):
+    """Group version of a cached report file, or None if the name isn't one of ours"""
+    try:
+        return int(path.stem.split('_')[0][1:])
+    except ValueError:
+        return None
+
+
+def _store(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+    # Reports of the same version for other periods stay, and so do newer ones:
+    # a job for an older version may finish after the current version's job
+    version = _version(path)
+    for old in path.parent.glob('v*.pdf'):
+        old_version = _version(old)
+        if old_version is not None and old_version < version:
+            old.unlink(missing_ok=True)
+    evict(keep=path)
+    return path
+
+
+def mark_used(path):
+    """
+    Record a cache hit in the report's access time, which the eviction order
+    follows (mounts with noatime or relatime don't keep it up to date by
+    themselves). Returns False if the report isn't cached.
+    """
+    try:
+        os.utime(path, (time.time(), path.stat().st_mtime))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def evict(keep=None):
+    """Delete the least recently used reports until the cache fits REPORT_CACHE_MAX_BYTES"""
+    cached = []
+    for path in Path(settings.REPORT_ROOT).glob('group_*/v*.pdf'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        cached.append((stat.st_atime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in cached)
+    for _, size, path in sorted(cached, key=lambda item: item[0]):
+        if total <= settings.REPORT_CACHE_MAX_BYTES:
+            break
+        if path != keep:
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def load_report_data(group, period=None):
+    """Collect the expenses of the period (default: all) in a fixed number of queries"""
+    group_members = list(group.members.all())
+    expenses = Expense.objects.filter(group=group).order_by('-created_at').select_related('paid_by').prefetch_related(
+        Prefetch('shares', queryset=ExpenseShare.objects.order_by().only('expense_id', 'user_id', 'amount'))
+    )
+    if period is not None:
+        first, last = period
+        if first:
+            expenses = expenses.filter(date__gte=first)
+        if last:
+            expenses = expenses.filter(date__lt=rollups.next_month(last))
+
+    members_by_id = {member.pk: member for member in group_members}
+    user_stats = {}
+    for member in group_members:
+        user_stats[member.pk] = {
+            'total_paid': Decimal('0.00'),
+            'total_owed': Decimal('0.00'),
+            'expenses_paid': [],
+            'expenses_shared': []
+        }
+
+    total_group_expenses = Decimal('0.00')
+
+    # Process each expense
+    for expense in expenses:
+        total_group_expenses += expense.amount
+
+        # Add to the person who paid
+        if expense.paid_by_id in user_stats:
+            user_stats[expense.paid_by_id]['total_paid'] += expense.amount
+            user_stats[expense.paid_by_id]['expenses_paid'].append({
+                'title': expense.title,
+                'amount': expense.amount,
+                'date': expense.date
+            })
+
+        # Each member's share as recorded (covers both equal and custom splits)
+        for share in expense.shares.all():
+            if share.user_id in members_by_id:
+                user_stats[share.user_id]['total_owed'] += share.amount
+                user_stats[share.user_id]['expenses_shared'].append({
+                    'title': expense.title,
+                    'amount': share.amount,
+                    'date': expense.date,
+                    'paid_by': expense.paid_by.username
+                })
+
+    return group_members, user_stats, total_group_expenses
+
+
+def report_context(group, period=None):
+    """Everything the report shows, as plain values that can be sent to another process"""
+    group_members, user_stats, _ = load_report_data(group, period)
+    first, last = period or (None, None)
+    summary, months = rollups.member_totals(group, first, last)
+    return {
+        'name': group.name,
+        'code': group.code,
+        'period': _period_label(period) if period else None,
+        'members': [(member.pk, member.username) for member in group_members],
+        'user_stats': user_stats,
+        'summary': dict(summary),
+        'months': sorted(months.items()),
+        'total': sum(totals['total_paid'] for totals in summary.values()),
+    }
+
+
+def render_pdf(context):
+    """The report for a report_context() as PDF bytes; runs in the process pool"""
+    output = io.BytesIO()
+    render_report(context, output)
+    return output.getvalue()
+
+
+def build_report(group, output, period=None):
+    """Write the PDF report for a group to a file-like object"""
+    render_report(report_context(group, period), output)
+
+
+def render_report(context, output):
+    """Lay out the PDF report for a report_context() into a file-like object"""
+    group_members = context['members']
+    user_stats = context['user_stats']
+    summary = context['summary']
+    total_group_expenses = context['total']
+    no_totals = dict.fromkeys(rollups.FIELDS, Decimal('0.00'))
+
+    # Create the PDF document
+    doc = SimpleDocTemplate(output, pagesize=A4,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=18)
+
+    # Container for the 'Flowable' objects
+    story = []
+
+    # Get styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+    )
+
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=12,
+        textColor=colors.darkblue,
+    )
+
+    # Title
+    title = Paragraph(f"Expense Report - {context['name']}", title_style)
+    story.append(title)
+
+    # Report info
+    report_info = f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}<br/>"
+    if context['period']:
+        report_info += f"Period: {context['period']}<br/>"
+    report_info += f"Group Code: {context['code']}<br/>"
+    report_info += f"Total Members: {len(group_members)}"
+
+    info_para = Paragraph(report_info, styles['Normal'])
+    story.append(info_para)
+    story.append(Spacer(1, 20))
+
+    # Summary Section
+    summary_heading = Paragraph("Summary", heading_style)
+    story.append(summary_heading)
+
+    summary_data = [['Member', 'Total Paid', 'Total Share', 'Still Owes', 'Net Balance']]
+    for member_id, username in group_members:
+        totals = summary.get(member_id, no_totals)
+        net_balance = totals['total_paid'] - totals['total_share']
+        balance_str = f"${net_balance:.2f}"
+        if net_balance > 0:
+            balance_str = f"+{balance_str}"
+
+        summary_data.append([
+            username,
+            f"${totals['total_paid']:.2f}",
+            f"${totals['total_share']:.2f}",
+            f"${totals['unpaid_owed']:.2f}",
+            balance_str
+        ])
+
+    # Add total row
+    total_unpaid = sum(totals['unpaid_owed'] for totals in summary.values())
+    summary_data.append([
+        'TOTAL', f"${total_group_expenses:.2f}", f"${total_group_expenses:.2f}", f"${total_unpaid:.2f}", "$0.00"
+    ])
+
+    summary_table = Table(summary_data)
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    story.append(summary_table)
+    story.append(Spacer(1, 30))
+
+    # Month by month, when the report spans several
+    if len(context['months']) > 1:
+        story.append(Paragraph("Monthly Totals", heading_style))
+        monthly_data = [['Month', 'Member', 'Paid', 'Share', 'Still Owes']]
+        usernames = dict(group_members)
+        for month, members in context['months']:
+            for member_id, totals in members.items():
+                if member_id in usernames:
+                    monthly_data.append([
+                        month.strftime('%b %Y'),
+                        usernames[member_id],
+                        f"${totals['total_paid']:.2f}",
+                        f"${totals['total_share']:.2f}",
+                        f"${totals['unpaid_owed']:.2f}",
+                    ])
+
+        monthly_table = Table(monthly_data, repeatRows=1)
+        monthly_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ]))
+        story.append(monthly_table)
+        story.append(Spacer(1, 30))
+
+    # Detailed breakdown for each member
+    for index, (member_id, username) in enumerate(group_members):
+        stats = user_stats[member_id]
+
+        # Member heading
+        member_heading = Paragraph(f"Detailed Report - {username}", heading_style)
+        story.append(member_heading)
+
+        # Expenses paid by this member
+        if stats['expenses_paid']:
+            paid_heading = Paragraph("Expenses Paid:", styles['Heading3'])
+            story.append(paid_heading)
+
+            paid_data = [['Date', 'Description', 'Amount']]
+            for expense in stats['expenses_paid']:
+                paid_data.append([
+                    expense['date'].strftime('%m/%d/%Y'),
+                    expense['title'],
+                    f"${expense['amount']:.2f}"
+                ])
+
+            paid_table = Table(paid_data, colWidths=[1*inch, 3*inch, 1*inch])
+            paid_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),  # Right align amounts
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ]))
+
+            story.append(paid_table)
+            story.append(Spacer(1, 12))
+
+        # Expenses this member owes for
+        if stats['expenses_shared']:
+            shared_heading = Paragraph("Share of Expenses:", styles['Heading3'])
+            story.append(shared_heading)
+
+            shared_data = [['Date', 'Description', 'Paid By', 'Your Share']]
+            for expense in stats['expenses_shared']:
+                shared_data.append([
+                    expense['date'].strftime('%m/%d/%Y'),
+                    expense['title'],
+                    expense['paid_by'],
+                    f"${expense['amount']:.2f}"
+                ])
+
+            shared_table = Table(shared_data, colWidths=[0.8*inch, 2.5*inch, 1*inch, 0.8*inch])
+            shared_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgreen),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),  # Right align amounts
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ]))
+
+            story.append(shared_table)
+
+        # Member totals
+        totals_text = f"""
+        <b>Total Paid:</b> ${stats['total_paid']:.2f}<br/>
+        <b>Total Share:</b> ${stats['total_owed']:.2f}<br/>
+        <b>Net Balance:</b> ${stats['total_paid'] - stats['total_owed']:.2f}
+        """
+
+        totals_para = Paragraph(totals_text, styles['Normal'])
+        story.append(totals_para)
+
+        # Add page break except for last member
+        if index < len(group_members) - 1:
+            story.append(PageBreak())
+
+    # Build PDF
+    doc.build(story)
+
+
+def iter_reports(groups):
+    """
+    Yield (group, PDF bytes) for each group as its report is ready: cached
+    reports straight away, the others as the process pool finishes them
+    (or one after another in this thread without a pool). New reports are
+    cached.
+    """
+    pool = get_process_pool()
+    pending = {}
+    for group in groups:
+        path = report_path(group)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            pass
+        else:
+            mark_used(path)
+            yield group, data
+            continue
+        context = report_context(group)
+        if pool is None:
+            data = render_pdf(context)
+            _store(path, data)
+            yield group, data
+        else:
+            pending[pool.submit(render_pdf, context)] = group
+
+    for future in as_completed(pending):
+        group = pending[future]
+        data = future.result()
+        _store(report_path(group), data)
+        yield group, data
+
+
+class _ZipStream:
+    """Write-only file for ZipFile whose output is taken piece by piece"""
+
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.pieces)
+        self.pieces.clear()
+        return data
+
+
+def zip_reports(groups):
+    """Yield a ZIP archive of the groups' reports, each entry as soon as its report is ready"""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for group, data in iter_reports(groups):
+            # Group names need not be unique
+            archive.writestr(f'{group.pk}_{report_filename(group)}', data)
+            yield stream.take()
+    yield stream.take()
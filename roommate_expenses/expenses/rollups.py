@@ -0,0 +1,272 @@
+# expenses/rollups.py
+"""
+Per group, member and month (or week) totals behind the PDF report
+summaries and the analytics page.
+
+A MonthlyRollup row holds what a member paid in a calendar month (by
+Expense.date) and in how many expenses, their share of that month's
+expenses and how much of it they still owe others; a WeeklyRollup row the
+same for a week starting on Monday, without the unpaid total. Every write
+path that changes expenses or shares refreshes the rollups of the months and
+weeks it touched: two aggregate queries by day over those periods only,
+summed into both tables. That re-aggregates every expense of those months
+and weeks, so a single write costs as much as its month holds; bulk imports
+use add() instead, which aggregates only the inserted expenses. Shares that are only marked paid or unpaid (the
+common case) move their member's unpaid total with a single UPDATE. A
+report or chart reads a handful of rollup rows instead of aggregating the
+group's whole history.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+
+from .ledger import to_cents
+from .models import Group, Expense, ExpenseShare, MonthlyRollup, WeeklyRollup
+
+FIELDS = ('total_paid', 'total_share', 'unpaid_owed')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def next_week(week):
+    return week + timedelta(weeks=1)
+
+
+# (rollup model, its period field, first day of the period holding a date,
+# first day of the next period, fields)
+TABLES = (
+    (MonthlyRollup, 'month', month_start, next_month, FIELDS + ('expense_count',)),
+    (WeeklyRollup, 'week', week_start, next_week, ('total_paid', 'total_share', 'expense_count')),
+)
+
+
+def _zero(fields):
+    return {field: 0 if field == 'expense_count' else Decimal('0') for field in fields}
+
+
+def compute(expenses, shares):
+    """
+    Totals of the given expense and share querysets per day, as
+    {(group_id, date, user_id): {field: value}}
+    """
+    totals = defaultdict(lambda: _zero(FIELDS + ('expense_count',)))
+    paid = expenses.values('group_id', 'paid_by_id', 'date').annotate(total=Sum('amount'), count=Count('id'))
+    for row in paid.order_by():
+        values = totals[(row['group_id'], row['date'], row['paid_by_id'])]
+        values['total_paid'] += row['total']
+        values['expense_count'] += row['count']
+
+    owed = shares.values('expense__group_id', 'user_id', 'expense__date').annotate(
+        share=Sum('amount'),
+        # What the ledger counts against the member: unpaid, and not their own expense
+        unpaid=Sum('amount', filter=Q(is_paid=False) & ~Q(user=F('expense__paid_by'))),
+    )
+    for row in owed.order_by():
+        values = totals[(row['expense__group_id'], row['expense__date'], row['user_id'])]
+        values['total_share'] += row['share']
+        values['unpaid_owed'] += row['unpaid'] or 0
+    return totals
+
+
+def summarize(daily, period_start, fields, periods=None):
+    """Sum compute() totals into {(group_id, period, user_id): {field: value}}, optionally only of ``periods``"""
+    totals = defaultdict(lambda: _zero(fields))
+    for (group_id, day, user_id), values in daily.items():
+        period = period_start(day)
+        if periods is None or period in periods:
+            summed = totals[(group_id, period, user_id)]
+            for field in fields:
+                summed[field] += values[field]
+    return totals
+
+
+def _write(model, period_field, totals):
+    model.objects.bulk_create([
+        model(group_id=group_id, user_id=user_id, **{period_field: period}, **{
+            field: value if field == 'expense_count' else to_cents(value) for field, value in values.items()
+        })
+        for (group_id, period, user_id), values in totals.items()
+    ], batch_size=1000)
+
+
+def _in_periods(periods, field='date'):
+    """Q matching ``field`` dates within any of the {model: period starts}"""
+    query = Q()
+    for model, _, _, period_end, _ in TABLES:
+        for start in periods[model]:
+            query |= Q(**{f'{field}__gte': start, f'{field}__lt': period_end(start)})
+    return query
+
+
+def refresh(group_id, days):
+    """Recompute the group's rollups for the months and weeks of the given dates"""
+    days = set(days)
+    if not days:
+        return
+    periods = {model: {period_start(day) for day in days} for model, _, period_start, _, _ in TABLES}
+    with transaction.atomic(savepoint=False):
+        # Writers to the same group take turns here, so none of them computes
+        # totals that miss another's uncommitted change or collides with its rows
+        list(Group.objects.select_for_update().filter(pk=group_id).values_list('pk', flat=True))
+        daily = compute(
+            Expense.objects.filter(_in_periods(periods), group_id=group_id),
+            ExpenseShare.objects.filter(_in_periods(periods, 'expense__date'), expense__group_id=group_id),
+        )
+        for model, period_field, period_start, _, fields in TABLES:
+            model.objects.filter(group_id=group_id, **{f'{period_field}__in': periods[model]}).delete()
+            _write(model, period_field, summarize(daily, period_start, fields, periods[model]))
+
+
+def add(group_id, expense_ids):
+    """
+    Add the totals of newly inserted expenses and their shares to the group's
+    rollups. Unlike refresh(), only those expenses are aggregated, so a bulk
+    import's cost per chunk does not grow with what earlier chunks inserted.
+    """
+    if not expense_ids:
+        return
+    with transaction.atomic(savepoint=False):
+        list(Group.objects.select_for_update().filter(pk=group_id).values_list('pk', flat=True))
+        daily = compute(
+            Expense.objects.filter(pk__in=expense_ids),
+            ExpenseShare.objects.filter(expense_id__in=expense_ids),
+        )
+        for model, period_field, period_start, _, fields in TABLES:
+            totals = summarize(daily, period_start, fields)
+            existing = model.objects.filter(
+                group_id=group_id, **{f'{period_field}__in': {period for _, period, _ in totals}}
+            )
+            to_update = []
+            for row in existing:
+                values = totals.pop((group_id, getattr(row, period_field), row.user_id), None)
+                if values is None:
+                    continue
+                for field, value in values.items():
+                    setattr(row, field, getattr(row, field) + (value if field == 'expense_count' else to_cents(value)))
+                to_update.append(row)
+            model.objects.bulk_update(to_update, fields, batch_size=1000)
+            _write(model, period_field, totals)
+
+
+def unpaid_amount(payer_id, state):
+    """What a share (as ledger.share_state()) adds to its member's unpaid_owed"""
+    if state is None:
+        return Decimal('0')
+    user_id, amount, is_paid = state
+    return amount if not is_paid and user_id != payer_id else Decimal('0')
+
+
+def add_unpaid(group_id, deltas):
+    """
+    Apply {(date, user_id): amount} changes to unpaid_owed in one UPDATE, for
+    shares that were only marked paid or unpaid; their rows already exist
+    """
+    totals = defaultdict(Decimal)
+    for (day, user_id), amount in deltas.items():
+        totals[(month_start(day), user_id)] += amount
+    totals = {key: amount for key, amount in totals.items() if amount}
+    if not totals:
+        return
+    match = Q()
+    for month, user_id in totals:
+        match |= Q(month=month, user_id=user_id)
+    MonthlyRollup.objects.filter(match, group_id=group_id).update(
+        unpaid_owed=F('unpaid_owed') + Case(
+            *[When(month=month, user_id=user_id, then=Value(amount)) for (month, user_id), amount in totals.items()],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
+
+
+def refresh_expense(expense_id):
+    """refresh() for the month of one expense, if it still exists"""
+    row = Expense.objects.filter(pk=expense_id).values_list('group_id', 'date').first()
+    if row is not None:
+        refresh(row[0], [row[1]])
+
+
+def member_totals(group, first=None, last=None):
+    """
+    {user_id: {field: Decimal}} summed over the months from ``first`` to
+    ``last`` (dates within the first and last month, both optional), and
+    {month: {user_id: {field: Decimal}}} for the same months
+    """
+    rows = MonthlyRollup.objects.filter(group=group)
+    if first:
+        rows = rows.filter(month__gte=month_start(first))
+    if last:
+        rows = rows.filter(month__lte=month_start(last))
+
+    totals = defaultdict(lambda: dict.fromkeys(FIELDS, Decimal('0')))
+    months = defaultdict(dict)
+    for row in rows.order_by('month').values('month', 'user_id', *FIELDS):
+        for field in FIELDS:
+            totals[row['user_id']][field] += row[field]
+        months[row['month']][row['user_id']] = {field: row[field] for field in FIELDS}
+    return totals, months
+
+
+def _rows(model, group_ids=None):
+    rows = model.objects.all()
+    if group_ids is not None:
+        rows = rows.filter(group_id__in=group_ids)
+    return rows
+
+
+def stored(model, period_field, fields, group_ids=None):
+    return {
+        (row['group_id'], row[period_field], row['user_id']): {field: row[field] for field in fields}
+        for row in _rows(model, group_ids).values('group_id', period_field, 'user_id', *fields)
+    }
+
+
+def _all(group_ids=None):
+    expenses = Expense.objects.all()
+    shares = ExpenseShare.objects.all()
+    if group_ids is not None:
+        expenses = expenses.filter(group_id__in=group_ids)
+        shares = shares.filter(expense__group_id__in=group_ids)
+    return compute(expenses, shares)
+
+
+def find_mismatches(group_ids=None):
+    """List of ((group_id, period field, period, user_id), stored, expected) rollups that disagree"""
+    daily = _all(group_ids)
+    mismatches = []
+    for model, period_field, period_start, _, fields in TABLES:
+        expected = summarize(daily, period_start, fields)
+        have = stored(model, period_field, fields, group_ids)
+        zero = _zero(fields)
+        for group_id, period, user_id in set(expected) | set(have):
+            key = (group_id, period, user_id)
+            want = {field: to_cents(value) for field, value in expected.get(key, zero).items()}
+            got = {field: to_cents(value) for field, value in have.get(key, zero).items()}
+            if want != got:
+                mismatches.append(((group_id, period_field, period, user_id), got, want))
+    return mismatches
+
+
+@transaction.atomic
+def rebuild(group_ids=None):
+    """Replace monthly and weekly rollup rows with freshly computed ones. Returns rows written."""
+    daily = _all(group_ids)
+    written = 0
+    for model, period_field, period_start, _, fields in TABLES:
+        _rows(model, group_ids).delete()
+        totals = summarize(daily, period_start, fields)
+        _write(model, period_field, totals)
+        written += len(totals)
+    return written
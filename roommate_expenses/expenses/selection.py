@@ -0,0 +1,26 @@
+# expenses/selection.py
+"""
+The group a user is looking at, remembered in their session.
+
+Writing a session key marks the session modified, and with the database
+session backend that means an UPDATE at the end of the request even when
+the value is the same. The selection is therefore stored only when it
+actually changes, so plain dashboard views don't write anything.
+"""
+SESSION_KEY = 'selected_group_id'
+
+
+def selected_group_id(request):
+    """The group picked with ?group=, else the one remembered in the session"""
+    return request.GET.get('group') or request.session.get(SESSION_KEY)
+
+
+def remember_selected_group(request, group_id):
+    if request.session.get(SESSION_KEY) != group_id:
+        request.session[SESSION_KEY] = group_id
+
+
+def forget_selected_group(request, group_id):
+    """Drop the remembered selection if it is ``group_id`` (e.g. after leaving the group)"""
+    if request.session.get(SESSION_KEY) == group_id:
+        del request.session[SESSION_KEY]
@@ -0,0 +1,56 @@
+# expenses/settlement.py
+"""
+Debt simplification for the "who owes whom" list.
+
+Instead of one row per unpaid ExpenseShare, members settle their net
+balances: the largest debtor repeatedly pays the largest creditor until
+everyone is at zero. With m members this needs at most m - 1 transfers and
+runs in O(m log m) using two heaps.
+"""
+import heapq
+from decimal import Decimal
+
+from .models import MemberBalance
+
+CENTS = Decimal('100')
+
+
+def simplify_debts(balances):
+    """
+    Turn net balances ({member: Decimal}, positive = is owed money) into a
+    list of (debtor, creditor, amount) transfers that settle everyone.
+    """
+    creditors = []
+    debtors = []
+    for member, balance in balances.items():
+        cents = int((Decimal(balance) * CENTS).to_integral_value())
+        if cents > 0:
+            creditors.append((-cents, str(member), member))
+        elif cents < 0:
+            debtors.append((cents, str(member), member))
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, credit_key, creditor = heapq.heappop(creditors)
+        debt, debt_key, debtor = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append((debtor, creditor, (Decimal(amount) / CENTS).quantize(Decimal('0.01'))))
+
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, credit_key, creditor))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debt_key, debtor))
+    return transfers
+
+
+def group_settlements(group):
+    """Simplified transfers for a group, read from the balance ledger in one query"""
+    balances = dict(
+        MemberBalance.objects.filter(group=group).exclude(balance=0).values_list('user__username', 'balance')
+    )
+    return [
+        {'from_user': debtor, 'to_user': creditor, 'amount': amount}
+        for debtor, creditor, amount in simplify_debts(balances)
+    ]
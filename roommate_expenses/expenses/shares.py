@@ -0,0 +1,122 @@
+# expenses/shares.py
+"""
+Bulk maintenance of an expense's ExpenseShare rows.
+
+Adding or editing an expense shared by N people costs a fixed number of
+statements: shares are read once, written with bulk_update/bulk_create, and
+the balance ledger and group version are updated once for the whole expense.
+Settling up marks any number of a group's shares paid the same way.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, ledger, rollups
+from .models import Group, Expense, ExpenseShare
+
+
+def equal_split(expense):
+    """{user_id: amount} for an equal split over the expense's shared_among users"""
+    user_ids = list(expense.shared_among.values_list('pk', flat=True))
+    if not user_ids:
+        return {}
+    amount_per_person = expense.amount / len(user_ids)
+    return dict.fromkeys(user_ids, amount_per_person)
+
+
+def sync_expense_shares(expense, amounts=None, reset_paid=True):
+    """
+    Make the expense's shares match ``amounts`` ({user_id: amount}), or an
+    equal split over shared_among when amounts is None. Shares of users that
+    are no longer included are deleted. With reset_paid, only the payer's
+    share stays marked as paid.
+    """
+    with transaction.atomic(), ledger.suspended(expense.pk):
+        # Concurrent syncs of the same expense take turns, so the ledger deltas
+        # below are computed from the shares that are really there
+        list(Expense.objects.select_for_update().filter(pk=expense.pk).values_list('pk', flat=True))
+        if amounts is None:
+            amounts = equal_split(expense)
+
+        payer_id = expense.paid_by_id
+        deltas = defaultdict(Decimal)
+        existing = {share.user_id: share for share in expense.shares.order_by()}
+
+        stale = [share for user_id, share in existing.items() if user_id not in amounts]
+        for share in stale:
+            ledger.merge_deltas(deltas, ledger.share_deltas(payer_id, ledger.share_state(share)), sign=-1)
+
+        to_update = []
+        to_create = []
+        for user_id, amount in amounts.items():
+            share = existing.get(user_id)
+            if share is None:
+                share = ExpenseShare(expense=expense, user_id=user_id, amount=amount, is_paid=(user_id == payer_id))
+                to_create.append(share)
+            else:
+                ledger.merge_deltas(deltas, ledger.share_deltas(payer_id, ledger.share_state(share)), sign=-1)
+                share.amount = amount
+                if reset_paid:
+                    share.is_paid = (user_id == payer_id)
+                    if not share.is_paid:
+                        share.paid_at = None
+                to_update.append(share)
+            ledger.merge_deltas(deltas, ledger.share_deltas(payer_id, ledger.share_state(share)))
+
+        if stale:
+            ExpenseShare.objects.filter(pk__in=[share.pk for share in stale]).delete()
+        if to_update:
+            ExpenseShare.objects.bulk_update(to_update, ['amount', 'is_paid', 'paid_at'])
+        if to_create:
+            ExpenseShare.objects.bulk_create(to_create)
+
+        ledger.apply_deltas(expense.group_id, deltas)
+        if stale or to_update or to_create:
+            rollups.refresh(expense.group_id, [expense.date])
+            Group.bump_version(expense.group_id)
+
+
+def delete_expense_shares(expense):
+    """Delete all of the expense's shares and reverse them in the ledger"""
+    sync_expense_shares(expense, amounts={})
+
+
+def settle_shares(group_id, share_ids=None, debtor_id=None, creditor_id=None):
+    """
+    Mark the group's unpaid shares paid in one UPDATE: either the given
+    share ids, or every share the debtor owes on expenses the creditor paid.
+    Returns the number of shares settled.
+    """
+    unpaid = ExpenseShare.objects.filter(expense__group_id=group_id, is_paid=False)
+    if share_ids is not None:
+        unpaid = unpaid.filter(pk__in=share_ids)
+    else:
+        unpaid = unpaid.filter(user_id=debtor_id, expense__paid_by_id=creditor_id)
+
+    with transaction.atomic():
+        # Lock the rows so the ledger deltas match exactly what the UPDATE changes
+        rows = list(
+            unpaid.select_for_update(of=('self',)).order_by()
+            .values_list('pk', 'user_id', 'amount', 'expense_id', 'expense__paid_by_id', 'expense__date')
+        )
+        if not rows:
+            return 0
+
+        settled = ExpenseShare.objects.filter(pk__in=[row[0] for row in rows], is_paid=False).update(
+            is_paid=True, paid_at=timezone.now()
+        )
+
+        deltas = defaultdict(Decimal)
+        unpaid = defaultdict(Decimal)
+        for _, user_id, amount, _, payer_id, day in rows:
+            state = (user_id, ledger.to_cents(amount), False)
+            ledger.merge_deltas(deltas, ledger.share_deltas(payer_id, state), sign=-1)
+            unpaid[(day, user_id)] -= rollups.unpaid_amount(payer_id, state)
+        ledger.apply_deltas(group_id, deltas)
+        rollups.add_unpaid(group_id, unpaid)
+        Group.bump_version(group_id)
+        events.notify_shares_settled(group_id, {row[3] for row in rows})
+
+    return settled
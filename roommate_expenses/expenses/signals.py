@@ -1,8 +1,11 @@
 # expenses/signals.py
-from django.db.models.signals import post_save, m2m_changed, pre_save
+from django.db.models.signals import post_save, m2m_changed, pre_save, pre_delete, post_delete
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import UserProfile, Expense, ExpenseShare
+from django.db.models import F
+from .models import UserProfile, Group, Expense, ExpenseShare
+from . import events, ledger, rollups
+from .shares import sync_expense_shares, delete_expense_shares
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -10,55 +13,34 @@ def create_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.get_or_create(user=instance)
 
-@receiver(post_save, sender=User)
-def save_profile(sender, instance, created, **kwargs):
-    """Update UserProfile when User is updated"""
-    if created:
-        # Skip for new users - create_profile signal handles this
-        return
-    try:
-        profile = UserProfile.objects.get(user=instance)
-        profile.save()
-    except UserProfile.DoesNotExist:
-        # Create profile if it doesn't exist
-        UserProfile.objects.create(user=instance)
-
 @receiver(m2m_changed, sender=Expense.shared_among.through)
 def create_expense_shares(sender, instance, action, pk_set, **kwargs):
-    """Automatically create ExpenseShare records when users are added to shared_among"""
+    """Keep ExpenseShare records in line with shared_among, in a fixed number of statements"""
+    if not isinstance(instance, Expense):
+        # Changed from the user side (user.shared_expenses.add(...)); not used by the app
+        return
     if action == "post_add":
         # Only auto-create equal shares when expense is set to equal split
         if getattr(instance, 'split_method', 'equal') != 'equal':
             return
-        num_people = instance.shared_among.count()
-        if num_people > 0:
-            amount_per_person = instance.amount / num_people
-            
-            # Update or create shares for all users
-            for user in instance.shared_among.all():
-                ExpenseShare.objects.update_or_create(
-                    expense=instance,
-                    user=user,
-                    defaults={
-                        'amount': amount_per_person,
-                        'is_paid': (user == instance.paid_by)
-                    }
-                )
+        sync_expense_shares(instance)
     elif action == "post_remove":
         # Only recalc equal split shares
         if getattr(instance, 'split_method', 'equal') != 'equal':
             return
-        # Recalculate amounts for remaining users
-        num_people = instance.shared_among.count()
-        if num_people > 0:
-            amount_per_person = instance.amount / num_people
-            
-            for share in instance.shares.all():
-                share.amount = amount_per_person
-                share.save()
+        # Drop removed users' shares and recalculate amounts for remaining users
+        sync_expense_shares(instance, reset_paid=False)
     elif action == "post_clear":
         # Delete all shares if all users are removed
-        instance.shares.all().delete()
+        delete_expense_shares(instance)
+
+@receiver(post_save, sender=Expense)
+def move_balances_on_payer_change(sender, instance, created, **kwargs):
+    """Re-attribute outstanding shares in the balance ledger when paid_by changes"""
+    old_payer_id = getattr(instance, '_loaded_paid_by_id', None)
+    if not created and old_payer_id is not None and old_payer_id != instance.paid_by_id:
+        ledger.reassign_payer(instance, old_payer_id)
+    instance._loaded_paid_by_id = instance.paid_by_id
 
 @receiver(post_save, sender=Expense)
 def update_expense_shares_on_amount_change(sender, instance, created, **kwargs):
@@ -67,20 +49,116 @@ def update_expense_shares_on_amount_change(sender, instance, created, **kwargs):
         # Skip automatic recalculation for custom splits
         if getattr(instance, 'split_method', 'equal') != 'equal':
             return
-        # Get all existing shares for this expense
-        shares = instance.shares.all()
-        num_people = shares.count()
-        
-        if num_people > 0:
-            amount_per_person = instance.amount / num_people
-            
-            # Update all share amounts and payment status
-            for share in shares:
-                share.amount = amount_per_person
-                # Only the payer should be marked as paid, others reset to unpaid
-                if share.user == instance.paid_by:
-                    share.is_paid = True
-                else:
-                    share.is_paid = False
-                    share.paid_at = None
-                share.save()
\ No newline at end of file
+        # Only the payer should be marked as paid, others reset to unpaid
+        sync_expense_shares(instance)
+
+@receiver(post_save, sender=Expense)
+def refresh_rollups_on_custom_split_save(sender, instance, created, **kwargs):
+    """
+    Equal splits are re-synced (and their month's rollups refreshed) by the
+    receiver above; a custom split's payer or amount can change without that
+    """
+    if not created and getattr(instance, 'split_method', 'equal') != 'equal':
+        rollups.refresh(instance.group_id, [instance.date])
+
+@receiver(post_delete, sender=Expense)
+def refresh_rollups_on_expense_delete(sender, instance, origin=None, **kwargs):
+    # A deleted group takes its rollups with it
+    if isinstance(origin, Group) or getattr(origin, 'model', None) is Group:
+        return
+    rollups.refresh(instance.group_id, [instance.date])
+
+@receiver(pre_save, sender=ExpenseShare)
+def load_share_ledger_state(sender, instance, **kwargs):
+    """
+    Lock the share's stored row and take the ledger delta from it, not from the
+    instance as it was loaded: two requests toggling the same share would
+    otherwise both apply the change
+    """
+    if ledger.is_suspended(instance.expense_id):
+        return
+    stored = None
+    if instance.pk:
+        stored = ExpenseShare.objects.select_for_update().filter(pk=instance.pk).first()
+    instance._ledger_state = ledger.share_state(stored) if stored else None
+
+@receiver(post_save, sender=ExpenseShare)
+def update_balances_on_share_save(sender, instance, created, **kwargs):
+    """Apply the share's change in contribution to the balance ledger"""
+    if ledger.is_suspended(instance.expense_id):
+        return
+    old_state = None if created else getattr(instance, '_ledger_state', None)
+    ledger.record_share_change(instance, old_state)
+    instance._ledger_state = ledger.share_state(instance)
+    expense = instance.expense
+    if old_state is not None and old_state[:2] == instance._ledger_state[:2]:
+        # Only marked paid or unpaid: just the member's unpaid total moves
+        rollups.add_unpaid(expense.group_id, {(expense.date, instance.user_id): (
+            rollups.unpaid_amount(expense.paid_by_id, instance._ledger_state)
+            - rollups.unpaid_amount(expense.paid_by_id, old_state)
+        )})
+    else:
+        rollups.refresh(expense.group_id, [expense.date])
+    Group.bump_version(expense.group_id)
+
+@receiver(post_delete, sender=ExpenseShare)
+def update_balances_on_share_delete(sender, instance, **kwargs):
+    """Remove a deleted share's contribution from the balance ledger"""
+    if ledger.is_suspended(instance.expense_id):
+        return
+    ledger.record_share_delete(instance)
+    rollups.refresh_expense(instance.expense_id)
+    Group.objects.filter(expenses=instance.expense_id).update(version=F('version') + 1)
+
+@receiver(pre_delete, sender=Expense)
+def detach_expense_balances(sender, instance, **kwargs):
+    """Reverse the whole expense in the ledger before its shares are cascade-deleted"""
+    ledger.detach_expense(instance)
+
+@receiver(post_delete, sender=Expense)
+def release_expense_balances(sender, instance, **kwargs):
+    ledger.release_expense(instance.pk)
+
+@receiver(post_save, sender=Expense)
+def bump_group_version_on_expense_save(sender, instance, **kwargs):
+    Group.bump_version(instance.group_id)
+
+@receiver(post_delete, sender=Expense)
+def bump_group_version_on_expense_delete(sender, instance, **kwargs):
+    Group.bump_version(instance.group_id)
+
+@receiver(post_save, sender=ExpenseShare)
+def publish_share_change(sender, instance, **kwargs):
+    """Tell open dashboards that a share was marked paid or unpaid"""
+    if ledger.is_suspended(instance.expense_id):
+        # Bulk share changes come with an expense save, which publishes the whole row
+        return
+    events.notify_share_changed(instance, instance.expense.group_id)
+
+@receiver(post_delete, sender=ExpenseShare)
+def publish_share_delete(sender, instance, **kwargs):
+    if ledger.is_suspended(instance.expense_id):
+        return
+    group_id = Group.objects.filter(expenses=instance.expense_id).values_list('pk', flat=True).first()
+    if group_id is not None:
+        events.notify_expense_changed(instance.expense_id, group_id)
+
+@receiver(post_save, sender=Expense)
+def publish_expense_save(sender, instance, **kwargs):
+    events.notify_expense_changed(instance.pk, instance.group_id)
+
+@receiver(post_delete, sender=Expense)
+def publish_expense_delete(sender, instance, **kwargs):
+    events.notify_expense_deleted(instance.pk, instance.group_id)
+
+@receiver(m2m_changed, sender=Group.members.through)
+def bump_group_version_on_member_change(sender, instance, action, pk_set, **kwargs):
+    """Membership changes alter balances shown and report contents"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Group):
+        Group.bump_version(instance.pk)
+    else:
+        # Changed from the user side (user.joined_groups.add(...))
+        for group_id in pk_set or ():
+            Group.bump_version(group_id)
\ No newline at end of file
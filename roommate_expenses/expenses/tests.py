@@ -1,3 +1,1510 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock, skipUnless
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User, update_last_login
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import OperationalError
+from django.http import JsonResponse
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, async_views, dashboard, exporter, importer, ledger, membership, reports, rollups
+from .middleware import QueryBudgetExceeded, QueryTimingMiddleware
+from .models import Group, GroupEvent, Expense, ExpenseShare, MemberBalance
+from .settlement import group_settlements, simplify_debts
+from .shares import sync_expense_shares
+from roommate_expenses.postgresql_pool.base import ConnectionPool
+
+
+def create_group_with_members(num_members=3):
+    # Membership answers are cached by group and user id, which are reused between tests
+    caches['default'].clear()
+    members = [
+        User.objects.create_user(f'member{i}', f'member{i}@example.com', 'testpass123')
+        for i in range(num_members)
+    ]
+    group = Group.objects.create(name='Flat', created_by=members[0])
+    group.members.add(*members)
+    return group, members
+
+
+def bulk_create_expenses(group, members, count, amount=Decimal('30.00')):
+    """Create equal-split expenses and their shares without going through the signals"""
+    expenses = Expense.objects.bulk_create([
+        Expense(title=f'Expense {i}', amount=amount, paid_by=members[i % len(members)], group=group)
+        for i in range(count)
+    ])
+    share_amount = amount / len(members)
+    ExpenseShare.objects.bulk_create([
+        ExpenseShare(expense=expense, user=member, amount=share_amount, is_paid=(member == expense.paid_by))
+        for expense in expenses
+        for member in members
+    ])
+    rollups.refresh(group.pk, {expense.date for expense in expenses})
+    Group.bump_version(group.pk)
+    group.refresh_from_db(fields=['version'])
+    return expenses
+
+
+def query_budget(**budgets):
+    """
+    Fail a test (class) when a request runs more queries than the QUERY_BUDGETS
+    entry for its URL name; keyword arguments override single budgets
+    """
+    return override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, **budgets}, QUERY_BUDGET_STRICT=True)
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DashboardQueryCountTests(TestCase):
+    def setUp(self):
+        caches[dashboard.CACHE_ALIAS].clear()
+        self.group, self.members = create_group_with_members()
+        self.client.force_login(self.members[0])
+
+    def count_dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), {'group': self.group.id})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_is_constant_as_expenses_grow(self):
+        bulk_create_expenses(self.group, self.members, 10)
+        # The first view stores the group selection in the session; later ones don't write
+        self.count_dashboard_queries()
+        caches[dashboard.CACHE_ALIAS].clear()
+        small_count, _ = self.count_dashboard_queries()
+
+        bulk_create_expenses(self.group, self.members, 10000 - 10)
+        large_count, response = self.count_dashboard_queries()
+
+        self.assertEqual(Expense.objects.filter(group=self.group).count(), 10000)
+        self.assertEqual(small_count, large_count)
+        # Only the first page is rendered
+        self.assertEqual(len(response.context['expenses']), settings.DASHBOARD_PAGE_SIZE)
+        self.assertTrue(response.context['next_cursor'])
+
+    def test_expense_payment_statistics(self):
+        expense = bulk_create_expenses(self.group, self.members, 1)[0]
+        ExpenseShare.objects.filter(expense=expense, user=self.members[1]).update(is_paid=True)
+
+        _, response = self.count_dashboard_queries()
+        row = response.context['expenses'][0]
+        self.assertEqual(row.total_count, 3)
+        self.assertEqual(row.paid_count, 2)
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        caches[dashboard.CACHE_ALIAS].clear()
+        dashboard.reset_cache_stats()
+        self.group, self.members = create_group_with_members()
+        bulk_create_expenses(self.group, self.members, 5)
+        ledger.rebuild()
+        self.client.force_login(self.members[0])
+
+    def get_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), {'group': self.group.id})
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_unchanged_group_is_served_from_cache(self):
+        _, miss_queries = self.get_dashboard()
+        response, hit_queries = self.get_dashboard()
+
+        self.assertEqual(dashboard.cache_stats(), {'hits': 1, 'misses': 1})
+        self.assertLess(hit_queries, miss_queries)
+        self.assertEqual(len(response.context['expenses']), 5)
+
+    def test_payment_toggle_invalidates_cached_data(self):
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.context['member_balances']['member1'], Decimal('10.00'))
+        share = ExpenseShare.objects.get(expense__title='Expense 0', user=self.members[1])
+        self.client.post(reverse('toggle_payment_status', args=[share.pk]))
+
+        response, _ = self.get_dashboard()
+        self.assertEqual(dashboard.cache_stats(), {'hits': 0, 'misses': 2})
+        self.assertEqual(response.context['member_balances']['member1'], Decimal('20.00'))
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False)
+class GroupDashboardApiTests(TestCase):
+    def setUp(self):
+        caches[dashboard.CACHE_ALIAS].clear()
+        self.group, self.members = create_group_with_members()
+        bulk_create_expenses(self.group, self.members, 3)
+        ledger.rebuild()
+        self.client.force_login(self.members[0])
+        self.url = reverse('group_dashboard_api', args=[self.group.id])
+
+    def test_returns_expenses_balances_and_debts(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"group-{self.group.id}-v{self.group.version}"')
+        data = response.json()
+        self.assertEqual(len(data['expenses']), 3)
+        self.assertEqual(data['balances'], {'member0': '0.00', 'member1': '0.00', 'member2': '0.00'})
+        self.assertEqual(data['debts'], [])
+
+    def test_unchanged_group_returns_304_without_reading_expenses(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries if 'expenses_expense' in query['sql']])
+
+        share = ExpenseShare.objects.filter(is_paid=False).first()
+        self.client.post(reverse('toggle_payment_status', args=[share.pk]))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_gzip_has_its_own_etag(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].endswith('-gzip"'))
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['expenses']), 3)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_non_member_is_denied(self):
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'testpass123')
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        caches[dashboard.CACHE_ALIAS].clear()
+        self.group, self.members = create_group_with_members()
+        self.expenses = bulk_create_expenses(self.group, self.members, 4)
+        ledger.rebuild()
+        self.factory = AsyncRequestFactory()
+
+    def request(self, method, path, user, data=None):
+        request = getattr(self.factory, method)(path, data or {})
+        request.user = user
+        request.session = SessionStore()
+        return request
+
+    async def test_async_dashboard_data_matches_sync(self):
+        sync_data = await sync_to_async(dashboard.compute_dashboard_data)(self.group)
+        async_data = await dashboard.acompute_dashboard_data(self.group)
+
+        self.assertEqual([e.pk for e in async_data['expenses']], [e.pk for e in sync_data['expenses']])
+        self.assertEqual(async_data['member_balances'], sync_data['member_balances'])
+        self.assertEqual(async_data['debts'], sync_data['debts'])
+
+    async def test_dashboard_and_expense_detail_render(self):
+        request = self.request('get', '/expenses/', self.members[0], {'group': self.group.id})
+        response = await async_views.dashboard(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.session['selected_group_id'], self.group.id)
+
+        request = self.request('get', '/expenses/expense/', self.members[0])
+        response = await async_views.expense_detail(request, pk=self.expenses[0].pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'member2')
+
+    async def test_toggle_payment_status_updates_ledger(self):
+        share = await ExpenseShare.objects.aget(expense=self.expenses[0], user=self.members[1])
+        request = self.request('post', '/expenses/toggle-payment/', self.members[1])
+        response = await async_views.toggle_payment_status(request, share_id=share.pk)
+
+        self.assertEqual(response.status_code, 200)
+        await share.arefresh_from_db()
+        self.assertTrue(share.is_paid)
+        self.assertEqual(await sync_to_async(ledger.find_mismatches)(), [])
+
+    async def test_toggle_payment_status_denies_non_member(self):
+        outsider = await User.objects.acreate(username='outsider')
+        share = await ExpenseShare.objects.filter(is_paid=False).afirst()
+        request = self.request('post', '/expenses/toggle-payment/', outsider)
+        response = await async_views.toggle_payment_status(request, share_id=share.pk)
+        self.assertEqual(response.status_code, 403)
+
+
+class GroupEventTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.expense = bulk_create_expenses(self.group, self.members, 1)[0]
+        ledger.rebuild()
+        self.factory = AsyncRequestFactory()
+
+    async def open_stream(self, user, last_event_id=None):
+        headers = {'Last-Event-ID': str(last_event_id)} if last_event_id else {}
+        request = self.factory.get('/expenses/group-events/', headers=headers)
+        request.user = user
+        response = await async_views.group_events(request, group_id=self.group.id)
+        self.assertEqual(response.status_code, 200)
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        return stream
+
+    async def next_event(self, stream):
+        chunk = (await asyncio.wait_for(anext(stream), timeout=5)).decode()
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+    def toggle(self, username):
+        share = ExpenseShare.objects.get(expense=self.expense, user__username=username)
+        share.is_paid = not share.is_paid
+        with self.captureOnCommitCallbacks(execute=True):
+            share.save()
+
+    async def test_share_toggle_is_pushed_with_balances(self):
+        stream = await self.open_stream(self.members[1])
+        await sync_to_async(self.toggle)('member1')
+
+        kind, data = await self.next_event(stream)
+        self.assertEqual(kind, 'share')
+        self.assertTrue(data['share']['is_paid'])
+        self.assertEqual(data['expense']['shares_paid'], 2)
+        self.assertEqual(data['balances'], {'member0': '10.00', 'member1': '0.00', 'member2': '-10.00'})
+        self.assertEqual(data['debts'], [{'from_user': 'member2', 'to_user': 'member0', 'amount': '10.00'}])
+        await stream.aclose()
+
+    async def test_expense_delete_is_pushed(self):
+        stream = await self.open_stream(self.members[0])
+        expense_id = self.expense.pk
+
+        def delete():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.expense.delete()
+        await sync_to_async(delete)()
+
+        kind, data = await self.next_event(stream)
+        self.assertEqual(kind, 'expense_deleted')
+        self.assertEqual(data['expense'], {'id': expense_id})
+        self.assertEqual(data['debts'], [])
+        await stream.aclose()
+
+    async def test_nothing_is_built_without_listeners(self):
+        def toggle_counting_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.toggle('member1')
+            return len(queries)
+        without_listener = await sync_to_async(toggle_counting_queries)()
+
+        stream = await self.open_stream(self.members[1])
+        with_listener = await sync_to_async(toggle_counting_queries)()
+        self.assertGreater(with_listener, without_listener)
+        await stream.aclose()
+
+    @override_settings(EVENT_BROKER='database', EVENT_POLL_INTERVAL=0.01)
+    async def test_database_broker_resumes_from_last_event_id(self):
+        await sync_to_async(self.toggle)('member1')
+        first = await GroupEvent.objects.aget()
+        await sync_to_async(self.toggle)('member2')
+
+        stream = await self.open_stream(self.members[0], last_event_id=first.pk)
+        kind, data = await self.next_event(stream)
+        self.assertEqual(kind, 'share')
+        self.assertEqual(data['balances']['member2'], '0.00')
+        await stream.aclose()
+
+    async def test_non_member_is_denied(self):
+        outsider = await User.objects.acreate(username='outsider')
+        request = self.factory.get('/expenses/group-events/')
+        request.user = outsider
+        response = await async_views.group_events(request, group_id=self.group.id)
+        self.assertEqual(response.status_code, 403)
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SettleUpTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        bulk_create_expenses(self.group, self.members, 300)
+        ledger.rebuild()
+        self.client.force_login(self.members[1])
+        self.url = reverse('settle_up', args=[self.group.id])
+
+    def settle(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_settles_debtor_to_creditor_in_constant_statements(self):
+        owed = ExpenseShare.objects.filter(user=self.members[1], expense__paid_by=self.members[0], is_paid=False)
+        self.assertEqual(owed.count(), 100)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.settle({'debtor': 'member1', 'creditor': 'member0'})
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "expenses_expenseshare"')]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['settled'], 100)
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(owed.exists())
+        self.assertEqual(response.json()['balances']['member1'], '1000.00')
+        self.assertEqual(ledger.find_mismatches(), [])
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_settles_share_ids_of_this_group_only(self):
+        other_group, _ = Group.objects.get_or_create(name='Other', created_by=self.members[0])
+        other_group.members.add(*self.members)
+        foreign = bulk_create_expenses(other_group, self.members, 1)[0]
+        foreign_share = foreign.shares.get(user=self.members[1])
+        shares = list(ExpenseShare.objects.filter(expense__group=self.group, is_paid=False)[:5])
+
+        response = self.settle({'share_ids': [share.pk for share in shares] + [foreign_share.pk]})
+
+        self.assertEqual(response.json()['settled'], 5)
+        foreign_share.refresh_from_db()
+        self.assertFalse(foreign_share.is_paid)
+        self.assertEqual(ledger.find_mismatches([self.group.pk]), [])
+
+    def test_rejects_bad_input_and_non_members(self):
+        self.assertEqual(self.settle({'debtor': 'member1', 'creditor': 'nobody'}).status_code, 400)
+        self.assertEqual(self.settle({'share_ids': 'all'}).status_code, 400)
+
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'testpass123')
+        self.client.force_login(outsider)
+        self.assertEqual(self.settle({'debtor': 'member1', 'creditor': 'member0'}).status_code, 403)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class QueryTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.expenses = bulk_create_expenses(self.group, self.members, 3)
+        self.client.force_login(self.members[0])
+
+    def test_server_timing_header_counts_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('expense_detail', args=[self.expenses[0].pk]))
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;dur=[\d.]+;desc="{len(queries)} queries, 0 repeated", total;dur=[\d.]+$'
+        )
+
+    def test_logs_repeated_statements(self):
+        def n_plus_one(request):
+            for expense in Expense.objects.all():
+                expense.shares.count()
+            return JsonResponse({})
+
+        request = RequestFactory().get('/')
+        with self.assertLogs('expenses.requests', 'INFO') as logs:
+            QueryTimingMiddleware(n_plus_one)(request)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['queries'], 4)
+        self.assertEqual(record['repeated_queries'], 2)
+        self.assertEqual(record['top_repeated'][0]['count'], 3)
+
+    @query_budget(expense_detail=2)
+    def test_over_budget_fails(self):
+        with self.assertLogs('expenses.requests', 'WARNING'), self.assertLogs('django.request', 'ERROR'):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('expense_detail', args=[self.expenses[0].pk]))
+
+    @query_budget()
+    def test_budgeted_views_stay_within_budget(self):
+        ledger.rebuild()
+        share = self.expenses[0].shares.get(user=self.members[1])
+        for name, args in [
+            ('dashboard', []),
+            ('manage_groups', []),
+            ('add_expense', []),
+            ('expense_detail', [self.expenses[0].pk]),
+            ('group_members', [self.group.pk]),
+        ]:
+            self.assertEqual(self.client.get(reverse(name, args=args)).status_code, 200, name)
+        self.assertEqual(self.client.post(reverse('toggle_payment_status', args=[share.pk])).status_code, 200)
+
+    @query_budget()
+    def test_adding_an_expense_stays_within_its_post_budget(self):
+        with self.assertNoLogs('expenses.requests', 'WARNING'):
+            response = self.client.post(reverse('add_expense') + f'?group={self.group.id}', {
+                'title': 'Groceries',
+                'amount': '30.00',
+                'paid_by': self.members[0].id,
+                'split_method': 'equal',
+                'shared_among': [member.id for member in self.members],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Expense.objects.filter(title='Groceries').exists())
+
+    @query_budget(add_expense={'POST': 1})
+    def test_budgets_can_differ_by_method(self):
+        self.assertEqual(self.client.get(reverse('add_expense') + f'?group={self.group.id}').status_code, 200)
+        with self.assertLogs('expenses.requests', 'WARNING'), self.assertLogs('django.request', 'ERROR'):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.post(reverse('add_expense') + f'?group={self.group.id}', {'title': ''})
+
+
+class EmailOrUsernameBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', 'Alice@Example.com', 'testpass123')
+
+    def test_logs_in_by_username_or_email_in_any_case(self):
+        for login in ('alice', 'alice@example.com', 'ALICE@EXAMPLE.COM'):
+            with self.assertNumQueries(1):
+                self.assertEqual(authenticate(username=login, password='testpass123'), self.user)
+        with self.assertNumQueries(1):
+            self.assertIsNone(authenticate(username='alice', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody', password='testpass123'))
+
+    def test_username_wins_over_another_users_email(self):
+        other = User.objects.create_user('alice@example.com', 'other@example.com', 'otherpass')
+        self.assertEqual(authenticate(username='alice@example.com', password='otherpass'), other)
+
+    def test_last_login_update_writes_nothing_else(self):
+        with self.assertNumQueries(1):
+            update_last_login(None, self.user)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_email_lookup_uses_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            authenticate(username='alice@example.com', password='testpass123')
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('auth_user_email_lower_idx', plan)
+        self.assertNotRegex(plan, r'\bSCAN auth_user\b')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MembershipTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.outsider = User.objects.create_user('outsider', 'outsider@example.com', 'testpass123')
+        self.factory = RequestFactory()
+
+    def request_as(self, user):
+        request = self.factory.get('/')
+        request.user = user
+        return request
+
+    def test_check_is_one_query_and_memoized_per_request(self):
+        request = self.request_as(self.members[1])
+        with self.assertNumQueries(1):
+            self.assertTrue(membership.is_member(request, self.group.pk))
+            self.assertTrue(membership.is_member(request, self.group.pk))
+        with self.assertNumQueries(1):
+            self.assertFalse(membership.is_member(self.request_as(self.outsider), self.group.pk))
+
+    def test_cached_by_group_version(self):
+        membership.is_member(self.request_as(self.outsider), self.group)
+        with self.assertNumQueries(0):
+            self.assertFalse(membership.is_member(self.request_as(self.outsider), self.group))
+
+        # Joining bumps the version, so the cached answer is no longer used
+        self.group.members.add(self.outsider)
+        self.group.refresh_from_db(fields=['version'])
+        self.assertTrue(membership.is_member(self.request_as(self.outsider), self.group))
+
+    def test_decorated_views_turn_non_members_away(self):
+        self.client.force_login(self.outsider)
+        response = self.client.get(reverse('group_debts', args=[self.group.pk]))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(reverse('group_members', args=[self.group.pk]))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        response = self.client.get(reverse('group_members', args=[self.group.pk + 1]))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.get(reverse('group_debts', args=[self.group.pk + 1])).status_code, 404)
+
+    def test_members_page_cost_does_not_grow_with_group_size(self):
+        self.client.force_login(self.members[0])
+        url = reverse('group_members', args=[self.group.pk])
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.group.members.add(*[
+            User.objects.create_user(f'extra{i}', f'extra{i}@example.com', 'testpass123') for i in range(20)
+        ])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['members']), 23)
+        self.assertEqual(len(small), len(large))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class GroupSelectionTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.other = Group.objects.create(name='Other', created_by=self.members[0])
+        self.other.members.add(self.members[0])
+        self.client.force_login(self.members[0])
+
+    def dashboard_writes(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), params)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+    def test_selection_is_saved_only_when_it_changes(self):
+        self.assertEqual(len(self.dashboard_writes()), 1)
+        self.assertEqual(self.dashboard_writes(), [])
+        self.assertEqual(self.dashboard_writes(group=self.group.pk), [])
+
+        self.assertEqual(len(self.dashboard_writes(group=self.other.pk)), 1)
+        self.assertEqual(self.dashboard_writes(), [])
+        self.assertEqual(self.client.session['selected_group_id'], self.other.pk)
+
+        # add_expense picks up the remembered group
+        response = self.client.get(reverse('add_expense'))
+        self.assertEqual(response.context['selected_group'], self.other)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions_never_write(self):
+        self.client.force_login(self.members[0])
+        self.assertEqual(self.dashboard_writes(group=self.other.pk), [])
+        self.assertEqual(self.client.session['selected_group_id'], self.other.pk)
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False, DASHBOARD_PAGE_SIZE=4)
+class ExpensePaginationTests(TestCase):
+    def setUp(self):
+        caches[dashboard.CACHE_ALIAS].clear()
+        self.group, self.members = create_group_with_members()
+        self.expenses = bulk_create_expenses(self.group, self.members, 10)
+        # Ties on created_at must be broken by id
+        Expense.objects.filter(pk__in=[e.pk for e in self.expenses[3:7]]).update(created_at=self.expenses[3].created_at)
+        self.client.force_login(self.members[0])
+        self.url = reverse('group_expenses', args=[self.group.pk])
+
+    def test_pages_cover_every_expense_once_newest_first(self):
+        response = self.client.get(reverse('dashboard'), {'group': self.group.pk})
+        ids = [expense.pk for expense in response.context['expenses']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            data = self.client.get(self.url, {'cursor': cursor}).json()
+            ids += [expense['id'] for expense in data['expenses']]
+            cursor = data['next_cursor']
+
+        expected = Expense.objects.filter(group=self.group).order_by('-created_at', '-pk').values_list('pk', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_page_cost_does_not_depend_on_position(self):
+        _, first_cursor = dashboard.expense_page(self.group, size=1)
+        _, late_cursor = dashboard.expense_page(self.group, size=8)
+        with CaptureQueriesContext(connection) as early:
+            dashboard.expense_page(self.group, first_cursor)
+        with CaptureQueriesContext(connection) as late:
+            dashboard.expense_page(self.group, late_cursor)
+        self.assertEqual(len(early), 1)
+        self.assertEqual(len(late), 1)
+
+    def test_fragment_and_errors(self):
+        cursor = self.client.get(reverse('dashboard'), {'group': self.group.pk}).context['next_cursor']
+        data = self.client.get(self.url, {'cursor': cursor, 'fragment': 1}).json()
+        self.assertEqual(data['html'].count('<tr id="expense-'), 4)
+
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.client.force_login(User.objects.create_user('outsider', 'outsider@example.com', 'testpass123'))
+        self.assertEqual(self.client.get(self.url, {'cursor': cursor}).status_code, 403)
+
+
+class SimplifyDebtsTests(SimpleTestCase):
+    def test_nets_balances_into_minimal_transfers(self):
+        transfers = simplify_debts({
+            'alice': Decimal('50.00'),
+            'bob': Decimal('-30.00'),
+            'carol': Decimal('-20.00'),
+        })
+        self.assertEqual(transfers, [
+            ('bob', 'alice', Decimal('30.00')),
+            ('carol', 'alice', Decimal('20.00')),
+        ])
+
+    def test_chain_of_debts_collapses(self):
+        # a owes b 10, b owes c 10 -> a pays c directly
+        transfers = simplify_debts({'a': Decimal('-10'), 'b': Decimal('0'), 'c': Decimal('10')})
+        self.assertEqual(transfers, [('a', 'c', Decimal('10.00'))])
+
+    def test_transfers_settle_every_balance(self):
+        balances = {f'm{i}': Decimal(i * 7 % 13 - 6) for i in range(13)}
+        remaining = dict(balances)
+        transfers = simplify_debts(balances)
+        for debtor, creditor, amount in transfers:
+            remaining[debtor] += amount
+            remaining[creditor] -= amount
+        self.assertTrue(all(balance == 0 for balance in remaining.values()))
+        self.assertLess(len(transfers), len(balances))
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False)
+class GroupDebtsViewTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+
+    def test_returns_simplified_transfers(self):
+        bulk_create_expenses(self.group, self.members, 1, amount=Decimal('90.00'))
+        ledger.rebuild([self.group.id])
+
+        self.client.force_login(self.members[1])
+        response = self.client.get(reverse('group_debts', args=[self.group.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['settlements'], [
+            {'from_user': 'member1', 'to_user': 'member0', 'amount': '30.00'},
+            {'from_user': 'member2', 'to_user': 'member0', 'amount': '30.00'},
+        ])
+
+    def test_non_member_is_denied(self):
+        outsider = User.objects.create_user('outsider', 'outsider@example.com', 'testpass123')
+        self.client.force_login(outsider)
+        response = self.client.get(reverse('group_debts', args=[self.group.id]))
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class GroupReportTests(TestCase):
+    def setUp(self):
+        self.report_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.report_root.cleanup)
+        override = override_settings(REPORT_ROOT=self.report_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.group, self.members = create_group_with_members()
+        self.client.force_login(self.members[0])
+
+    def test_report_data_uses_constant_queries(self):
+        bulk_create_expenses(self.group, self.members, 5)
+        with CaptureQueriesContext(connection) as small:
+            reports.load_report_data(self.group)
+
+        bulk_create_expenses(self.group, self.members, 200)
+        with CaptureQueriesContext(connection) as large:
+            members, user_stats, total = reports.load_report_data(self.group)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(total, Decimal('30.00') * 205)
+        self.assertEqual(user_stats[self.members[0].pk]['total_owed'], Decimal('10.00') * 205)
+
+    def test_cached_report_is_served(self):
+        bulk_create_expenses(self.group, self.members, 3)
+        self.group.refresh_from_db()
+        reports.write_report(self.group, reports.report_path(self.group))
+
+        response = self.client.get(reverse('download_group_report', args=[self.group.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_unchanged_report_revalidates_with_304(self):
+        self.group.refresh_from_db()
+        reports.write_report(self.group, reports.report_path(self.group))
+        url = reverse('download_group_report', args=[self.group.id])
+
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        response.close()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        bulk_create_expenses(self.group, self.members, 1)
+        reports.write_report(self.group, reports.report_path(self.group))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response.close()
+
+    def test_late_job_for_an_older_version_keeps_the_newer_report(self):
+        self.group.version = 5
+        newer = reports.write_report(self.group, reports.report_path(self.group))
+        self.group.version = 4
+        older = reports.write_report(self.group, reports.report_path(self.group))
+        self.assertTrue(newer.exists())
+
+        self.group.version = 6
+        reports.write_report(self.group, reports.report_path(self.group))
+        self.assertEqual([older.exists(), newer.exists()], [False, False])
+
+    def test_least_recently_used_reports_are_evicted(self):
+        groups = [self.group]
+        for i in range(2):
+            group = Group.objects.create(name=f'Flat {i}', created_by=self.members[0])
+            group.members.add(self.members[0])
+            group.refresh_from_db()
+            groups.append(group)
+        paths = [reports.write_report(group, reports.report_path(group)) for group in groups]
+        for age, path in zip((300, 200, 100), paths):
+            os.utime(path, (time.time() - age, path.stat().st_mtime))
+
+        # The oldest is used again, so the second one goes first
+        self.assertEqual(reports.request_report(groups[0]), paths[0])
+        limit = sum(path.stat().st_size for path in paths) - 1
+        with override_settings(REPORT_CACHE_MAX_BYTES=limit):
+            reports.evict()
+        self.assertEqual([path.exists() for path in paths], [True, False, True])
+
+    def test_expense_change_invalidates_cached_report(self):
+        path = reports.report_path(self.group)
+        reports.write_report(self.group, path)
+
+        self.client.post(reverse('add_expense') + f'?group={self.group.id}', {
+            'title': 'Groceries',
+            'amount': '30.00',
+            'paid_by': self.members[0].id,
+            'split_method': 'equal',
+            'shared_among': [member.id for member in self.members],
+        })
+        self.group.refresh_from_db()
+        self.assertNotEqual(reports.report_path(self.group), path)
+
+    def test_zip_of_all_groups_reuses_and_fills_the_cache(self):
+        other = Group.objects.create(name='Flat', created_by=self.members[1])
+        other.members.add(self.members[0], self.members[1])
+        Group.objects.create(name='Not mine', created_by=self.members[2])
+        bulk_create_expenses(self.group, self.members, 3)
+        self.group.refresh_from_db()
+        cached = reports.write_report(self.group, reports.report_path(self.group))
+
+        response = self.client.get(reverse('download_all_reports'))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+        names = archive.namelist()
+        self.assertEqual(sorted(name.split('_')[0] for name in names), sorted([str(self.group.pk), str(other.pk)]))
+        self.assertEqual(archive.read(names[0]), cached.read_bytes())
+        self.assertTrue(archive.read(names[1]).startswith(b'%PDF'))
+        other.refresh_from_db()
+        self.assertTrue(reports.report_path(other).exists())
+
+    def test_file_names_are_safe_for_any_group_name(self):
+        self.group.name = '../Our Flat/2026'
+        self.group.save()
+        for name in (reports.report_filename(self.group), exporter.export_filename(self.group, 'expenses', 'csv')):
+            self.assertNotIn('/', name)
+            self.assertNotIn(' ', name)
+
+        response = self.client.get(reverse('download_all_reports'))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        [entry] = archive.namelist()
+        self.assertTrue(entry.startswith(f'{self.group.pk}_'))
+        self.assertNotIn('/', entry)
+
+    def test_process_pool_renders_the_same_report(self):
+        bulk_create_expenses(self.group, self.members, 3)
+        self.group.refresh_from_db()
+        context = reports.report_context(self.group)
+        with override_settings(REPORT_PROCESSES=1):
+            pool = reports.get_process_pool()
+            self.addCleanup(setattr, reports, '_process_pool', None)
+            self.addCleanup(pool.shutdown)
+            [(group, data)] = reports.iter_reports([self.group])
+
+        self.assertEqual(group, self.group)
+        # Only the creation date embedded in the PDF differs
+        self.assertEqual(len(data), len(reports.render_pdf(context)))
+
+
+class BalanceLedgerTests(TestCase):
+    """The ledger must match balances recomputed from the shares after every kind of write"""
+
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.expense = Expense.objects.create(
+            title='Rent', amount=Decimal('90.00'), paid_by=self.members[0], group=self.group,
+        )
+        self.expense.shared_among.add(*self.members)
+
+    def balances(self):
+        self.assertEqual(ledger.find_mismatches(), [])
+        return dict(MemberBalance.objects.filter(group=self.group).values_list('user__username', 'balance'))
+
+    def test_creating_shares(self):
+        self.assertEqual(self.balances(), {
+            'member0': Decimal('60.00'), 'member1': Decimal('-30.00'), 'member2': Decimal('-30.00'),
+        })
+
+    def test_toggling_paid(self):
+        share = ExpenseShare.objects.get(expense=self.expense, user=self.members[1])
+        share.is_paid = True
+        share.save()
+        self.assertEqual(self.balances()['member1'], Decimal('0.00'))
+
+        share.is_paid = False
+        share.save()
+        self.assertEqual(self.balances()['member1'], Decimal('-30.00'))
+
+    def test_saving_stale_instances(self):
+        # Two requests toggling the same share, each with its own copy loaded before either saved
+        first = ExpenseShare.objects.get(expense=self.expense, user=self.members[1])
+        second = ExpenseShare.objects.get(expense=self.expense, user=self.members[1])
+        for share in (first, second):
+            share.is_paid = True
+            share.save()
+        self.assertEqual(self.balances()['member1'], Decimal('0.00'))
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_changing_amount(self):
+        self.expense.amount = Decimal('60.00')
+        self.expense.save()
+        self.assertEqual(self.balances(), {
+            'member0': Decimal('40.00'), 'member1': Decimal('-20.00'), 'member2': Decimal('-20.00'),
+        })
+
+    def test_deleting_a_share(self):
+        ExpenseShare.objects.get(expense=self.expense, user=self.members[2]).delete()
+        self.assertEqual(self.balances()['member2'], Decimal('0.00'))
+        self.assertEqual(self.balances()['member0'], Decimal('30.00'))
+
+    def test_changing_payer(self):
+        self.expense.paid_by = self.members[1]
+        self.expense.save()
+        self.assertEqual(self.balances(), {
+            'member0': Decimal('-30.00'), 'member1': Decimal('60.00'), 'member2': Decimal('-30.00'),
+        })
+
+    def test_deleting_the_expense(self):
+        other = Expense.objects.create(title='Food', amount=Decimal('30.00'), paid_by=self.members[1], group=self.group)
+        other.shared_among.add(*self.members)
+        self.expense.delete()
+        self.assertEqual(self.balances(), {
+            'member0': Decimal('-10.00'), 'member1': Decimal('20.00'), 'member2': Decimal('-10.00'),
+        })
+
+    def test_deleting_the_group(self):
+        other, _ = Group.objects.get_or_create(name='Other', created_by=self.members[0])
+        other.members.add(*self.members)
+        kept = Expense.objects.create(title='Food', amount=Decimal('30.00'), paid_by=self.members[1], group=other)
+        kept.shared_among.add(*self.members)
+
+        self.group.delete()
+        self.assertEqual(ledger.find_mismatches(), [])
+        self.assertFalse(MemberBalance.objects.filter(group_id=self.expense.group_id).exists())
+        self.assertEqual(MemberBalance.objects.get(group=other, user=self.members[1]).balance, Decimal('20.00'))
+
+    def test_rebuild_balances_verifies_and_repairs(self):
+        out = io.StringIO()
+        call_command('rebuild_balances', '--verify', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+        MemberBalance.objects.filter(user=self.members[0]).update(balance=Decimal('1.00'))
+        MemberBalance.objects.filter(user=self.members[1]).delete()
+        with self.assertRaisesMessage(CommandError, '2 ledger balance(s)'):
+            call_command('rebuild_balances', '--verify', stdout=io.StringIO())
+
+        out = io.StringIO()
+        call_command('rebuild_balances', '--group', str(self.group.pk), stdout=out)
+        self.assertIn('Successfully wrote 3 balance records', out.getvalue())
+        self.assertEqual(self.balances()['member1'], Decimal('-30.00'))
+
+
+class ExpenseShareStatementTests(TestCase):
+    """Share maintenance in signals must not grow with the number of people sharing"""
+
+    def create_expense(self, num_members):
+        group, members = create_group_with_members(num_members)
+        expense = Expense.objects.create(title='Rent', amount=Decimal('120.00'), paid_by=members[0], group=group)
+        return expense, members
+
+    def test_adding_people_costs_constant_statements(self):
+        for num_members in (3, 12):
+            with self.subTest(num_members=num_members):
+                Group.objects.all().delete()
+                User.objects.all().delete()
+                expense, members = self.create_expense(num_members)
+                # Includes the 7 statements refreshing the month's and week's rollups
+                with self.assertNumQueries(20):
+                    expense.shared_among.add(*members)
+
+                shares = ExpenseShare.objects.filter(expense=expense)
+                self.assertEqual(shares.count(), num_members)
+                self.assertEqual(shares.filter(is_paid=True).get().user, members[0])
+                self.assertEqual(ledger.find_mismatches(), [])
+
+    def test_editing_expense_costs_constant_statements(self):
+        for num_members in (3, 12):
+            with self.subTest(num_members=num_members):
+                Group.objects.all().delete()
+                User.objects.all().delete()
+                expense, members = self.create_expense(num_members)
+                expense.shared_among.add(*members)
+                expense = Expense.objects.get(pk=expense.pk)
+
+                expense.amount = Decimal('60.00')
+                expense.paid_by = members[1]
+                with self.assertNumQueries(25):
+                    expense.save()
+                with self.assertNumQueries(21):
+                    expense.shared_among.remove(members[2])
+
+                shares = ExpenseShare.objects.filter(expense=expense)
+                self.assertEqual(shares.count(), num_members - 1)
+                self.assertEqual(shares.filter(is_paid=True).get().user, members[1])
+                self.assertEqual(ledger.find_mismatches(), [])
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+
+    def add_expense(self, amount, paid_by=0):
+        expense = Expense.objects.create(title='Bill', amount=Decimal(amount), paid_by=self.members[paid_by], group=self.group)
+        expense.shared_among.add(*self.members)
+        return expense
+
+    def move_to(self, expense, day):
+        # Expense.date is set on creation; backdate it for another month
+        Expense.objects.filter(pk=expense.pk).update(date=day)
+        rollups.rebuild()
+
+    def test_rollups_follow_every_write(self):
+        rent = self.add_expense('90.00')
+        self.add_expense('30.00', paid_by=1)
+        self.assertEqual(rollups.find_mismatches(), [])
+
+        share = rent.shares.get(user=self.members[1])
+        share.is_paid = True
+        share.save()
+        rent.amount = Decimal('60.00')
+        rent.save()
+        rent.shared_among.remove(self.members[2])
+        self.assertEqual(rollups.find_mismatches(), [])
+
+        sync_expense_shares(rent, {self.members[0].pk: Decimal('10.00'), self.members[1].pk: Decimal('50.00')})
+        self.assertEqual(rollups.find_mismatches(), [])
+        rent.delete()
+        self.assertEqual(rollups.find_mismatches(), [])
+
+        totals, _ = rollups.member_totals(self.group)
+        self.assertEqual(totals[self.members[1].pk], {
+            'total_paid': Decimal('30.00'), 'total_share': Decimal('10.00'), 'unpaid_owed': Decimal('0.00'),
+        })
+        self.assertEqual(totals[self.members[0].pk]['unpaid_owed'], Decimal('10.00'))
+
+    def test_member_totals_of_a_period(self):
+        september = self.add_expense('30.00')
+        self.add_expense('60.00')
+        self.move_to(september, date(2026, 9, 15))
+
+        totals, months = rollups.member_totals(self.group, date(2026, 9, 1), date(2026, 9, 30))
+        self.assertEqual(list(months), [date(2026, 9, 1)])
+        self.assertEqual(totals[self.members[0].pk]['total_paid'], Decimal('30.00'))
+        self.assertEqual(totals[self.members[1].pk]['unpaid_owed'], Decimal('10.00'))
+
+        _, months = rollups.member_totals(self.group)
+        self.assertEqual(len(months), 2)
+
+    def test_parse_period(self):
+        self.assertIsNone(reports.parse_period({}))
+        self.assertEqual(reports.parse_period({'month': '2026-09'}), (date(2026, 9, 1), date(2026, 9, 1)))
+        self.assertEqual(reports.parse_period({'from': '2026-03'}), (date(2026, 3, 1), None))
+        for params in ({'month': '2026-13'}, {'month': 'September'}, {'from': '2026-09', 'to': '2026-03'}):
+            with self.subTest(params=params), self.assertRaises(ValueError):
+                reports.parse_period(params)
+
+    def test_month_report_covers_only_that_month(self):
+        september = self.add_expense('30.00')
+        self.add_expense('60.00')
+        self.move_to(september, date(2026, 9, 15))
+        self.group.refresh_from_db()
+
+        period = (date(2026, 9, 1), date(2026, 9, 1))
+        context = reports.report_context(self.group, period)
+        self.assertEqual(context['total'], Decimal('30.00'))
+        self.assertEqual(len(context['user_stats'][self.members[0].pk]['expenses_paid']), 1)
+        self.assertNotEqual(reports.report_path(self.group, period), reports.report_path(self.group))
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_invalid_report_period_is_rejected(self):
+        self.client.force_login(self.members[0])
+        response = self.client.get(reverse('download_group_report', args=[self.group.id]) + '?month=2026-13')
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        response = self.client.get(reverse('report_status', args=[self.group.id]) + '?from=x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_balances_repairs_rollups(self):
+        self.add_expense('30.00')
+        rollups.MonthlyRollup.objects.update(total_paid=0)
+        self.assertEqual(len(rollups.find_mismatches()), 1)
+        call_command('rebuild_balances', stdout=io.StringIO())
+        self.assertEqual(rollups.find_mismatches(), [])
+
+
+@skipUnless(connection.features.has_select_for_update, 'Row locks; SQLite lets one writer in at a time anyway')
+class ConcurrentRollupTests(TransactionTestCase):
+    def test_overlapping_writers_take_turns(self):
+        group, members = create_group_with_members(4)
+        shared = Expense.objects.create(title='Rent', amount=Decimal('80.00'), paid_by=members[0], group=group)
+        shared.shared_among.add(*members)
+        written, release = threading.Event(), threading.Event()
+        errors = []
+
+        def add_expense(paid_by, shared_among, hold=False):
+            # Different members, so only the rollups of the month (and week) overlap
+            try:
+                with transaction.atomic():
+                    expense = Expense.objects.create(title='Bill', amount=Decimal('30.00'), paid_by=paid_by, group=group)
+                    expense.shared_among.add(*shared_among)
+                    if hold:
+                        written.set()
+                        release.wait(10)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=add_expense, args=(members[0], members[:2], True))
+        first.start()
+        self.assertTrue(written.wait(10))
+        second = threading.Thread(target=add_expense, args=(members[2], members[2:]))
+        second.start()
+        second.join(0.5)
+        self.assertTrue(second.is_alive(), 'the second writer should wait for the first')
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(rollups.find_mismatches(), [])
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.client.force_login(self.members[0])
+        for amount, paid_by, day in (
+            ('30.00', 0, date(2026, 8, 31)),
+            ('60.00', 0, date(2026, 9, 1)),
+            ('90.00', 1, date(2026, 9, 2)),
+            ('15.00', 1, date(2026, 10, 5)),
+        ):
+            expense = Expense.objects.create(title='Bill', amount=Decimal(amount), paid_by=self.members[paid_by], group=self.group)
+            expense.shared_among.add(*self.members)
+            Expense.objects.filter(pk=expense.pk).update(date=day)
+        rollups.rebuild()
+        self.group.refresh_from_db()
+
+    def test_monthly_series_and_top_payers(self):
+        data = analytics.spending(self.group, 'month', 3, today=date(2026, 10, 18))
+        self.assertEqual(data['periods'], [date(2026, 8, 1), date(2026, 9, 1), date(2026, 10, 1)])
+        self.assertEqual(data['total_paid'], [Decimal('30.00'), Decimal('150.00'), Decimal('15.00')])
+        self.assertEqual(data['expense_count'], [1, 2, 1])
+        self.assertEqual(data['average_expense'][1], Decimal('75.00'))
+        self.assertEqual([payer['username'] for payer in data['top_payers']], ['member1', 'member0', 'member2'])
+        self.assertEqual(data['top_payers'][1]['average_expense'], Decimal('45.00'))
+        self.assertEqual(data['top_payers'][1]['total_share'], Decimal('65.00'))
+
+    def test_weekly_series_are_zero_filled(self):
+        # Aug 31 and Sep 1-2 are one week; Oct 5 starts another, three weeks on
+        data = analytics.spending(self.group, 'week', 6, today=date(2026, 10, 18))
+        self.assertEqual(data['periods'][0], date(2026, 9, 7))
+        self.assertEqual(data['total_paid'][-2], Decimal('15.00'))
+        self.assertEqual(sum(data['total_paid']), Decimal('15.00'))
+
+        data = analytics.spending(self.group, 'week', 7, today=date(2026, 10, 18))
+        self.assertEqual(data['total_paid'], [Decimal('180.00')] + [Decimal('0.00')] * 4 + [Decimal('15.00'), Decimal('0.00')])
+
+    def test_series_come_from_one_query(self):
+        bulk_create_expenses(self.group, self.members, 50)
+        with self.assertNumQueries(1):
+            data = analytics.spending(self.group, 'week', 52)
+        self.assertEqual(data['count'], 54)
+
+    def test_api_returns_chart_series_and_revalidates(self):
+        url = reverse('group_analytics_api', args=[self.group.id])
+        response = self.client.get(url, {'interval': 'month', 'periods': 24})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(len(body['periods']), 24)
+        self.assertEqual(body['count'], 4)
+        self.assertEqual(body['total'], '195.00')
+
+        response = self.client.get(url, {'interval': 'month', 'periods': 24}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, {'interval': 'day'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'periods': 0}).status_code, 400)
+
+    def test_page_shows_top_payers(self):
+        response = self.client.get(reverse('group_analytics', args=[self.group.id]), {'periods': 24})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Top Payers')
+        self.assertContains(response, '$150.00')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ImportExpensesTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.client.force_login(self.members[0])
+
+    def upload(self, name, content):
+        if isinstance(content, str):
+            content = content.encode()
+        return self.client.post(
+            reverse('import_group_expenses', args=[self.group.id]),
+            {'file': SimpleUploadedFile(name, content)},
+        )
+
+    def test_imported_shares_match_signal_path(self):
+        response = self.upload('expenses.csv', (
+            'title,amount,paid_by,shared_among\n'
+            'Internet,100.00,member0,member0;member1;member2\n'
+        ))
+        self.assertEqual(response.json()['created'], 1)
+        imported = Expense.objects.get(title='Internet')
+
+        manual = Expense.objects.create(title='Manual', amount=Decimal('100.00'), paid_by=self.members[0], group=self.group)
+        manual.shared_among.add(*self.members)
+
+        def shares(expense):
+            return list(expense.shares.values_list('user_id', 'amount', 'is_paid'))
+
+        self.assertEqual(shares(imported), shares(manual))
+        self.assertEqual(list(imported.shared_among.order_by('pk')), self.members)
+        self.assertEqual(ledger.find_mismatches(), [])
+
+    def test_jsonl_custom_split_and_row_errors(self):
+        response = self.upload('expenses.jsonl', '\n'.join([
+            '{"title": "Rent", "amount": "90", "paid_by": "member1", "split_method": "custom", '
+            '"shares": {"member0": "60", "member1": "30"}}',
+            '{"title": "Bad", "amount": "10", "paid_by": "nobody", "shared_among": ["member0"]}',
+            'not json',
+        ]))
+        data = response.json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([error['line'] for error in data['errors']], [2, 3])
+
+        rent = Expense.objects.get(title='Rent')
+        self.assertEqual(rent.split_method, 'custom')
+        self.assertEqual(
+            dict(rent.shares.values_list('user__username', 'amount')),
+            {'member0': Decimal('60.00'), 'member1': Decimal('30.00')},
+        )
+        self.assertEqual(ledger.find_mismatches(), [])
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    def test_unreadable_files_import_nothing(self):
+        rows = 'title,amount,paid_by,shared_among\n' + 'Internet,30.00,member0,member0;member1\n' * 3
+        for content, error in (
+            (rows.encode() + 'Café,1,member0,member0\n'.encode('latin-1'), 'UTF-8'),
+            (rows + f'"{"x" * 200000}",1,member0,member0\n', 'Malformed CSV'),
+        ):
+            with self.subTest(error=error):
+                response = self.upload('expenses.csv', content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(error, response.json()['error'])
+                self.assertEqual(response.json()['line'], 5)
+                self.assertFalse(Expense.objects.exists())
+
+    def test_rollups_aggregate_only_each_chunk(self):
+        # An earlier expense in the same month must not be re-aggregated by the import
+        earlier = Expense.objects.create(title='Earlier', amount=Decimal('10.00'), paid_by=self.members[1], group=self.group)
+        earlier.shared_among.add(*self.members)
+        rows = [
+            (line, {'title': 'Internet', 'amount': '30.00', 'paid_by': 'member0', 'shared_among': 'member0;member1'})
+            for line in range(2, 8)
+        ]
+        aggregated = []
+        compute = rollups.compute
+
+        def counting_compute(expenses, shares):
+            aggregated.append(expenses.count())
+            return compute(expenses, shares)
+
+        with mock.patch.object(rollups, 'compute', counting_compute):
+            result = importer.import_expenses(self.group, rows, chunk_size=2)
+
+        self.assertEqual(result['created'], 6)
+        self.assertEqual(aggregated, [2, 2, 2])
+        self.assertEqual(rollups.find_mismatches(), [])
+        self.assertEqual(ledger.find_mismatches(), [])
+
+    def test_file_breaking_off_reports_what_was_imported(self):
+        content = (
+            'title,amount,paid_by,shared_among\n' + 'Internet,30.00,member0,member0;member1\n' * 3
+        ).encode() + b'\xff\n'
+        lines = importer.decode_lines(io.BytesIO(content))
+        result = importer.import_expenses(self.group, importer.iter_rows(lines, 'csv'), chunk_size=2)
+
+        self.assertEqual(result['created'], 3)
+        self.assertEqual(result['failed'], (5, 'File must be UTF-8 encoded'))
+        self.assertEqual(Expense.objects.count(), 3)
+        self.assertEqual(ledger.find_mismatches(), [])
+
+
+@query_budget()
+@override_settings(SECURE_SSL_REDIRECT=False, EXPORT_CHUNK_SIZE=2, EXPORT_BUFFER_SIZE=64)
+class ExportExpensesTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        self.client.force_login(self.members[0])
+        self.url = reverse('export_group_expenses', args=[self.group.id])
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_imports_into_another_group(self):
+        for i in range(3):
+            expense = Expense.objects.create(title=f'Groceries {i}', amount=Decimal('30.00'), paid_by=self.members[i], group=self.group)
+            expense.shared_among.add(*self.members)
+        rent = Expense.objects.create(
+            title='Rent', amount=Decimal('90.00'), paid_by=self.members[1], group=self.group, split_method='custom',
+        )
+        sync_expense_shares(rent, {self.members[0].pk: Decimal('60.00'), self.members[1].pk: Decimal('30.00')})
+
+        content = self.export()
+        self.assertEqual(content.splitlines()[0], ','.join(exporter.EXPENSE_COLUMNS))
+
+        copy = Group.objects.create(name='Copy', created_by=self.members[0])
+        copy.members.add(*self.members)
+        result = importer.import_expenses(copy, importer.iter_rows(io.StringIO(content), 'csv'))
+        self.assertEqual((result['created'], result['errors']), (4, []))
+
+        def shares(group):
+            return sorted(ExpenseShare.objects.filter(expense__group=group).values_list(
+                'expense__title', 'expense__split_method', 'user__username', 'amount',
+            ))
+        self.assertEqual(shares(copy), shares(self.group))
+
+    def test_share_rows_as_jsonl_in_date_range(self):
+        old, new = bulk_create_expenses(self.group, self.members, 2)
+        # Filtered on the expense date, like period reports, not on when the row was created
+        Expense.objects.filter(pk=old.pk).update(date=timezone.localdate() - timedelta(days=40))
+
+        rows = [json.loads(line) for line in self.export(rows='shares', format='jsonl').splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(set(rows[0]), set(exporter.SHARE_COLUMNS))
+
+        start = (timezone.localdate() - timedelta(days=7)).isoformat()
+        rows = [json.loads(line) for line in self.export(rows='shares', format='jsonl', start=start).splitlines()]
+        self.assertEqual({row['expense_id'] for row in rows}, {new.pk})
+        self.assertEqual(self.export(end=start).count('\n'), 2)
+
+    def test_bad_parameters_and_non_members(self):
+        for params in ({'format': 'xml'}, {'rows': 'users'}, {'start': 'yesterday'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.client.force_login(User.objects.create_user('outsider', 'outsider@example.com', 'testpass123'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    async def test_async_iteration_yields_every_piece(self):
+        pieces = [piece async for piece in exporter.aiterate(iter([b'a', b'', b'b']))]
+        self.assertEqual(pieces, [b'a', b'', b'b'])
+
+
+class PopulateExpenseSharesTests(TestCase):
+    def setUp(self):
+        self.group, self.members = create_group_with_members()
+        for expense in bulk_create_expenses(self.group, self.members, 5):
+            expense.shared_among.add(*self.members)
+        ExpenseShare.objects.filter(expense__title__in=['Expense 1', 'Expense 3']).delete()
+        ledger.rebuild()
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('populate_expense_shares', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_only_counts(self):
+        output = self.run_command('--dry-run')
+        self.assertIn('6 expense share records would be created', output)
+        self.assertEqual(ExpenseShare.objects.count(), 9)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = os.path.join(tmp, 'populate.json')
+            output = self.run_command('--chunk-size', '2', '--checkpoint', checkpoint)
+            self.assertIn('Successfully created 6 expense share records', output)
+
+            output = self.run_command('--checkpoint', checkpoint)
+            self.assertIn('Resuming from checkpoint', output)
+            self.assertIn('Successfully created 0 expense share records', output)
+
+        self.assertEqual(ExpenseShare.objects.count(), 15)
+        self.assertEqual(ledger.find_mismatches(), [])
+        self.assertEqual(rollups.find_mismatches(), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_parallel_backfill_refused_on_sqlite(self):
+        with self.assertRaisesMessage(CommandError, 'needs PostgreSQL'):
+            self.run_command('--workers', '3')
+        self.assertEqual(ExpenseShare.objects.count(), 9)
+
+
+class GenerateFakeDataTests(TestCase):
+    def generate(self, *args):
+        out = io.StringIO()
+        call_command(
+            'generate_fake_data', '--groups', '2', '--members', '4', '--expenses', '30',
+            '--custom-ratio', '0.5', '--batch-size', '7', *args, stdout=out
+        )
+        return out.getvalue()
+
+    def snapshot(self, prefix):
+        return list(ExpenseShare.objects.filter(user__username__startswith=prefix).order_by('pk').values_list(
+            'expense__title', 'expense__amount', 'user__username', 'amount', 'is_paid'
+        ))
+
+    def test_creates_consistent_data(self):
+        output = self.generate()
+        self.assertIn('Created 2 groups, 8 users and 60 expenses', output)
+
+        self.assertEqual(Expense.objects.count(), 60)
+        self.assertTrue(Expense.objects.filter(split_method='custom').exists())
+        for expense in Expense.objects.filter(split_method='custom').prefetch_related('shares'):
+            self.assertEqual(sum(share.amount for share in expense.shares.all()), expense.amount)
+        self.assertEqual(User.objects.filter(profile__isnull=False).count(), 8)
+        self.assertEqual(ledger.find_mismatches(), [])
+
+    def test_same_seed_gives_same_data(self):
+        self.generate('--seed', '7', '--prefix', 'a')
+        self.generate('--seed', '7', '--prefix', 'b')
+        self.generate('--seed', '8', '--prefix', 'c')
+
+        first = [row[:2] + row[3:] for row in self.snapshot('a_')]
+        self.assertEqual(first, [row[:2] + row[3:] for row in self.snapshot('b_')])
+        self.assertNotEqual(first, [row[:2] + row[3:] for row in self.snapshot('c_')])
+
+
+class BenchmarkViewsTests(TestCase):
+    def test_reports_every_view(self):
+        group, members = create_group_with_members()
+        bulk_create_expenses(group, members, 5)
+        ledger.rebuild()
+        share = ExpenseShare.objects.filter(user=members[1]).first()
+
+        out = io.StringIO()
+        call_command('benchmark_views', '--requests', '3', '--memory-requests', '1', stdout=out)
+
+        for view in ('dashboard', 'dashboard_cached', 'api', 'expense_detail', 'toggle_payment', 'report'):
+            self.assertRegex(out.getvalue(), rf'\n  {view} +[\d.]+ +[\d.]+ +[\d.]+ +\d+ +\d+ +\d+\n')
+        # The toggles are rolled back
+        share.refresh_from_db()
+        self.assertFalse(share.is_paid)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def checkout(self, pool, healthy=True):
+        return pool.checkout(FakeConnection, lambda connection: healthy)
+
+    def test_returned_connections_are_reused(self):
+        pool = ConnectionPool(max_size=2)
+        first = self.checkout(pool)
+        pool.checkin(first)
+        self.assertIs(self.checkout(pool), first)
+        self.assertEqual(first.rollbacks, 1)
+        self.assertEqual(pool.stats['created'], 1)
+
+    def test_unhealthy_connection_is_replaced(self):
+        pool = ConnectionPool(max_size=1)
+        first = self.checkout(pool)
+        pool.checkin(first)
+        second = self.checkout(pool, healthy=False)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+
+    def test_idle_connections_expire(self):
+        pool = ConnectionPool(max_size=1, idle_timeout=0)
+        first = self.checkout(pool)
+        pool.checkin(first)
+        self.assertIsNot(self.checkout(pool), first)
+        self.assertTrue(first.closed)
+
+    def test_waits_for_free_connection_up_to_timeout(self):
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        self.checkout(pool)
+        with self.assertRaises(OperationalError):
+            self.checkout(pool)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot read paths and fail if any of them scans a large table"""
+    LARGE_TABLES = ('expenses_expense', 'expenses_expenseshare', 'expenses_memberbalance')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group, cls.members = create_group_with_members(4)
+        for i in range(5):
+            other = Group.objects.create(name=f'Other {i}', created_by=cls.members[0])
+            other.members.add(*cls.members)
+            bulk_create_expenses(other, cls.members, 500)
+        bulk_create_expenses(cls.group, cls.members, 500)
+        ledger.rebuild()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        caches[dashboard.CACHE_ALIAS].clear()
+
+    def full_scans(self, sql):
+        """Large tables the plan for ``sql`` reads sequentially"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                pattern = r'\bSCAN (\w+)'
+            else:
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                pattern = r'Seq Scan on (\w+)'
+        return [table for table in re.findall(pattern, plan) if table in self.LARGE_TABLES]
+
+    def assertNoFullScans(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        selects = [query['sql'] for query in queries if query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertEqual(self.full_scans(sql), [], sql)
+
+    def test_dashboard_queries_use_indexes(self):
+        self.client.force_login(self.members[0])
+
+        def load_dashboard():
+            response = self.client.get(reverse('dashboard'), {'group': self.group.id})
+            self.assertEqual(response.status_code, 200)
+
+        self.assertNoFullScans(load_dashboard)
+
+    def test_balance_queries_use_indexes(self):
+        self.assertNoFullScans(lambda: ledger.compute_balances([self.group.pk]))
+        self.assertNoFullScans(lambda: group_settlements(self.group))
+        self.assertNoFullScans(lambda: self.members[1].profile.get_balance(self.group))
+
+    def test_report_queries_use_indexes(self):
+        self.assertNoFullScans(lambda: reports.load_report_data(self.group))
+
+    def test_unpaid_shares_of_user_use_indexes(self):
+        self.assertNoFullScans(lambda: list(ExpenseShare.objects.filter(user=self.members[1], is_paid=False)))
@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from django.contrib.auth import logout
 from django.shortcuts import redirect
-from . import views
+from . import async_views, views
+
+# Under ASGI the async variants serve the dashboard, expense detail and payment toggles
+hot_views = async_views if settings.ASYNC_VIEWS else views
 
 def custom_logout(request):
     logout(request)
@@ -10,7 +14,7 @@ def custom_logout(request):
     return redirect('login')
 
 urlpatterns = [
-    path('', views.dashboard, name='dashboard'),
+    path('', hot_views.dashboard, name='dashboard'),
     path('register/', views.register, name='register'),
     path('login/', auth_views.LoginView.as_view(template_name='expenses/login.html'), name='login'),
     path('logout/', custom_logout, name='logout'),
@@ -37,11 +41,26 @@ urlpatterns = [
     path('leave-group/<int:group_id>/', views.leave_group, name='leave_group'),
     path('group-members/<int:group_id>/', views.view_group_members, name='group_members'),
     path('download-report/<int:group_id>/', views.download_group_report, name='download_group_report'),
+    path('download-report/<int:group_id>/status/', views.report_status, name='report_status'),
+    path('download-reports/', views.download_all_reports, name='download_all_reports'),
+    path('group-debts/<int:group_id>/', views.group_debts, name='group_debts'),
+    path('settle-up/<int:group_id>/', views.settle_up, name='settle_up'),
+    path('import-expenses/<int:group_id>/', views.import_group_expenses, name='import_group_expenses'),
+    path('export-expenses/<int:group_id>/', views.export_group_expenses, name='export_group_expenses'),
+    path('analytics/<int:group_id>/', views.group_analytics, name='group_analytics'),
+    
+    # Live updates (Server-Sent Events, needs ASGI)
+    path('group-events/<int:group_id>/', async_views.group_events, name='group_events'),
+    
+    # JSON API
+    path('api/groups/<int:group_id>/dashboard/', views.group_dashboard_api, name='group_dashboard_api'),
+    path('api/groups/<int:group_id>/expenses/', views.group_expenses, name='group_expenses'),
+    path('api/groups/<int:group_id>/analytics/', views.group_analytics_api, name='group_analytics_api'),
     
     # Expense management
     path('add-expense/', views.add_expense, name='add_expense'),
-    path('expense/<int:pk>/', views.expense_detail, name='expense_detail'),
+    path('expense/<int:pk>/', hot_views.expense_detail, name='expense_detail'),
     path('expense/<int:pk>/edit/', views.edit_expense, name='edit_expense'),
     path('expense/<int:pk>/delete/', views.delete_expense, name='delete_expense'),
-    path('toggle-payment/<int:share_id>/', views.toggle_payment_status, name='toggle_payment_status'),
+    path('toggle-payment/<int:share_id>/', hot_views.toggle_payment_status, name='toggle_payment_status'),
 ]
\ No newline at end of file
@@ -2,22 +2,36 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, F, Sum
+from django.db.models import Q, Sum, Count
 from django.db import models
 from .forms import UserRegistrationForm, GroupCreationForm, GroupJoinForm, ExpenseForm
 from .models import Group, UserProfile, Expense, ExpenseShare
+from .dashboard import (
+    get_dashboard_data, get_expense_page, members_with_balances, serialize_balances, serialize_dashboard,
+    serialize_expense,
+)
+from .membership import is_member, membership_required
+from .selection import forget_selected_group, remember_selected_group, selected_group_id
+from .settlement import group_settlements
+from .shares import settle_shares, sync_expense_shares
 from django.contrib.auth.models import User
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-from datetime import datetime
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import content_disposition_header, http_date, urlencode
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.text import compress_string
+from . import analytics, exporter, importer, reports
+from datetime import date, datetime
 from decimal import Decimal
+import json
+import os
+import re
+
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
 
 def register(request):
     if request.method == 'POST':
@@ -57,28 +71,29 @@ def register(request):
 def dashboard(request):
     user_profile, created = UserProfile.objects.get_or_create(user=request.user)
     
-    # Get all groups user is member of
-    user_groups = request.user.joined_groups.all()
+    # Get all groups user is member of, with member counts, in one query
+    user_groups = list(
+        request.user.joined_groups.annotate(member_count=Count('members')).order_by('id')
+    )
     
     # Debug: log the groups
     import logging
-    logging.info(f"User {request.user.username} has {user_groups.count()} groups: {[g.name for g in user_groups]}")
+    logging.info(f"User {request.user.username} has {len(user_groups)} groups: {[g.name for g in user_groups]}")
     
-    # Get selected group from session or query parameter
-    selected_group_id = request.GET.get('group') or request.session.get('selected_group_id')
+    # Get selected group from query parameter or session
+    group_id = selected_group_id(request)
     selected_group = None
     
-    if selected_group_id:
-        try:
-            selected_group = user_groups.get(id=selected_group_id)
-            request.session['selected_group_id'] = selected_group.id
-        except Group.DoesNotExist:
-            pass
+    if group_id:
+        selected_group = next((g for g in user_groups if str(g.id) == str(group_id)), None)
     
     # If no group selected, use first group or show empty state
-    if not selected_group and user_groups.exists():
-        selected_group = user_groups.first()
-        request.session['selected_group_id'] = selected_group.id
+    if not selected_group and user_groups:
+        selected_group = user_groups[0]
+    
+    if selected_group:
+        # Only saves the session when the selection changed
+        remember_selected_group(request, selected_group.id)
     
     # Initialize context
     context = {
@@ -86,50 +101,14 @@ def dashboard(request):
         'all_groups': user_groups,
         'selected_group': selected_group,
         'expenses': [],
+        'next_cursor': None,
         'member_balances': {},
         'debts': [],
     }
     
     if selected_group:
-        # Get all expenses for the selected group
-        group_expenses = Expense.objects.filter(group=selected_group).prefetch_related('shares')
-        
-        # Add payment statistics to each expense
-        expenses_with_stats = []
-        for expense in group_expenses:
-            total_shares = expense.shares.count()
-            paid_shares = expense.shares.filter(is_paid=True).count()
-            expense.paid_count = paid_shares
-            expense.total_count = total_shares
-            expenses_with_stats.append(expense)
-        
-        # Get balances for all group members
-        group_members = selected_group.members.all()
-        member_balances = {}
-        for member in group_members:
-            member_profile, _ = UserProfile.objects.get_or_create(user=member)
-            member_balances[member.username] = member_profile.get_balance(selected_group)
-        
-        # Calculate who owes whom (only unpaid shares)
-        debts = []
-        unpaid_shares = ExpenseShare.objects.filter(
-            expense__group=selected_group,
-            is_paid=False
-        ).exclude(user=F('expense__paid_by')).select_related('user', 'expense')
-        
-        for share in unpaid_shares:
-            debts.append({
-                'from_user': share.user.username,
-                'to_user': share.expense.paid_by.username,
-                'amount': share.amount,
-                'expense': share.expense.title
-            })
-        
-        context.update({
-            'expenses': expenses_with_stats,
-            'member_balances': member_balances,
-            'debts': debts,
-        })
+        # Expenses, balances and debts only change with the group's version
+        context.update(get_dashboard_data(selected_group))
     
     return render(request, 'expenses/dashboard.html', context)
 
@@ -170,7 +149,7 @@ def join_group(request):
             group = Group.objects.get(code=group_code)
             
             # Check if already a member
-            if request.user in group.members.all():
+            if is_member(request, group):
                 messages.info(request, f"You're already a member of '{group.name}'.")
             else:
                 # Add user to the group
@@ -185,17 +164,17 @@ def join_group(request):
 
 @login_required
 def add_expense(request):
-    user_profile = UserProfile.objects.get(user=request.user)
+    user_profile, created = UserProfile.objects.get_or_create(user=request.user)
     
     # Get selected group
-    selected_group_id = request.GET.get('group') or request.session.get('selected_group_id')
+    group_id = selected_group_id(request)
     
-    if not selected_group_id:
+    if not group_id:
         messages.error(request, "Please select a group first.")
         return redirect('dashboard')
     
     try:
-        selected_group = request.user.joined_groups.get(id=selected_group_id)
+        selected_group = request.user.joined_groups.get(id=group_id)
     except Group.DoesNotExist:
         messages.error(request, "Invalid group selected.")
         return redirect('dashboard')
@@ -237,24 +216,21 @@ def add_expense(request):
                     context = {'form': form, 'selected_group': selected_group}
                     return render(request, 'expenses/add_expense.html', context)
 
-            # Save expense
-            expense = form.save(commit=False)
-            expense.group = selected_group
-            expense.save()
-            # Save the many-to-many relations
-            form.save_m2m()
-
-            # For custom split, create ExpenseShare entries with provided amounts
-            if form.cleaned_data.get('split_method') == 'custom':
-                for user in form.cleaned_data.get('shared_among'):
-                    amt = amounts.get(user.id, Decimal('0.00'))
-                    ExpenseShare.objects.update_or_create(
-                        expense=expense,
-                        user=user,
-                        defaults={'amount': amt, 'is_paid': (user == expense.paid_by)}
-                    )
-                # Remove any shares for users no longer selected
-                ExpenseShare.objects.filter(expense=expense).exclude(user__in=form.cleaned_data.get('shared_among')).delete()
+            # Save expense, its shares and the balance ledger together
+            with transaction.atomic():
+                expense = form.save(commit=False)
+                expense.group = selected_group
+                expense.save()
+                # Save the many-to-many relations
+                form.save_m2m()
+
+                # For custom split, create ExpenseShare entries with provided amounts
+                # (shares for users no longer selected are removed)
+                if form.cleaned_data.get('split_method') == 'custom':
+                    sync_expense_shares(expense, amounts={
+                        user.id: amounts.get(user.id, Decimal('0.00'))
+                        for user in form.cleaned_data.get('shared_among')
+                    })
 
             messages.success(request, f"Expense '{expense.title}' added!")
             return redirect(f'/?group={selected_group.id}')
@@ -269,15 +245,15 @@ def add_expense(request):
 
 @login_required
 def expense_detail(request, pk):
-    expense = get_object_or_404(Expense, pk=pk)
+    expense = get_object_or_404(Expense.objects.select_related('paid_by', 'group'), pk=pk)
     
     # Ensure the user is a member of the expense's group
-    if request.user not in expense.group.members.all():
+    if not is_member(request, expense.group):
         messages.error(request, "You don't have permission to view this expense.")
         return redirect('dashboard')
     
     # Get ExpenseShare records for detailed payment status
-    expense_shares = expense.shares.all()
+    expense_shares = expense.shares.select_related('user')
     
     context = {
         'expense': expense,
@@ -328,19 +304,16 @@ def edit_expense(request, pk):
                     form.add_error(None, "Sum of custom amounts must equal total expense amount.")
                     return render(request, 'expenses/edit_expense.html', {'form': form, 'expense': expense})
 
-            form.save()
+            with transaction.atomic():
+                form.save()
 
-            # For custom splits, update ExpenseShare records accordingly
-            if form.cleaned_data.get('split_method') == 'custom':
-                for user in form.cleaned_data.get('shared_among'):
-                    amt = amounts.get(user.id, Decimal('0.00'))
-                    ExpenseShare.objects.update_or_create(
-                        expense=expense,
-                        user=user,
-                        defaults={'amount': amt, 'is_paid': (user == expense.paid_by)}
-                    )
-                # Remove shares for users who are no longer part of shared_among
-                ExpenseShare.objects.filter(expense=expense).exclude(user__in=form.cleaned_data.get('shared_among')).delete()
+                # For custom splits, update ExpenseShare records accordingly
+                # (shares for users no longer part of shared_among are removed)
+                if form.cleaned_data.get('split_method') == 'custom':
+                    sync_expense_shares(expense, amounts={
+                        user.id: amounts.get(user.id, Decimal('0.00'))
+                        for user in form.cleaned_data.get('shared_among')
+                    })
 
             messages.success(request, f"Expense '{expense.title}' updated!")
             return redirect('expense_detail', pk=expense.pk)
@@ -361,59 +334,39 @@ def delete_expense(request, pk):
     if request.method == 'POST':
         expense_title = expense.title
         group_id = expense.group.id
-        expense.delete()
+        with transaction.atomic():
+            expense.delete()
         messages.success(request, f"Expense '{expense_title}' deleted!")
         return redirect(f'/?group={group_id}')
     
     return render(request, 'expenses/delete_expense.html', {'expense': expense})
 
 @login_required
-def leave_group(request, group_id):
-    try:
-        group = Group.objects.get(id=group_id)
+@membership_required("You're not a member of this group.")
+def leave_group(request, group):
+    if request.method == 'POST':
+        group_name = group.name
+        group.members.remove(request.user)
         
-        if request.user not in group.members.all():
-            messages.error(request, "You're not a member of this group.")
-            return redirect('dashboard')
+        # Clear session if leaving currently selected group
+        forget_selected_group(request, group.id)
         
-        if request.method == 'POST':
-            group_name = group.name
-            group.members.remove(request.user)
-            
-            # Clear session if leaving currently selected group
-            if request.session.get('selected_group_id') == group_id:
-                request.session.pop('selected_group_id', None)
-            
-            messages.success(request, f"You've left the group '{group_name}'.")
-            return redirect('dashboard')
-        
-        return render(request, 'expenses/leave_group.html', {'group': group})
-    
-    except Group.DoesNotExist:
-        messages.error(request, "Group not found.")
+        messages.success(request, f"You've left the group '{group_name}'.")
         return redirect('dashboard')
+    
+    return render(request, 'expenses/leave_group.html', {'group': group})
 
 @login_required
-def view_group_members(request, group_id):
-    try:
-        group = Group.objects.get(id=group_id)
-        
-        if request.user not in group.members.all():
-            messages.error(request, "You're not a member of this group.")
-            return redirect('dashboard')
-        
-        group_members = group.members.all()
-        
-        context = {
-            'group': group,
-            'members': group_members,
-            'is_creator': group.created_by == request.user
-        }
-        return render(request, 'expenses/group_members.html', context)
+@membership_required("You're not a member of this group.")
+def view_group_members(request, group):
+    group_members = group.members.all()
     
-    except Group.DoesNotExist:
-        messages.error(request, "Group not found.")
-        return redirect('dashboard')
+    context = {
+        'group': group,
+        'members': group_members,
+        'is_creator': group.created_by_id == request.user.pk
+    }
+    return render(request, 'expenses/group_members.html', context)
 
 @login_required
 def manage_groups(request):
@@ -436,10 +389,10 @@ def toggle_payment_status(request, share_id):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
     try:
-        share = get_object_or_404(ExpenseShare, pk=share_id)
+        share = get_object_or_404(ExpenseShare.objects.select_related('expense__group', 'user'), pk=share_id)
         
         # Ensure the user is a member of the expense's group
-        if request.user not in share.expense.group.members.all():
+        if not is_member(request, share.expense.group):
             return JsonResponse({'error': 'Permission denied'}, status=403)
         
         # Toggle the payment status
@@ -456,225 +409,325 @@ def toggle_payment_status(request, share_id):
         return JsonResponse({'error': str(e)}, status=500)
 
 @login_required
-def download_group_report(request, group_id):
-    """Generate and download a PDF report for a group showing individual expenses and totals"""
+@membership_required()
+def settle_up(request, group):
+    """
+    Mark many shares paid in one transaction. JSON body is either
+    {"debtor": username, "creditor": username} to settle everything the
+    debtor owes on the creditor's expenses, or {"share_ids": [...]}.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
     try:
-        group = get_object_or_404(Group, id=group_id)
-        
-        # Ensure the user is a member of the group
-        if request.user not in group.members.all():
-            messages.error(request, "You don't have permission to download this report.")
-            return redirect('dashboard')
-        
-        # Create the HttpResponse object with the appropriate PDF headers
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{group.name}_expense_report_{datetime.now().strftime("%Y%m%d")}.pdf"'
-        
-        # Create the PDF document
-        doc = SimpleDocTemplate(response, pagesize=A4,
-                              rightMargin=72, leftMargin=72,
-                              topMargin=72, bottomMargin=18)
-        
-        # Container for the 'Flowable' objects
-        story = []
-        
-        # Get styles
-        styles = getSampleStyleSheet()
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=TA_CENTER,
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            spaceAfter=12,
-            textColor=colors.darkblue,
-        )
-        
-        # Title
-        title = Paragraph(f"Expense Report - {group.name}", title_style)
-        story.append(title)
-        
-        # Report info
-        report_info = f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}<br/>"
-        report_info += f"Group Code: {group.code}<br/>"
-        report_info += f"Total Members: {group.members.count()}"
-        
-        info_para = Paragraph(report_info, styles['Normal'])
-        story.append(info_para)
-        story.append(Spacer(1, 20))
-        
-        # Get all expenses for the group
-        expenses = Expense.objects.filter(group=group).order_by('-created_at')
-        group_members = group.members.all()
-        
-        # Calculate user statistics
-        user_stats = {}
-        for member in group_members:
-            user_stats[member] = {
-                'total_paid': Decimal('0.00'),
-                'total_owed': Decimal('0.00'),
-                'expenses_paid': [],
-                'expenses_shared': []
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    
+    if 'share_ids' in data:
+        share_ids = data['share_ids']
+        if not isinstance(share_ids, list) or not all(isinstance(pk, int) for pk in share_ids):
+            return JsonResponse({'error': 'share_ids must be a list of integers'}, status=400)
+        settled = settle_shares(group.id, share_ids=share_ids)
+    else:
+        usernames = [data.get('debtor'), data.get('creditor')]
+        members = dict(group.members.filter(username__in=[u for u in usernames if isinstance(u, str)]).values_list('username', 'pk'))
+        if not all(username in members for username in usernames):
+            return JsonResponse({'error': 'debtor and creditor must be members of the group'}, status=400)
+        settled = settle_shares(group.id, debtor_id=members[usernames[0]], creditor_id=members[usernames[1]])
+    
+    member_balances = {member.username: member.balance for member in members_with_balances(group)}
+    return JsonResponse({
+        'success': True,
+        'settled': settled,
+        **serialize_balances(member_balances, group_settlements(group)),
+    })
+
+@login_required
+@membership_required()
+def group_debts(request, group):
+    """Return the simplified who-owes-whom transfers for a group as JSON"""
+    return JsonResponse({
+        'group': group.id,
+        'settlements': [
+            {
+                'from_user': debt['from_user'],
+                'to_user': debt['to_user'],
+                'amount': f"{debt['amount']:.2f}"
             }
-        
-        total_group_expenses = Decimal('0.00')
-        
-        # Process each expense
-        for expense in expenses:
-            total_group_expenses += expense.amount
-            
-            # Add to the person who paid
-            if expense.paid_by in user_stats:
-                user_stats[expense.paid_by]['total_paid'] += expense.amount
-                user_stats[expense.paid_by]['expenses_paid'].append({
-                    'title': expense.title,
-                    'amount': expense.amount,
-                    'date': expense.date
-                })
-            
-            # Calculate shares for each member
-            split_amount = expense.get_split_amount()
-            for member in expense.shared_among.all():
-                if member in user_stats:
-                    user_stats[member]['total_owed'] += split_amount
-                    user_stats[member]['expenses_shared'].append({
-                        'title': expense.title,
-                        'amount': split_amount,
-                        'date': expense.date,
-                        'paid_by': expense.paid_by.username
-                    })
-        
-        # Summary Section
-        summary_heading = Paragraph("Summary", heading_style)
-        story.append(summary_heading)
-        
-        summary_data = [['Member', 'Total Paid', 'Total Share', 'Net Balance']]
-        for member in group_members:
-            stats = user_stats[member]
-            net_balance = stats['total_paid'] - stats['total_owed']
-            balance_str = f"${net_balance:.2f}"
-            if net_balance > 0:
-                balance_str = f"+{balance_str}"
-            
-            summary_data.append([
-                member.username,
-                f"${stats['total_paid']:.2f}",
-                f"${stats['total_owed']:.2f}",
-                balance_str
-            ])
-        
-        # Add total row
-        summary_data.append(['TOTAL', f"${total_group_expenses:.2f}", f"${total_group_expenses:.2f}", "$0.00"])
-        
-        summary_table = Table(summary_data)
-        summary_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
-            ('BACKGROUND', (0, -1), (-1, -1), colors.lightgrey),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        story.append(summary_table)
-        story.append(Spacer(1, 30))
-        
-        # Detailed breakdown for each member
-        for member in group_members:
-            stats = user_stats[member]
-            
-            # Member heading
-            member_heading = Paragraph(f"Detailed Report - {member.username}", heading_style)
-            story.append(member_heading)
-            
-            # Expenses paid by this member
-            if stats['expenses_paid']:
-                paid_heading = Paragraph("Expenses Paid:", styles['Heading3'])
-                story.append(paid_heading)
-                
-                paid_data = [['Date', 'Description', 'Amount']]
-                for expense in stats['expenses_paid']:
-                    paid_data.append([
-                        expense['date'].strftime('%m/%d/%Y'),
-                        expense['title'],
-                        f"${expense['amount']:.2f}"
-                    ])
-                
-                paid_table = Table(paid_data, colWidths=[1*inch, 3*inch, 1*inch])
-                paid_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),  # Right align amounts
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ]))
-                
-                story.append(paid_table)
-                story.append(Spacer(1, 12))
-            
-            # Expenses this member owes for
-            if stats['expenses_shared']:
-                shared_heading = Paragraph("Share of Expenses:", styles['Heading3'])
-                story.append(shared_heading)
-                
-                shared_data = [['Date', 'Description', 'Paid By', 'Your Share']]
-                for expense in stats['expenses_shared']:
-                    shared_data.append([
-                        expense['date'].strftime('%m/%d/%Y'),
-                        expense['title'],
-                        expense['paid_by'],
-                        f"${expense['amount']:.2f}"
-                    ])
-                
-                shared_table = Table(shared_data, colWidths=[0.8*inch, 2.5*inch, 1*inch, 0.8*inch])
-                shared_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgreen),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),  # Right align amounts
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, -1), 9),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ]))
-                
-                story.append(shared_table)
-            
-            # Member totals
-            totals_text = f"""
-            <b>Total Paid:</b> ${stats['total_paid']:.2f}<br/>
-            <b>Total Share:</b> ${stats['total_owed']:.2f}<br/>
-            <b>Net Balance:</b> ${stats['total_paid'] - stats['total_owed']:.2f}
-            """
-            
-            totals_para = Paragraph(totals_text, styles['Normal'])
-            story.append(totals_para)
-            
-            # Add page break except for last member
-            if member != group_members.last():
-                story.append(PageBreak())
-        
-        # Build PDF
-        doc.build(story)
-        
-        return response
-        
-    except Group.DoesNotExist:
-        messages.error(request, "Group not found.")
+            for debt in group_settlements(group)
+        ]
+    })
+
+@login_required
+@membership_required()
+def group_dashboard_api(request, group):
+    """
+    Read-only JSON of a group's expenses, balances and debts. The ETag is the
+    group's content version, so a client polling with If-None-Match gets a
+    304 after a single group lookup (membership_required loads the group
+    and membership in one query; the expense tables aren't touched yet).
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    # gzip and identity bodies differ byte for byte, so each gets its own strong ETag
+    use_gzip = bool(ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    etag = f'"group-{group.id}-v{group.version}{"-gzip" if use_gzip else ""}"'
+    
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        body = json.dumps(serialize_dashboard(group, get_dashboard_data(group))).encode()
+        response = HttpResponse(content_type='application/json')
+        if use_gzip:
+            body = compress_string(body)
+            response.headers['Content-Encoding'] = 'gzip'
+        response.content = body
+    
+    response.headers['ETag'] = etag
+    # Clients may keep the response but must revalidate before using it
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
+
+@login_required
+@membership_required()
+def group_analytics(request, group):
+    """
+    Spending trends of the group per ``?interval=week|month`` over the last
+    ``?periods=N``: totals, top payers and average expense size
+    """
+    try:
+        interval, count = analytics.parse_params(request.GET)
+    except ValueError:
+        messages.error(request, "Invalid analytics range.")
         return redirect('dashboard')
-    except Exception as e:
-        messages.error(request, f"Error generating report: {str(e)}")
+    
+    data = analytics.spending(group, interval, count)
+    peak = max(data['total_paid']) or 1
+    rows = [
+        {
+            'period': period,
+            'total_paid': total_paid,
+            'expense_count': expense_count,
+            'average_expense': average_expense,
+            'percent': round(total_paid * 100 / peak),
+        }
+        for period, total_paid, expense_count, average_expense in zip(
+            data['periods'], data['total_paid'], data['expense_count'], data['average_expense']
+        )
+    ]
+    return render(request, 'expenses/analytics.html', {
+        'group': group,
+        'data': data,
+        'rows': rows[::-1],
+        'interval': interval,
+        'periods': count,
+    })
+
+@login_required
+@membership_required()
+def group_analytics_api(request, group):
+    """
+    The analytics page's series as chart-ready JSON. The ETag is the group's
+    content version with the range, so an unchanged group revalidates with
+    a 304 without the rollups being read.
+    """
+    try:
+        interval, count = analytics.parse_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # A new week or month starts a new range even if nothing was written
+    current = analytics.period_starts(interval, 1)[0]
+    etag = f'"analytics-{group.id}-v{group.version}-{interval}-{count}-{current:%Y%m%d}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'group': group.id, **analytics.spending(group, interval, count)})
+    
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+@login_required
+@membership_required()
+def group_expenses(request, group):
+    """
+    The page of a group's expenses after ``?cursor=`` (from next_cursor), as
+    JSON rows, or with ``?fragment=1`` as dashboard table rows for "Load more"
+    """
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        return JsonResponse({'error': 'cursor is required'}, status=400)
+    try:
+        expenses, next_cursor = get_expense_page(group, cursor)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    if request.GET.get('fragment'):
+        html = render_to_string('expenses/_expense_rows.html', {'expenses': expenses}, request=request)
+        return JsonResponse({'html': html, 'next_cursor': next_cursor})
+    return JsonResponse({
+        'expenses': [serialize_expense(expense) for expense in expenses],
+        'next_cursor': next_cursor,
+    })
+
+@login_required
+@membership_required()
+def import_group_expenses(request, group):
+    """Bulk import expenses from an uploaded CSV or JSON-lines file"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'No file uploaded'}, status=400)
+    
+    fmt = request.POST.get('format') or importer.detect_format(upload.name)
+    if fmt not in ('csv', 'jsonl'):
+        return JsonResponse({'error': f"Unknown import format '{fmt}'"}, status=400)
+    
+    try:
+        # Chunks commit as they go, so find an unreadable file before the first one
+        importer.check_file(importer.decode_lines(upload.file), fmt)
+    except importer.ImportFileError as e:
+        return JsonResponse({'error': str(e), 'line': e.line_number, 'created': 0}, status=400)
+    upload.file.seek(0)
+    result = importer.import_expenses(group, importer.iter_rows(importer.decode_lines(upload.file), fmt))
+    
+    data = {
+        'created': result['created'],
+        'error_count': len(result['errors']),
+        # Keep the response small for large files with many bad rows
+        'errors': [
+            {'line': line_number, 'error': message}
+            for line_number, message in result['errors'][:100]
+        ]
+    }
+    if 'failed' in result:
+        data['line'], data['error'] = result['failed']
+        return JsonResponse(data, status=400)
+    return JsonResponse(data)
+
+@login_required
+@membership_required()
+def export_group_expenses(request, group):
+    """
+    Stream the group's expenses (or with ``?rows=shares`` every member's
+    share) as ``?format=csv`` or ``jsonl``, optionally only those dated
+    between ``?start=`` and ``?end=`` (YYYY-MM-DD, inclusive)
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exporter.FORMATS:
+        return JsonResponse({'error': f"Unknown export format '{fmt}'"}, status=400)
+    kind = request.GET.get('rows', 'expenses')
+    if kind not in ('expenses', 'shares'):
+        return JsonResponse({'error': f"Unknown export rows '{kind}'"}, status=400)
+    try:
+        start, end = (
+            date.fromisoformat(request.GET[name]) if request.GET.get(name) else None
+            for name in ('start', 'end')
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be YYYY-MM-DD'}, status=400)
+    
+    content = exporter.export(group, kind, fmt, start, end)
+    if isinstance(request, ASGIRequest):
+        content = exporter.aiterate(content)
+    response = StreamingHttpResponse(content, content_type=f'{exporter.FORMATS[fmt]}; charset=utf-8')
+    response.headers['Content-Disposition'] = content_disposition_header(
+        True, exporter.export_filename(group, kind, fmt, start, end)
+    )
+    return response
+
+def _period_query(request):
+    """The request's report period parameters as a query string to pass on"""
+    params = {name: request.GET[name] for name in ('month', 'from', 'to') if request.GET.get(name)}
+    return f'?{urlencode(params)}' if params else ''
+
+@login_required
+@membership_required("You don't have permission to download this report.")
+def download_group_report(request, group):
+    """
+    Download the group's PDF report, rendering it in the background if it
+    isn't cached yet. ``?month=YYYY-MM`` or ``?from=``/``?to=`` limit it to a
+    period. The ETag is the group's content version, so a browser
+    revalidating an unchanged report gets a 304 without the file being read.
+    """
+    try:
+        period = reports.parse_period(request.GET)
+    except ValueError:
+        messages.error(request, "Invalid report period.")
         return redirect('dashboard')
+    
+    etag = reports.report_etag(group, period)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        path = reports.request_report(group, period)
+        try:
+            report = open(path, 'rb') if path is not None else None
+        except FileNotFoundError:
+            # Replaced by a newer version or evicted between the check and the open
+            report = None
+        if report is None:
+            return render(request, 'expenses/report_pending.html', {
+                'group': group,
+                'period_query': _period_query(request),
+            })
+        
+        last_modified = os.fstat(report.fileno()).st_mtime
+        response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+        if response is None:
+            # FileResponse hands the open file to the server, which can sendfile() it
+            response = FileResponse(
+                report,
+                as_attachment=True,
+                filename=reports.report_filename(group, period),
+                content_type='application/pdf'
+            )
+        else:
+            report.close()
+        response.headers['Last-Modified'] = http_date(last_modified)
+    
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+@login_required
+def download_all_reports(request):
+    """ZIP of the PDF reports of every group the user is in, streamed as each report is ready"""
+    groups = list(request.user.joined_groups.order_by('name', 'pk'))
+    if not groups:
+        messages.error(request, "You are not in any groups yet.")
+        return redirect('manage_groups')
+    
+    content = reports.zip_reports(groups)
+    if isinstance(request, ASGIRequest):
+        content = exporter.aiterate(content)
+    response = StreamingHttpResponse(content, content_type='application/zip')
+    response.headers['Content-Disposition'] = content_disposition_header(
+        True, f'expense_reports_{datetime.now().strftime("%Y%m%d")}.zip'
+    )
+    return response
+
+@login_required
+@membership_required()
+def report_status(request, group):
+    """Polling endpoint telling the pending page whether the report is ready"""
+    try:
+        period = reports.parse_period(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid report period'}, status=400)
+    
+    error = reports.pop_error(group, period)
+    if error:
+        return JsonResponse({'ready': False, 'error': f"Error generating report: {error}"})
+    
+    return JsonResponse({
+        'ready': reports.request_report(group, period) is not None,
+        'url': reverse('download_group_report', args=[group.id]) + _period_query(request)
+    })
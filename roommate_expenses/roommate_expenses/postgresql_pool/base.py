@@ -0,0 +1,159 @@
+"""
+PostgreSQL backend that keeps a per-process pool of open connections.
+
+Django (4.2) opens a new connection per thread and closes it when CONN_MAX_AGE
+expires. With threaded or async workers that means many short-lived
+connections; this backend hands closed connections back to a shared pool
+instead, so the TCP/TLS handshake is paid once per pooled connection.
+
+Configured through the POOL key of the database settings:
+    MAX_SIZE       connections kept open and handed out at most
+    IDLE_TIMEOUT   seconds an idle pooled connection is kept
+    TIMEOUT        seconds to wait for a free connection before failing
+    HEALTH_CHECKS  run SELECT 1 before reusing a pooled connection
+"""
+import threading
+import time
+from collections import deque
+
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.db.utils import OperationalError
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    def __init__(self, max_size=10, idle_timeout=300, timeout=30, health_checks=True):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.health_checks = health_checks
+        self._idle = deque()  # (connection, returned_at), most recently used on the right
+        self._size = 0  # connections handed out plus idle ones
+        self._cond = threading.Condition()
+        self.stats = {'created': 0, 'reused': 0, 'discarded': 0}
+
+    def checkout(self, connect, is_healthy):
+        """Return an idle healthy connection, or open a new one with ``connect()``"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                self._expire_idle()
+                if self._idle:
+                    connection, _ = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise OperationalError(
+                        f'Timed out after {self.timeout}s waiting for a pooled database connection'
+                    )
+                self._cond.wait(remaining)
+
+        if connection is not None:
+            if self.health_checks and not is_healthy(connection):
+                self._discard(connection, reserved=True)
+            else:
+                self.stats['reused'] += 1
+                return connection
+
+        try:
+            connection = connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self.stats['created'] += 1
+        return connection
+
+    def checkin(self, connection):
+        """Give a connection back; broken ones are closed instead of reused"""
+        if getattr(connection, 'closed', True):
+            self._discard(connection)
+            return
+        try:
+            # Never hand out a connection with an open transaction
+            connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def _expire_idle(self):
+        # Called with the lock held; least recently used connections are on the left
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            connection, _ = self._idle.popleft()
+            self._size -= 1
+            self.stats['discarded'] += 1
+            self._close_quietly(connection)
+        self._cond.notify_all()
+
+    def _discard(self, connection, reserved=False):
+        """Close a checked-out connection; with reserved=True keep its slot for a replacement"""
+        self._close_quietly(connection)
+        self.stats['discarded'] += 1
+        if not reserved:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(alias, settings_dict):
+    options = settings_dict.get('POOL', {})
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                timeout=options.get('TIMEOUT', 30),
+                health_checks=options.get('HEALTH_CHECKS', True),
+            )
+        return _pools[alias]
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        return self.pool.checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            self._connection_is_healthy,
+        )
+
+    def _connection_is_healthy(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
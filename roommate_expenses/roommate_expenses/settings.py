@@ -59,6 +59,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files in production
+    'expenses.middleware.QueryTimingMiddleware',  # Server-Timing header and query budgets
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,20 +86,72 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'roommate_expenses.wsgi.application'
+ASGI_APPLICATION = 'roommate_expenses.asgi.application'
+
+# Route the dashboard, expense detail and payment toggle to their async views
+# (expenses/async_views.py); only worth enabling when served through ASGI
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connection reuse:
+#   none        open and close a connection per request (default; keeps NeonDB free tier idle)
+#   persistent  keep one connection per worker thread for DB_CONN_MAX_AGE seconds
+#   pool        share a pool of open connections between a process's threads (PostgreSQL only)
+DB_CONNECTION_MODE = config('DB_CONNECTION_MODE', default='none')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+DB_CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
 # Use NeonDB PostgreSQL if DATABASE_URL is provided, otherwise fallback to SQLite
 DATABASES = {
     'default': dj_database_url.config(
         default=config('DATABASE_URL', default=f'sqlite:///{BASE_DIR / "db.sqlite3"}'),
-        conn_max_age=0,  # Don't keep connections open (important for NeonDB free tier)
-        conn_health_checks=True,
+        conn_max_age=DB_CONN_MAX_AGE if DB_CONNECTION_MODE == 'persistent' else 0,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
     )
 }
 
+if DB_CONNECTION_MODE == 'pool' and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Connections go back to the pool at the end of each request instead of being closed
+    DATABASES['default']['ENGINE'] = 'roommate_expenses.postgresql_pool'
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'IDLE_TIMEOUT': config('DB_POOL_IDLE_TIMEOUT', default=300, cast=int),
+        'TIMEOUT': config('DB_POOL_TIMEOUT', default=30, cast=int),
+        'HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+    }
+
+
+# Caches
+# Dashboard data is cached per group content version; the local-memory backend
+# evicts least recently used entries beyond DASHBOARD_CACHE_MAX_ENTRIES
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+        'TIMEOUT': config('DASHBOARD_CACHE_TIMEOUT', default=3600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('DASHBOARD_CACHE_MAX_ENTRIES', default=200, cast=int),
+        },
+    },
+}
+
+# Sessions are stored in the database by default. signed_cookies keeps them in
+# the browser and never touches the database; cached_db reads through the
+# cache, so only use it with a cache shared by all web processes
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+
+# Expenses shown on the dashboard before "Load more"
+DASHBOARD_PAGE_SIZE = config('DASHBOARD_PAGE_SIZE', default=50, cast=int)
+
+# Seconds a group membership check is cached in the default cache; it is keyed
+# by the group's version, which joining or leaving bumps. 0 disables it
+MEMBERSHIP_CACHE_TIMEOUT = config('MEMBERSHIP_CACHE_TIMEOUT', default=60, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -154,10 +207,10 @@ LOGIN_REDIRECT_URL = 'dashboard'
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'login'  # Redirect to login page after logout
 
-# Allow login with email or username
+# Allow login with email or username. It already covers plain username logins,
+# so ModelBackend isn't listed: a failed login would look the user up and hash twice
 AUTHENTICATION_BACKENDS = [
     'expenses.backends.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
 
 # Email settings
@@ -168,4 +221,70 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
-EMAIL_TIMEOUT = 10  # 10 second timeout for email sending
\ No newline at end of file
+EMAIL_TIMEOUT = 10  # 10 second timeout for email sending
+
+# Group PDF reports are rendered in the background and cached on local disk
+REPORT_ROOT = config('REPORT_ROOT', default=str(BASE_DIR / 'reports'))
+REPORT_WORKERS = config('REPORT_WORKERS', default=1, cast=int)
+# Processes laying out PDFs in parallel (0 renders in the background threads themselves)
+REPORT_PROCESSES = config('REPORT_PROCESSES', default=0, cast=int)
+# Least recently used reports are deleted when the cache grows past this
+REPORT_CACHE_MAX_BYTES = config('REPORT_CACHE_MAX_MB', default=500, cast=int) * 1024 * 1024
+
+# CSV / JSON-lines exports stream rows read in chunks of EXPORT_CHUNK_SIZE
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+EXPORT_BUFFER_SIZE = config('EXPORT_BUFFER_SIZE', default=64 * 1024, cast=int)  # bytes sent per piece
+
+# Weeks or months shown on the analytics page by default
+ANALYTICS_PERIODS = config('ANALYTICS_PERIODS', default=12, cast=int)
+
+# Live dashboard updates over Server-Sent Events (served through ASGI only)
+#   local     in-process broker; streams and writes must share one process
+#   database  events stored in GroupEvent and polled; works across processes
+EVENT_BROKER = config('EVENT_BROKER', default='local')
+EVENT_POLL_INTERVAL = config('EVENT_POLL_INTERVAL', default=1.0, cast=float)
+EVENT_RETENTION = config('EVENT_RETENTION', default=3600, cast=int)  # seconds GroupEvent rows are kept
+EVENT_STREAM_MAX_AGE = config('EVENT_STREAM_MAX_AGE', default=300, cast=int)
+EVENT_KEEPALIVE = 15
+EVENT_RETRY_MS = 3000
+
+# Per-request query counts and timings (Server-Timing header, 'expenses.requests' log)
+REQUEST_TIMING = config('REQUEST_TIMING', default=True, cast=bool)
+# Most queries a request to each URL name may run, or {method: budget}; over
+# budget is logged as a warning, or raises when QUERY_BUDGET_STRICT is set (as
+# the tests do)
+QUERY_BUDGETS = {
+    'dashboard': 10,
+    'group_dashboard_api': 6,
+    'group_expenses': 4,
+    'expense_detail': 7,
+    'toggle_payment_status': 15,
+    'group_debts': 5,
+    'settle_up': 16,
+    'manage_groups': 10,
+    'group_members': 7,
+    # Saving an expense keeps its shares, the balance ledger and the rollups in step
+    'add_expense': {'GET': 7, 'POST': 32},
+    # Rows are read while the response streams, after the middleware has counted
+    'export_group_expenses': 4,
+    'group_analytics': 4,
+    'group_analytics_api': 4,
+    'report_status': 4,
+}
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # INFO logs one JSON line per request; WARNING only requests over budget
+        'expenses.requests': {
+            'handlers': ['console'],
+            'level': config('REQUEST_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}